@@ -0,0 +1,215 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Optional
+
+
+class Priority(IntEnum):
+    """Admission priority classes, lower value is served first"""
+    CRITICAL = 0  # POS writes and ticket reads
+    NORMAL = 1    # back-office writes
+    LOW = 2       # lists, reports and exports
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of queued"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# (methods, path pattern, priority) - first match wins, unmatched paths bypass admission
+ROUTE_PRIORITIES = [
+    ({"GET"}, r"^/items/search$", Priority.CRITICAL),
+    ({"GET"}, r"^/customers/lookup$", Priority.CRITICAL),
+    ({"GET"}, r"^/transactions/summary$", Priority.NORMAL),
+    ({"POST"}, r"^/transactions$", Priority.CRITICAL),
+    ({"GET", "PUT"}, r"^/transactions/[^/]+$", Priority.CRITICAL),
+    ({"GET", "POST", "PUT", "DELETE"}, r"^/transactions/[^/]+/lines(/[^/]+)?$", Priority.CRITICAL),
+    ({"GET"}, r"^/transactions/[^/]+/payments$", Priority.CRITICAL),
+    ({"POST"}, r"^/payments$", Priority.CRITICAL),
+    ({"DELETE"}, r"^/payments/[^/]+$", Priority.CRITICAL),
+    ({"GET"}, r"^/sync$", Priority.NORMAL),
+    ({"GET"}, r"^/jobs/[^/]+$", Priority.NORMAL),
+    ({"GET"}, r"^/availability$", Priority.NORMAL),
+    ({"POST"}, r"^/queue/next$", Priority.CRITICAL),
+    # /queue/events is left out: a stream would hold its slot for as long as it is open
+    ({"GET"}, r"^/queue$", Priority.NORMAL),
+    ({"GET"}, r"^/payroll$", Priority.LOW),
+    ({"GET"}, r"^/analytics/sales$", Priority.LOW),
+    ({"GET"}, r"^/(transactions|items|employees|categories|companies|users|customers)$", Priority.LOW),
+    ({"GET", "POST", "PUT", "DELETE"}, r"^/(transactions|items|employees|categories|companies|users|customers)(/.*)?$", Priority.NORMAL),
+]
+_COMPILED_ROUTES = [(methods, re.compile(pattern), priority) for methods, pattern, priority in ROUTE_PRIORITIES]
+
+
+def classify(method: str, path: str) -> Optional[Priority]:
+    """Map a request to its priority class, or None if it does no Firestore work"""
+    for methods, pattern, priority in _COMPILED_ROUTES:
+        if method in methods and pattern.match(path):
+            return priority
+    return None
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, priority-ordered wait queue.
+
+    At most ``max_concurrency`` requests run at once; LOW priority work may only
+    occupy ``low_priority_share`` of those slots so ring-ups always find headroom.
+    When the queue is full a higher priority arrival evicts the newest waiter of
+    the lowest priority class, otherwise the arrival itself is rejected.
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 64,
+                 queue_timeout: float = 5.0, retry_after: int = 1,
+                 low_priority_share: float = 0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.limits = {
+            Priority.CRITICAL: max_concurrency,
+            Priority.NORMAL: max_concurrency,
+            Priority.LOW: max(1, math.floor(max_concurrency * low_priority_share)),
+        }
+        self.running = {priority: 0 for priority in Priority}
+        self.waiters = {priority: deque() for priority in Priority}
+        self.rejected = {priority: 0 for priority in Priority}
+
+    @property
+    def total_running(self) -> int:
+        return sum(self.running.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self.waiters.values())
+
+    def _can_run(self, priority: Priority) -> bool:
+        low_running = self.running[Priority.LOW]
+        if priority == Priority.LOW:
+            return self.total_running < self.max_concurrency and low_running < self.limits[Priority.LOW]
+        return self.total_running < self.max_concurrency
+
+    def _reject(self, priority: Priority, reason: str) -> AdmissionRejected:
+        self.rejected[priority] += 1
+        return AdmissionRejected(reason, self.retry_after)
+
+    async def acquire(self, priority: Priority, timeout: Optional[float] = None) -> None:
+        """Wait for a slot, raising AdmissionRejected if the request is shed.
+
+        ``timeout`` (e.g. the rest of the request budget) can shorten the queue wait.
+        """
+        ahead = any(self.waiters[p] for p in Priority if p <= priority)
+        if not ahead and self._can_run(priority):
+            self.running[priority] += 1
+            return
+
+        if self.queued >= self.max_queue:
+            victim_priority = max((p for p in Priority if self.waiters[p]), default=None)
+            if victim_priority is None or victim_priority <= priority:
+                raise self._reject(priority, "Server is busy, please retry")
+            victim = self.waiters[victim_priority].pop()
+            if not victim.done():
+                victim.set_exception(self._reject(victim_priority, "Request shed for higher priority work"))
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[priority].append(future)
+        try:
+            wait_timeout = self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout))
+            await asyncio.wait_for(asyncio.shield(future), timeout=wait_timeout)
+        except asyncio.TimeoutError:
+            if future in self.waiters[priority]:
+                self.waiters[priority].remove(future)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Granted a slot just as we timed out; hand it back
+                self.release(priority)
+            raise self._reject(priority, "Timed out waiting for capacity")
+        except asyncio.CancelledError:
+            if future in self.waiters[priority]:
+                self.waiters[priority].remove(future)
+            elif future.done() and not future.cancelled() and future.exception() is None:
+                self.release(priority)
+            raise
+
+    def release(self, priority: Priority) -> None:
+        """Free a slot and hand it to the highest priority waiter that may run"""
+        self.running[priority] -= 1
+        for candidate in Priority:
+            waiters = self.waiters[candidate]
+            while waiters and self._can_run(candidate):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self.running[candidate] += 1
+                future.set_result(None)
+                return
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": {p.name.lower(): n for p, n in self.running.items()},
+            "queued": {p.name.lower(): len(w) for p, w in self.waiters.items()},
+            "rejected": {p.name.lower(): n for p, n in self.rejected.items()},
+        }
+
+
+class TenantQuotas:
+    """Per-company token buckets so one busy shop can't use up everyone's capacity.
+
+    Each company may make ``rate`` requests per second with bursts up to
+    ``burst``. Buckets of the ``max_tenants`` most recently seen companies are
+    kept. Must only be used from the event loop thread.
+    """
+
+    def __init__(self, rate: float = 20.0, burst: float = 40.0, max_tenants: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_tenants = max_tenants
+        self._buckets = OrderedDict()  # company ID -> (tokens, last refill)
+        self.rejected = 0
+
+    def acquire(self, company_id: str) -> Optional[int]:
+        """Take a token for the company; returns None if allowed, else seconds to wait"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(company_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[company_id] = (tokens, now)
+        while len(self._buckets) > self.max_tenants:
+            self._buckets.popitem(last=False)
+        if allowed:
+            return None
+        self.rejected += 1
+        return max(1, math.ceil((1 - tokens) / self.rate))
+
+
+def _from_env() -> Optional[AdmissionController]:
+    if os.getenv("ADMISSION_ENABLED", "True").lower() != "true":
+        return None
+    return AdmissionController(
+        max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", 32)),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 64)),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 5)),
+        retry_after=int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1)),
+        low_priority_share=float(os.getenv("ADMISSION_LOW_PRIORITY_SHARE", 0.5)),
+    )
+
+
+def _quotas_from_env() -> Optional[TenantQuotas]:
+    rate = float(os.getenv("TENANT_RATE_LIMIT_PER_SECOND", 20))
+    if rate <= 0:
+        return None
+    return TenantQuotas(rate=rate, burst=float(os.getenv("TENANT_RATE_LIMIT_BURST", rate * 2)))
+
+
+# Create singleton instances (None when disabled)
+admission_controller = _from_env()
+tenant_quotas = _quotas_from_env()
@@ -0,0 +1,367 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+TRANSACTION_FIELDS = ["companyId", "transactionDate", "employeeId", "status", "paymentMethod",
+                      "subtotal", "tax", "discount", "tip", "total", "updatedAt"]
+LINE_FIELDS = ["transactionId", "itemId", "technicianId", "itemType", "quantity", "lineTotal", "updatedAt"]
+
+# Group-bys answered from transaction rows and from line rows
+TRANSACTION_GROUPS = {"hour", "weekday", "date", "employee", "paymentMethod", "status"}
+LINE_GROUPS = {"category", "item", "technician", "itemType"}
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _epoch(value) -> float:
+    if not isinstance(value, datetime):
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _text(value) -> str:
+    return getattr(value, "value", value) or ""
+
+
+class StringDictionary:
+    """Dictionary encoding for a string column: each distinct value gets an int code"""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def encode(self, value) -> int:
+        value = _text(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value) -> int:
+        """Code of a known value, -1 if it never occurred"""
+        return self._codes.get(_text(value), -1)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ColumnTable:
+    """Typed NumPy columns addressed by row number, grown by doubling"""
+
+    def __init__(self, schema: dict):
+        self.size = 0
+        self._columns = {name: np.zeros(16, dtype=dtype) for name, dtype in schema.items()}
+
+    def reserve(self, rows: int) -> None:
+        if rows <= self.size:
+            return
+        capacity = len(next(iter(self._columns.values())))
+        if rows > capacity:
+            while capacity < rows:
+                capacity *= 2
+            for name, column in self._columns.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self._columns[name] = grown
+        self.size = rows
+
+    def set_row(self, row: int, values: dict) -> None:
+        self.reserve(row + 1)
+        for name, value in values.items():
+            self._columns[name][row] = value
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name][:self.size]
+
+
+def _transaction_table() -> ColumnTable:
+    return ColumnTable({
+        "alive": bool, "company": np.int32, "ts": np.float64, "employee": np.int32,
+        "status": np.int32, "payment": np.int32, "subtotal": np.float64, "tax": np.float64,
+        "discount": np.float64, "tip": np.float64, "total": np.float64,
+    })
+
+
+def _line_table() -> ColumnTable:
+    return ColumnTable({
+        "alive": bool, "transaction": np.int32, "item": np.int32, "technician": np.int32,
+        "item_type": np.int32, "quantity": np.float64, "line_total": np.float64,
+    })
+
+
+class SalesAnalytics:
+    """Columnar in-memory snapshot of transactions and transaction lines.
+
+    Reports are group-by/filter/sum passes over NumPy arrays and never wait on
+    Firestore once the snapshot is loaded. The snapshot is refreshed in the
+    background from ``updatedAt`` every ``refresh_interval`` seconds (re-reading
+    an ``overlap`` window to tolerate clock skew between workers) and fully
+    rebuilt every ``full_refresh_interval`` seconds to drop documents deleted by
+    other workers. Transaction rows are addressed by their ID's dictionary code,
+    so line rows join to their transaction with a single gather.
+    """
+
+    def __init__(self, firebase_service, refresh_interval: float = 30, full_refresh_interval: float = 3600,
+                 overlap: float = 300):
+        self.firebase_service = firebase_service
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.overlap = overlap
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._reset()
+        self._refreshed_at = None
+        self._rebuilt_at = None
+        firebase_service.add_write_listener("transactions", self._on_transaction_write)
+        firebase_service.add_write_listener("transaction_lines", self._on_line_write)
+
+    def _reset(self) -> None:
+        self.transactions = _transaction_table()
+        self.lines = _line_table()
+        self.transaction_ids = StringDictionary()  # code == transaction row
+        self.line_rows = {}
+        self.companies = StringDictionary()
+        self.people = StringDictionary()            # employeeId and technicianId
+        self.statuses = StringDictionary()
+        self.payments = StringDictionary()
+        self.items = StringDictionary()
+        self.item_types = StringDictionary()
+        self.item_info = {}                          # item_id -> (name, categoryId)
+        self.category_names = {}
+        self.employee_names = {}
+        self._watermark = 0.0
+
+    # Loading
+
+    def _upsert_transaction(self, document: dict) -> None:
+        row = self.transaction_ids.encode(document["id"])
+        self.transactions.set_row(row, {
+            "alive": True,
+            "company": self.companies.encode(document.get("companyId")),
+            "ts": _epoch(document.get("transactionDate")),
+            "employee": self.people.encode(document.get("employeeId")),
+            "status": self.statuses.encode(document.get("status")),
+            "payment": self.payments.encode(document.get("paymentMethod")),
+            **{field: document.get(field) or 0.0 for field in ("subtotal", "tax", "discount", "tip", "total")},
+        })
+
+    def _upsert_line(self, document: dict) -> None:
+        row = self.line_rows.setdefault(document["id"], len(self.line_rows))
+        transaction_row = self.transaction_ids.encode(document.get("transactionId"))
+        # Keep the referenced transaction's row allocated even before it loads
+        self.transactions.reserve(transaction_row + 1)
+        self.lines.set_row(row, {
+            "alive": True,
+            "transaction": transaction_row,
+            "item": self.items.encode(document.get("itemId")),
+            "technician": self.people.encode(document.get("technicianId")),
+            "item_type": self.item_types.encode(document.get("itemType")),
+            "quantity": document.get("quantity") or 0,
+            "line_total": document.get("lineTotal") or 0.0,
+        })
+
+    def refresh(self, full: bool = False) -> None:
+        """Pull documents changed since the last refresh (everything if full)"""
+        with self._refresh_lock:
+            full = full or self._rebuilt_at is None
+            since = None if full else datetime.fromtimestamp(self._watermark - self.overlap, timezone.utc)
+            started = time.monotonic()
+            transactions = self.firebase_service.get_documents_updated_since("transactions", since, TRANSACTION_FIELDS)
+            lines = self.firebase_service.get_documents_updated_since("transaction_lines", since, LINE_FIELDS)
+            items = self.firebase_service.get_all_documents("items", all_companies=True)
+            categories = self.firebase_service.get_all_documents("item_categories", all_companies=True)
+            employees = self.firebase_service.get_all_documents("employees", all_companies=True)
+
+            with self._lock:
+                if full:
+                    self._reset()
+                watermark = self._watermark
+                for document in transactions:
+                    self._upsert_transaction(document)
+                    watermark = max(watermark, _epoch(document.get("updatedAt")))
+                for document in lines:
+                    self._upsert_line(document)
+                    watermark = max(watermark, _epoch(document.get("updatedAt")))
+                self._watermark = watermark
+                self.item_info = {i["id"]: (i.get("name"), i.get("categoryId")) for i in items}
+                self.category_names = {c["id"]: c.get("name") for c in categories}
+                self.employee_names = {
+                    e["id"]: " ".join(filter(None, [e.get("firstName"), e.get("lastName")])) for e in employees
+                }
+                self._refreshed_at = started
+                if full:
+                    self._rebuilt_at = started
+
+    def _on_transaction_write(self, event, document_id, data):
+        if event == "delete":
+            with self._lock:
+                row = self.transaction_ids.code(document_id)
+                if 0 <= row < self.transactions.size:
+                    self.transactions["alive"][row] = False
+
+    def _on_line_write(self, event, document_id, data):
+        if event == "delete":
+            with self._lock:
+                row = self.line_rows.get(document_id)
+                if row is not None:
+                    self.lines["alive"][row] = False
+
+    def ensure_fresh(self) -> None:
+        """Load on first use; afterwards refresh in the background so reports never wait"""
+        if self._rebuilt_at is None:
+            with self._build_lock:
+                if self._rebuilt_at is None:
+                    self.refresh(full=True)
+            return
+        now = time.monotonic()
+        if now - self._refreshed_at < self.refresh_interval or self._refresh_lock.locked():
+            return
+        full = now - self._rebuilt_at >= self.full_refresh_interval
+        threading.Thread(target=self._background_refresh, args=(full,), daemon=True).start()
+
+    def _background_refresh(self, full: bool) -> None:
+        try:
+            self.refresh(full=full)
+        except Exception as e:
+            print(f"Sales analytics refresh failed: {e}")
+
+    # Reporting
+
+    def _group_keys(self, group_by: str, rows: np.ndarray, utc_offset: float):
+        """Integer group keys for the selected rows and a function labelling a key"""
+        t = self.transactions
+        if group_by in ("hour", "weekday", "date"):
+            local_days, seconds = np.divmod(t["ts"][rows] + utc_offset, 86400)
+            if group_by == "hour":
+                return (seconds // 3600).astype(np.int64), lambda k: f"{k:02d}:00"
+            if group_by == "weekday":
+                # 1970-01-01 was a Thursday
+                return ((local_days + 3) % 7).astype(np.int64), lambda k: WEEKDAYS[k]
+            return local_days.astype(np.int64), lambda k: datetime.fromtimestamp(k * 86400, timezone.utc).date().isoformat()
+        if group_by == "employee":
+            return t["employee"][rows], lambda k: self.people.values[k]
+        if group_by == "paymentMethod":
+            return t["payment"][rows], lambda k: self.payments.values[k]
+        return t["status"][rows], lambda k: self.statuses.values[k]
+
+    def _line_group_keys(self, group_by: str, rows: np.ndarray):
+        lines = self.lines
+        if group_by == "category":
+            categories = StringDictionary()
+            item_category = np.array(
+                [categories.encode((self.item_info.get(item) or (None, None))[1]) for item in self.items.values],
+                dtype=np.int64,
+            )
+            return item_category[lines["item"][rows]], lambda k: categories.values[k]
+        if group_by == "item":
+            return lines["item"][rows], lambda k: self.items.values[k]
+        if group_by == "technician":
+            return lines["technician"][rows], lambda k: self.people.values[k]
+        return lines["item_type"][rows], lambda k: self.item_types.values[k]
+
+    def _label(self, group_by: str, key: str) -> Optional[str]:
+        if group_by in ("employee", "technician"):
+            return self.employee_names.get(key)
+        if group_by == "item":
+            return (self.item_info.get(key) or (None, None))[0]
+        if group_by == "category":
+            return self.category_names.get(key)
+        return None
+
+    def sales_report(self, company_id: str, group_by: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, statuses: Optional[list] = None,
+                     employee_id: Optional[str] = None, payment_method: Optional[str] = None,
+                     utc_offset_minutes: int = 0) -> dict:
+        """Group-by/filter/sum over the snapshot.
+
+        Transaction groupings (hour, weekday, date, employee, paymentMethod,
+        status) report transactions, revenue, tips and average ticket; line
+        groupings (category, item, technician, itemType) report lines, quantity
+        and revenue from lineTotal.
+        """
+        if group_by not in TRANSACTION_GROUPS | LINE_GROUPS:
+            raise ValueError(f"Unsupported groupBy: {group_by}")
+        self.ensure_fresh()
+        with self._lock:
+            t = self.transactions
+            mask = t["alive"] & (t["company"] == self.companies.code(company_id))
+            if start is not None:
+                mask &= t["ts"] >= _epoch(start)
+            if end is not None:
+                mask &= t["ts"] < _epoch(end)
+            if statuses:
+                mask &= np.isin(t["status"], [self.statuses.code(s) for s in statuses])
+            if employee_id:
+                mask &= t["employee"] == self.people.code(employee_id)
+            if payment_method:
+                mask &= t["payment"] == self.payments.code(payment_method)
+
+            if group_by in TRANSACTION_GROUPS:
+                rows = np.flatnonzero(mask)
+                keys, decode = self._group_keys(group_by, rows, utc_offset_minutes * 60)
+                groups, inverse = np.unique(keys, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                counts = np.bincount(inverse, minlength=len(groups))
+                revenue = np.bincount(inverse, weights=t["total"][rows], minlength=len(groups))
+                tips = np.bincount(inverse, weights=t["tip"][rows], minlength=len(groups))
+                results = [{
+                    "key": decode(int(k)),
+                    "transactions": int(counts[i]),
+                    "revenue": round(float(revenue[i]), 2),
+                    "tips": round(float(tips[i]), 2),
+                    "averageTicket": round(float(revenue[i] / counts[i]), 2),
+                } for i, k in enumerate(groups)]
+                totals = {"transactions": int(counts.sum()), "revenue": round(float(revenue.sum()), 2),
+                          "tips": round(float(tips.sum()), 2)}
+            else:
+                lines = self.lines
+                rows = np.flatnonzero(lines["alive"] & mask[lines["transaction"]])
+                keys, decode = self._line_group_keys(group_by, rows)
+                groups, inverse = np.unique(keys, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                counts = np.bincount(inverse, minlength=len(groups))
+                quantity = np.bincount(inverse, weights=lines["quantity"][rows], minlength=len(groups))
+                revenue = np.bincount(inverse, weights=lines["line_total"][rows], minlength=len(groups))
+                results = [{
+                    "key": decode(int(k)),
+                    "lines": int(counts[i]),
+                    "quantity": float(quantity[i]),
+                    "revenue": round(float(revenue[i]), 2),
+                } for i, k in enumerate(groups)]
+                results.sort(key=lambda r: -r["revenue"])
+                totals = {"lines": int(counts.sum()), "revenue": round(float(revenue.sum()), 2)}
+
+            for result in results:
+                label = self._label(group_by, result["key"])
+                if label:
+                    result["label"] = label
+            return {
+                "groupBy": group_by,
+                "groups": results,
+                "totals": totals,
+                "snapshotAgeSeconds": round(time.monotonic() - self._refreshed_at, 1),
+            }
+
+    def stats(self) -> dict:
+        return {
+            "transactions": int(self.transactions["alive"].sum()),
+            "lines": int(self.lines["alive"].sum()),
+            "age_seconds": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at else None,
+        }
+
+
+def sales_analytics_from_env(firebase_service) -> SalesAnalytics:
+    return SalesAnalytics(
+        firebase_service,
+        refresh_interval=float(os.getenv("ANALYTICS_REFRESH_SECONDS", 30)),
+        full_refresh_interval=float(os.getenv("ANALYTICS_FULL_REFRESH_SECONDS", 3600)),
+        overlap=float(os.getenv("ANALYTICS_REFRESH_OVERLAP_SECONDS", 300)),
+    )
@@ -0,0 +1,225 @@
+"""Tiered archival of closed transactions.
+
+Completed and voided transactions older than the retention window are moved,
+with their lines, out of Firestore into date-partitioned gzip NDJSON files
+listed in a manifest. GET /transactions reads them back for old date ranges.
+
+Usage (from firegloss_backend/):
+    python archive.py                          # archive using ARCHIVE_* settings
+    python archive.py --retention-days 180 --batch-size 100
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from customers import VISITS_COLLECTION
+
+ARCHIVED_STATUSES = ["complete", "voided"]
+DATETIME_FIELDS = ("transactionDate", "createdAt", "updatedAt")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"):
+        return value.value
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def _utc_date(value: datetime) -> date:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).date()
+
+
+def _load_record(line: str) -> dict:
+    record = json.loads(line)
+    for field in DATETIME_FIELDS:
+        if isinstance(record.get(field), str):
+            record[field] = datetime.fromisoformat(record[field])
+    return record
+
+
+class TransactionArchive:
+    """Date-partitioned archive files plus a JSON manifest.
+
+    Layout: ``{root}/{companyId}/{YYYY-MM-DD}/part-<id>.ndjson.gz``, one
+    transaction per line with its lines embedded under ``lines``. Parts are
+    written once and never modified; the manifest is replaced atomically after
+    each batch, so readers only see complete parts. A transaction archived twice
+    (the job died between writing and deleting) is read back once.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    def manifest(self) -> dict:
+        """The current manifest, re-read when another process has replaced it"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                return {"partitions": []}
+            if mtime != self._manifest_mtime:
+                with open(self.manifest_path) as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save_manifest(self, manifest: dict) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+
+    def write_partition(self, company_id: str, day: date, records: list) -> dict:
+        """Write one part file and return its manifest entry"""
+        relative_path = os.path.join(company_id, day.isoformat(), f"part-{uuid.uuid4().hex[:12]}.ndjson.gz")
+        path = os.path.join(self.root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=_json_default, separators=(",", ":")).encode())
+                    f.write(b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, path)
+        return {
+            "companyId": company_id,
+            "date": day.isoformat(),
+            "path": relative_path,
+            "transactions": len(records),
+            "lines": sum(len(r.get("lines", [])) for r in records),
+            "bytes": os.path.getsize(path),
+            "createdAt": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def add_partitions(self, entries: list) -> None:
+        manifest = dict(self.manifest())
+        manifest["partitions"] = manifest.get("partitions", []) + entries
+        manifest["updatedAt"] = datetime.now(timezone.utc).isoformat()
+        self._save_manifest(manifest)
+
+    def covers(self, company_id: str, start: datetime, end: datetime) -> bool:
+        """Whether any archived partition overlaps the range (a manifest lookup, no file I/O)"""
+        return bool(self._partitions(company_id, start, end))
+
+    def _partitions(self, company_id: str, start: datetime, end: datetime) -> list:
+        first, last = _utc_date(start).isoformat(), _utc_date(end).isoformat()
+        return [p for p in self.manifest().get("partitions", [])
+                if p["companyId"] == company_id and first <= p["date"] <= last]
+
+    def read(self, company_id: str, start: datetime, end: datetime, include_lines: bool = False) -> list:
+        """Archived transactions of a company with start <= transactionDate < end"""
+        records = {}
+        for partition in self._partitions(company_id, start, end):
+            with gzip.open(os.path.join(self.root, partition["path"]), "rt") as f:
+                for line in f:
+                    record = _load_record(line)
+                    transaction_date = record["transactionDate"]
+                    if transaction_date.tzinfo is None:
+                        transaction_date = transaction_date.replace(tzinfo=timezone.utc)
+                    if not start <= transaction_date < end:
+                        continue
+                    if not include_lines:
+                        record.pop("lines", None)
+                    record["archived"] = True
+                    records[record["id"]] = record
+        return list(records.values())
+
+
+class ArchiveJob:
+    """Moves closed transactions past the retention window from Firestore to the archive"""
+
+    def __init__(self, firebase_service, archive: TransactionArchive, retention_days: int = 365,
+                 batch_size: int = 200):
+        self.firebase_service = firebase_service
+        self.archive = archive
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+    def run(self, max_batches: Optional[int] = None) -> dict:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        totals = {"transactions": 0, "lines": 0, "partitions": 0, "cutoff": cutoff.isoformat()}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            transactions = self.firebase_service.get_transactions_before(cutoff, ARCHIVED_STATUSES, self.batch_size)
+            if not transactions:
+                break
+            archived = self._archive_batch(transactions)
+            for key in ("transactions", "lines", "partitions"):
+                totals[key] += archived[key]
+            batches += 1
+        return totals
+
+    def _archive_batch(self, transactions: list) -> dict:
+        transaction_ids = [t["id"] for t in transactions]
+        lines = self.firebase_service.get_lines_for_transactions(transaction_ids)
+        lines_by_transaction = {}
+        for line in lines:
+            lines_by_transaction.setdefault(line["transactionId"], []).append(line)
+
+        partitions = {}
+        for transaction in transactions:
+            key = (transaction["companyId"], _utc_date(transaction["transactionDate"]))
+            partitions.setdefault(key, []).append({
+                **transaction, "lines": lines_by_transaction.get(transaction["id"], [])
+            })
+        entries = [self.archive.write_partition(company_id, day, records)
+                   for (company_id, day), records in sorted(partitions.items())]
+        self.archive.add_partitions(entries)
+
+        # Only delete once the parts are durable and listed in the manifest. Transactions
+        # go first: a crash in between leaves orphaned lines, never a transaction without them.
+        # Deletes go per company so each tombstone names the company that syncs it. A
+        # transaction's customer visit shares its ID and goes in the same batch; the
+        # customer's visit count and lifetime total keep the archived sale.
+        by_company = {}
+        for transaction in transactions:
+            by_company.setdefault(transaction["companyId"], []).append(transaction["id"])
+        for company_id, ids in by_company.items():
+            self.firebase_service.delete_documents("transactions", ids, company_id, keyed_by=(VISITS_COLLECTION,))
+        for company_id, ids in by_company.items():
+            line_ids = [line["id"] for transaction_id in ids for line in lines_by_transaction.get(transaction_id, [])]
+            self.firebase_service.delete_documents("transaction_lines", line_ids, company_id)
+        return {"transactions": len(transactions), "lines": len(lines), "partitions": len(entries)}
+
+
+def archive_from_env() -> TransactionArchive:
+    default_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+    return TransactionArchive(os.getenv("ARCHIVE_DIR") or default_root)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive closed transactions older than the retention window")
+    parser.add_argument("--retention-days", type=int, default=int(os.getenv("ARCHIVE_RETENTION_DAYS", 365)))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("ARCHIVE_BATCH_SIZE", 200)))
+    parser.add_argument("--max-batches", type=int, default=None)
+    args = parser.parse_args()
+
+    from firebase_service import firebase_service
+    job = ArchiveJob(firebase_service, archive_from_env(), args.retention_days, args.batch_size)
+    totals = job.run(max_batches=args.max_batches)
+    print(f"Archived {totals['transactions']} transactions and {totals['lines']} lines "
+          f"into {totals['partitions']} partitions (cutoff {totals['cutoff']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Assign a company to items and categories created before tenant scoping.
+
+Scoped reads only return documents whose companyId matches the request's
+company, so documents without one disappear from GET /items and /categories.
+
+Usage (from firegloss_backend/):
+    python backfill_company_ids.py --company-id <id>            # dry run
+    python backfill_company_ids.py --company-id <id> --apply
+"""
+import argparse
+from datetime import datetime, timezone
+
+BACKFILLED_COLLECTIONS = ("item_categories", "items")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Set companyId on items and categories that have none")
+    parser.add_argument("--company-id", required=True)
+    parser.add_argument("--apply", action="store_true", help="write the changes (default is a dry run)")
+    args = parser.parse_args()
+
+    from firebase_service import firebase_service
+    for collection_name in BACKFILLED_COLLECTIONS:
+        missing = [d["id"] for d in firebase_service.get_all_documents(collection_name, all_companies=True)
+                   if not d.get("companyId")]
+        if args.apply:
+            for document_id in missing:
+                firebase_service.update_document(collection_name, document_id, {
+                    "companyId": args.company_id,
+                    "updatedAt": datetime.now(timezone.utc),
+                })
+        print(f"{collection_name}: {len(missing)} documents {'assigned' if args.apply else 'to assign'} "
+              f"to company {args.company_id}")
+
+
+if __name__ == "__main__":
+    main()
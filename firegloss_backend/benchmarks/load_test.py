@@ -0,0 +1,449 @@
+"""HTTP load test for the FireGloss backend.
+
+Drives the API with weighted POS workloads and reports throughput and latency
+percentiles per endpoint. By default the app runs in-process against the
+in-memory Firestore fake; pass --base-url to target a running server instead
+(start it with FIRESTORE_BACKEND=fake to keep Firestore out of the picture).
+
+Usage (from firegloss_backend/):
+    python -m benchmarks.load_test --mix pos --concurrency 16 --duration 20 --latency-ms 5
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --mix all
+    python -m benchmarks.load_test --compare results/before.json results/after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+class Recorder:
+    """Collects per-endpoint latencies and error counts"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def request(self, client, method: str, label: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        key = f"{method} {label}"
+        self.latencies.setdefault(key, []).append(elapsed)
+        if not ok:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return response.json() if ok else None
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, errors: int, wall_time: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / wall_time, 2) if wall_time else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+# Seed data
+
+async def seed(client, rng: random.Random, items: int, employees: int) -> dict:
+    """Create a realistic shop catalog through the public API"""
+    rec = Recorder()
+    company = await rec.request(client, "POST", "/companies", "/companies", json={
+        "uid": "bench-company", "name": "Bench Nails", "address": "1 Main St",
+        "phone": "555-0100", "email": "bench@example.com",
+    })
+    company_id = company["data"]["id"]
+    # Every later request acts for this company; tenant-scoped reads require one
+    client.headers["X-Company-Id"] = company_id
+
+    category_ids = []
+    for name in ["Manicure", "Pedicure", "Nail Art", "Waxing", "Retail"]:
+        category = await rec.request(client, "POST", "/categories", "/categories", json={
+            "name": name, "description": f"{name} services",
+        })
+        category_ids.append(category["data"]["id"])
+
+    catalog = []
+    for i in range(items):
+        item_type = "product" if i % 5 == 0 else "service"
+        payload = {
+            "name": f"Service {i}", "description": f"Catalog entry {i}",
+            "type": item_type, "categoryId": rng.choice(category_ids),
+            "price": round(rng.uniform(10, 90), 2),
+            "durationMinutes": rng.choice([15, 30, 45, 60]) if item_type == "service" else None,
+            "sku": f"SKU-{i:05d}",
+        }
+        item = await rec.request(client, "POST", "/items", "/items", json=payload)
+        catalog.append({"id": item["data"]["id"], **payload})
+
+    employee_ids = []
+    for i in range(employees):
+        employee = await rec.request(client, "POST", "/employees", "/employees", json={
+            "uid": f"bench-employee-{i}", "companyId": company_id,
+            "email": f"tech{i}@example.com", "firstName": "Tech", "lastName": str(i),
+            "role": "technician", "hourlyRate": 15.0, "commissionRate": 0.4,
+            "hiredDate": "2024-01-01T00:00:00",
+        })
+        employee_ids.append(employee["data"]["id"])
+
+    return {
+        "company_id": company_id,
+        "category_ids": category_ids,
+        "catalog": catalog,
+        "employee_ids": employee_ids,
+    }
+
+
+# Scenarios
+
+async def ring_up(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """Look up services, open a ticket, ring them up, fix a line, then take payment"""
+    now = datetime.now(timezone.utc).isoformat()
+    created = await rec.request(client, "POST", "/transactions", "/transactions", json={
+        "companyId": ctx["company_id"],
+        "transactionNumber": f"B{rng.randrange(10**9):09d}",
+        "transactionDate": now,
+        "customerName": "Walk In",
+        "customerPhone": f"555-{rng.randrange(10000):04d}",
+        "employeeId": rng.choice(ctx["employee_ids"]),
+    })
+    if not created:
+        return
+    transaction_id = created["data"]["transaction"]["id"]
+
+    line_ids = []
+    for item in rng.sample(ctx["catalog"], k=rng.randint(1, 3)):
+        # The front desk types the first letters of the service to find it
+        await rec.request(client, "GET", "/items/search", "/items/search",
+                          params={"q": item["name"][:rng.randint(4, len(item["name"]))]})
+        line = await rec.request(client, "POST", "/transactions/{id}/lines",
+                                 f"/transactions/{transaction_id}/lines", json={
+                                     "transactionId": transaction_id, "itemId": item["id"],
+                                     "itemName": item["name"], "itemType": item["type"],
+                                     "quantity": 1, "unitPrice": item["price"], "lineTotal": item["price"],
+                                     "technicianId": rng.choice(ctx["employee_ids"]),
+                                     "serviceDuration": item["durationMinutes"],
+                                 })
+        if line:
+            line_ids.append(line["data"]["line_id"])
+
+    if line_ids and rng.random() < 0.3:
+        line_id = rng.choice(line_ids)
+        await rec.request(client, "PUT", "/transactions/{id}/lines/{line_id}",
+                          f"/transactions/{transaction_id}/lines/{line_id}",
+                          json={"lineTotal": round(rng.uniform(5, 60), 2), "notes": "Price adjusted"})
+    if len(line_ids) > 1 and rng.random() < 0.15:
+        line_id = line_ids.pop()
+        await rec.request(client, "DELETE", "/transactions/{id}/lines/{line_id}",
+                          f"/transactions/{transaction_id}/lines/{line_id}")
+
+    await rec.request(client, "GET", "/transactions/{id}/lines", f"/transactions/{transaction_id}/lines")
+    await rec.request(client, "PUT", "/transactions/{id}", f"/transactions/{transaction_id}", json={
+        "status": "inProgress", "tip": 5.0,
+    })
+    ticket = await rec.request(client, "GET", "/transactions/{id}", f"/transactions/{transaction_id}")
+    if ticket and ticket["data"]["transaction"]["balance"] > 0:
+        # Recording the full balance settles the ticket to complete
+        await rec.request(client, "POST", "/payments", "/payments", json={
+            "transactionId": transaction_id, "method": rng.choice(["cash", "card"]),
+            "amount": ticket["data"]["transaction"]["balance"],
+        })
+        await rec.request(client, "GET", "/transactions/{id}/payments", f"/transactions/{transaction_id}/payments")
+
+
+async def walk_in(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """Check a walk-in into the queue, find a free technician and hand the next customer over"""
+    await rec.request(client, "POST", "/transactions", "/transactions", json={
+        "companyId": ctx["company_id"],
+        "transactionDate": datetime.now(timezone.utc).isoformat(),
+        "customerName": "Walk In",
+        "employeeId": rng.choice(ctx["employee_ids"]),
+        "priority": rng.choice([0, 0, 0, 1]),
+    })
+    await rec.request(client, "GET", "/queue", "/queue")
+    await rec.request(client, "GET", "/availability", "/availability",
+                      params={"duration": rng.choice([30, 45, 60]), "at": "15:00"})
+    await rec.request(client, "POST", "/queue/next", "/queue/next",
+                      json={"technicianId": rng.choice(ctx["employee_ids"])})
+
+
+async def device_sync(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """An offline-capable station pulling what changed since its last sync"""
+    result = await rec.request(client, "GET", "/sync", "/sync", params={
+        "collections": "items,item_categories,employees,transactions",
+        **({"since": ctx["sync_token"]} if ctx.get("sync_token") else {}),
+    })
+    if result:
+        ctx["sync_token"] = result["data"]["token"]
+
+
+async def reports(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """What a manager opens in the back office: today's summary, sales breakdowns and payroll"""
+    today = datetime.now(timezone.utc).date()
+    company = {"companyId": ctx["company_id"]}
+    await rec.request(client, "GET", "/transactions/summary", "/transactions/summary", params=company)
+    await rec.request(client, "GET", "/analytics/sales", "/analytics/sales", params={
+        **company, "groupBy": rng.choice(["hour", "employee", "paymentMethod", "technician", "item"]),
+    })
+    await rec.request(client, "GET", "/payroll", "/payroll", params={
+        **company, "from": (today - timedelta(days=13)).isoformat(), "to": today.isoformat(),
+    })
+
+
+async def dashboard_refresh(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """What a front-desk station loads every time the dashboard refreshes"""
+    await rec.request(client, "GET", "/", "/")
+    await rec.request(client, "GET", "/transactions", "/transactions")
+    await rec.request(client, "GET", "/employees", "/employees")
+
+
+async def catalog_reload(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """What a station loads when opening the item screen"""
+    await rec.request(client, "GET", "/items", "/items")
+    await rec.request(client, "GET", "/categories", "/categories")
+    await rec.request(client, "GET", "/companies", "/companies")
+
+
+async def back_office(client, rec: Recorder, ctx: dict, rng: random.Random):
+    """Management CRUD touching every remaining endpoint"""
+    suffix = rng.randrange(10**9)
+    await rec.request(client, "GET", "/test", "/test")
+
+    user = await rec.request(client, "POST", "/users", "/users", json={
+        "email": f"user{suffix}@example.com", "name": "Bench User", "password": "secret",
+    })
+    if user:
+        user_id = user["data"]["user_id"]
+        await rec.request(client, "GET", "/users/{id}", f"/users/{user_id}")
+        await rec.request(client, "PUT", "/users/{id}", f"/users/{user_id}", json={"phone": "555-0199"})
+        await rec.request(client, "DELETE", "/users/{id}", f"/users/{user_id}")
+    await rec.request(client, "GET", "/users", "/users")
+
+    company = await rec.request(client, "POST", "/companies", "/companies", json={
+        "uid": f"bench-{suffix}", "name": "Temp Co", "address": "2 Side St",
+        "phone": "555-0101", "email": f"co{suffix}@example.com",
+    })
+    if company:
+        company_id = company["data"]["id"]
+        await rec.request(client, "PUT", "/companies/{id}", f"/companies/{company_id}", json={"phone": "555-0102"})
+        await rec.request(client, "DELETE", "/companies/{id}", f"/companies/{company_id}",
+                          headers={"X-Company-Id": company_id})
+
+    employee = await rec.request(client, "POST", "/employees", "/employees", json={
+        "uid": f"bench-{suffix}", "companyId": ctx["company_id"], "email": f"e{suffix}@example.com",
+        "firstName": "Temp", "lastName": "Tech", "role": "technician",
+        "hiredDate": "2024-06-01T00:00:00",
+    })
+    if employee:
+        employee_id = employee["data"]["id"]
+        await rec.request(client, "PUT", "/employees/{id}", f"/employees/{employee_id}", json={"hourlyRate": 16.0})
+        await rec.request(client, "DELETE", "/employees/{id}", f"/employees/{employee_id}")
+
+    category = await rec.request(client, "POST", "/categories", "/categories", json={
+        "name": "Temp", "description": "Temporary category",
+    })
+    if category:
+        category_id = category["data"]["id"]
+        await rec.request(client, "PUT", "/categories/{id}", f"/categories/{category_id}", json={"color": "#ff0000"})
+        await rec.request(client, "DELETE", "/categories/{id}", f"/categories/{category_id}")
+
+    item = await rec.request(client, "POST", "/items", "/items", json={
+        "name": "Temp Service", "description": "Temporary", "type": "service",
+        "categoryId": ctx["category_ids"][0], "price": 20.0,
+    })
+    if item:
+        item_id = item["data"]["id"]
+        await rec.request(client, "PUT", "/items/{id}", f"/items/{item_id}", json={"price": 22.0})
+        await rec.request(client, "DELETE", "/items/{id}", f"/items/{item_id}")
+
+    voided = await rec.request(client, "POST", "/transactions", "/transactions", json={
+        "companyId": ctx["company_id"], "transactionNumber": f"V{suffix:09d}",
+        "transactionDate": datetime.now(timezone.utc).isoformat(),
+        "employeeId": rng.choice(ctx["employee_ids"]),
+    })
+    if voided:
+        transaction_id = voided["data"]["transaction"]["id"]
+        lines = [{"transactionId": transaction_id, "itemId": item["id"], "itemName": item["name"],
+                  "itemType": item["type"], "quantity": 1, "unitPrice": item["price"], "lineTotal": item["price"]}
+                 for item in rng.sample(ctx["catalog"], k=2)]
+        await rec.request(client, "PUT", "/transactions/{id}/lines", f"/transactions/{transaction_id}/lines",
+                          json=lines)
+        await rec.request(client, "DELETE", "/transactions/{id}", f"/transactions/{transaction_id}")
+
+
+MIXES = {
+    "pos": [(45, ring_up), (25, dashboard_refresh), (15, catalog_reload), (10, walk_in), (5, device_sync)],
+    "ringup": [(1, ring_up)],
+    "dashboard": [(1, dashboard_refresh)],
+    "catalog": [(1, catalog_reload)],
+    "walkin": [(1, walk_in)],
+    "sync": [(1, device_sync)],
+    "reports": [(1, reports)],
+    "all": [(30, ring_up), (20, dashboard_refresh), (15, catalog_reload), (10, walk_in), (5, device_sync),
+            (5, reports), (15, back_office)],
+}
+
+
+# Runner
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        from main import app
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout
+        )
+
+    async with client:
+        ctx = await seed(client, rng, args.items, args.employees)
+        rec = Recorder()
+        scenarios = MIXES[args.mix]
+        weights = [w for w, _ in scenarios]
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(worker_id: int):
+            worker_rng = random.Random(args.seed * 1000 + worker_id)
+            while time.perf_counter() < deadline:
+                _, scenario = worker_rng.choices(scenarios, weights=weights)[0]
+                await scenario(client, rec, ctx, worker_rng)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        wall_time = time.perf_counter() - start
+
+    all_latencies = [v for values in rec.latencies.values() for v in values]
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "items": args.items,
+            "employees": args.employees,
+            "target": args.base_url or "in-process",
+            "wall_time_s": round(wall_time, 3),
+        },
+        "overall": summarize(all_latencies, sum(rec.errors.values()), wall_time),
+        "endpoints": {
+            key: summarize(values, rec.errors.get(key, 0), wall_time)
+            for key, values in sorted(rec.latencies.items())
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict) -> None:
+    meta = result["meta"]
+    print(f"Mix '{meta['mix']}' @ {meta['commit']}: concurrency={meta['concurrency']} "
+          f"duration={meta['duration_s']}s latency={meta['latency_ms']}ms target={meta['target']}")
+    header = f"{'endpoint':42} {'reqs':>7} {'err':>5} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = list(result["endpoints"].items()) + [("TOTAL", result["overall"])]
+    for key, s in rows:
+        print(f"{key:42} {s['requests']:>7} {s['errors']:>5} {s['rps']:>9.1f} "
+              f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+
+def compare(before_path: str, after_path: str) -> None:
+    before = json.loads(Path(before_path).read_text())
+    after = json.loads(Path(after_path).read_text())
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']} (mix '{after['meta']['mix']}')")
+    header = f"{'endpoint':42} {'req/s':>16} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}"
+    print(header)
+    print('-' * len(header))
+
+    def delta(old, new):
+        change = (new - old) / old * 100 if old else 0.0
+        return f"{new:>9.2f} {change:+6.1f}%"
+
+    keys = sorted(set(before["endpoints"]) | set(after["endpoints"])) + ["TOTAL"]
+    for key in keys:
+        old = before["overall"] if key == "TOTAL" else before["endpoints"].get(key)
+        new = after["overall"] if key == "TOTAL" else after["endpoints"].get(key)
+        if not old or not new:
+            continue
+        print(f"{key:42} {delta(old['rps'], new['rps']):>16} {delta(old['p50_ms'], new['p50_ms']):>18} "
+              f"{delta(old['p95_ms'], new['p95_ms']):>18} {delta(old['p99_ms'], new['p99_ms']):>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FireGloss backend load test")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="pos")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fake Firestore round trip")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--employees", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--base-url", help="target a running server instead of the in-process app")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<mix>-<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if not args.base_url:
+        # Must be set before main/firebase_service are imported
+        os.environ["FIRESTORE_BACKEND"] = "fake"
+        os.environ["FIRESTORE_FAKE_LATENCY_MS"] = str(args.latency_ms)
+        os.environ["FIRESTORE_FAKE_JITTER_MS"] = str(args.jitter_ms)
+        # The benchmark drives one company far past any per-tenant quota
+        os.environ.setdefault("TENANT_RATE_LIMIT_PER_SECOND", "0")
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{args.mix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['meta']['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Micro-benchmarks for model validation and response building.
+
+Measures the per-request CPU work that happens before and after Firestore:
+pydantic validation of request bodies, `.dict()` conversion, enum coercion,
+handler dict building and APIResponse encoding, for single objects and
+10k-element lists. The ``typed`` benchmarks cover the no-validation path the
+read endpoints use (model_construct plus the compiled serializer).
+
+Usage (from firegloss_backend/):
+    python -m benchmarks.micro                    # compare against the baseline
+    python -m benchmarks.micro --save-baseline    # record a new baseline
+    python -m benchmarks.micro --filter encode --threshold 0.1
+
+Baselines are machine specific; record one on the machine you compare on.
+Exits with status 1 when any benchmark regresses past the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import (
+    APIResponse, TransactionCreate, TransactionLineCreate, TransactionStatus, PaymentMethod,
+    TransactionData, TransactionList, TransactionListResponse, TransactionResponse
+)
+from responses import trusted_response
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "micro.json"
+LIST_SIZE = 10_000
+
+NOW = datetime(2025, 3, 1, 14, 30, tzinfo=timezone.utc)
+
+TRANSACTION_PAYLOAD = {
+    "companyId": "company-1",
+    "transactionNumber": "20250301-0042",
+    "transactionDate": NOW.isoformat(),
+    "customerName": "Jane Doe",
+    "customerPhone": "555-0100",
+    "customerEmail": "jane@example.com",
+    "employeeId": "employee-7",
+    "status": "inProgress",
+    "paymentMethod": "card",
+    "subtotal": 55.0,
+    "tax": 4.4,
+    "tip": 10.0,
+    "total": 69.4,
+    "notes": "Gel polish",
+}
+
+LINE_PAYLOAD = {
+    "transactionId": "transaction-1",
+    "itemId": "item-3",
+    "itemName": "Gel Manicure",
+    "itemType": "service",
+    "quantity": 1,
+    "unitPrice": 35.0,
+    "lineTotal": 35.0,
+    "technicianId": "employee-7",
+    "serviceDuration": 45,
+}
+
+TRANSACTION_LIST = TypeAdapter(List[TransactionCreate])
+LINE_LIST = TypeAdapter(List[TransactionLineCreate])
+
+
+def build_transaction_document(transaction: TransactionCreate) -> dict:
+    """Mirrors the field-by-field dict built in main.create_transaction"""
+    return {
+        "companyId": transaction.companyId,
+        "transactionNumber": transaction.transactionNumber,
+        "transactionDate": transaction.transactionDate,
+        "customerId": transaction.customerId,
+        "customerName": transaction.customerName,
+        "customerPhone": transaction.customerPhone,
+        "customerEmail": transaction.customerEmail,
+        "employeeId": transaction.employeeId,
+        "status": transaction.status,
+        "paymentMethod": transaction.paymentMethod,
+        "subtotal": transaction.subtotal,
+        "tax": transaction.tax,
+        "discount": transaction.discount,
+        "tip": transaction.tip,
+        "total": transaction.total,
+        "notes": transaction.notes,
+        "createdAt": transaction.createdAt or NOW,
+        "updatedAt": transaction.updatedAt or NOW,
+    }
+
+
+def stored_transaction(index: int) -> dict:
+    """A transaction as it comes back from Firestore"""
+    document = build_transaction_document(TransactionCreate(**TRANSACTION_PAYLOAD))
+    document["id"] = f"transaction-{index}"
+    return document
+
+
+def encode_response(response: APIResponse) -> bytes:
+    """What FastAPI does with a response_model=APIResponse return value"""
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+def make_benchmarks() -> dict:
+    transaction = TransactionCreate(**TRANSACTION_PAYLOAD)
+    line = TransactionLineCreate(**LINE_PAYLOAD)
+    transaction_payloads = [dict(TRANSACTION_PAYLOAD) for _ in range(LIST_SIZE)]
+    line_payloads = [dict(LINE_PAYLOAD) for _ in range(LIST_SIZE)]
+    transactions = TRANSACTION_LIST.validate_python(transaction_payloads)
+    stored = [stored_transaction(i) for i in range(LIST_SIZE)]
+    single_response = APIResponse(success=True, message="Transaction retrieved successfully",
+                                  data={"transaction": stored[0]})
+    list_response = APIResponse(success=True, message="Transactions retrieved successfully",
+                                data={"transactions": stored})
+    typed_single = lambda: trusted_response(TransactionResponse, "ok", TransactionData.from_store(stored[0]))
+    typed_list = lambda: trusted_response(TransactionListResponse, "ok", TransactionList.from_store(stored))
+
+    # name -> (callable, number of objects processed per call)
+    return {
+        "validate.transaction": (lambda: TransactionCreate(**TRANSACTION_PAYLOAD), 1),
+        "validate.line": (lambda: TransactionLineCreate(**LINE_PAYLOAD), 1),
+        "validate.transaction_list_10k": (lambda: TRANSACTION_LIST.validate_python(transaction_payloads), LIST_SIZE),
+        "validate.line_list_10k": (lambda: LINE_LIST.validate_python(line_payloads), LIST_SIZE),
+        "validate.transaction_json": (lambda: TransactionCreate.model_validate_json(json.dumps(TRANSACTION_PAYLOAD)), 1),
+        "dict.transaction": (lambda: transaction.dict(), 1),
+        "dict.line": (lambda: line.dict(), 1),
+        "dict.transaction_list_10k": (lambda: [t.dict() for t in transactions], LIST_SIZE),
+        "enum.status_by_value": (lambda: TransactionStatus("complete"), 1),
+        "enum.payment_by_value": (lambda: PaymentMethod("card"), 1),
+        "enum.status_validated": (lambda: TransactionCreate(**{**TRANSACTION_PAYLOAD, "status": "complete"}).status, 1),
+        "build.transaction_document": (lambda: build_transaction_document(transaction), 1),
+        "build.transaction_document_10k": (lambda: [build_transaction_document(t) for t in transactions], LIST_SIZE),
+        "response.build_single": (lambda: APIResponse(success=True, message="ok", data={"transaction": stored[0]}), 1),
+        "response.build_list_10k": (lambda: APIResponse(success=True, message="ok", data={"transactions": stored}), LIST_SIZE),
+        "encode.single": (lambda: encode_response(single_response), 1),
+        "encode.list_10k": (lambda: encode_response(list_response), LIST_SIZE),
+        "response.typed_build_list_10k": (lambda: TransactionList.from_store(stored), LIST_SIZE),
+        "encode.typed_single": (lambda: typed_single().body, 1),
+        "encode.typed_list_10k": (lambda: typed_list().body, LIST_SIZE),
+    }
+
+
+def measure(func, repeat: int, min_time: float) -> float:
+    """Best-of-`repeat` seconds per call, auto-scaling the loop count"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(args) -> dict:
+    results = {}
+    for name, (func, size) in make_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        seconds = measure(func, args.repeat, args.min_time)
+        results[name] = {"us_per_call": round(seconds * 1e6, 3), "objects": size,
+                         "ns_per_object": round(seconds * 1e9 / size, 1)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FireGloss model/serialization micro-benchmarks")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing loop")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="allowed slowdown vs baseline before failing (0.20 = 20%%)")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text())["results"] if baseline_path.exists() else {}
+
+    regressions = []
+    print(f"{'benchmark':36} {'us/call':>12} {'ns/object':>12} {'baseline':>12} {'change':>9}")
+    print('-' * 85)
+    for name, result in results.items():
+        line = f"{name:36} {result['us_per_call']:>12.3f} {result['ns_per_object']:>12.1f}"
+        previous = baseline.get(name)
+        if previous:
+            change = result["us_per_call"] / previous["us_per_call"] - 1
+            flag = "  REGRESSION" if change > args.threshold else ""
+            line += f" {previous['us_per_call']:>12.3f} {change:>+8.1%}{flag}"
+            if flag:
+                regressions.append(name)
+        print(line)
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        merged = {**baseline, **results}
+        baseline_path.write_text(json.dumps({
+            "meta": {
+                "recorded": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "processor": platform.processor(),
+            },
+            "results": merged,
+        }, indent=2) + "\n")
+        print(f"\nBaseline saved to {baseline_path}")
+        return
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: "
+              f"{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+JOBS_COLLECTION = "delete_jobs"
+
+# Documents that hang off a transaction
+TRANSACTION_DEPENDENTS = ("transaction_lines", "payments")
+# Company-owned collections (all carry companyId), removed after the company's transactions
+COMPANY_DEPENDENTS = (
+    "transaction_lines", "payments", "customer_visits", "customer_lookup", "customers",
+    "transaction_counters", "items", "item_categories", "employees",
+)
+# Firestore caps "in" filters at 30 values
+IN_FILTER_LIMIT = 30
+
+
+class CascadeDeleter:
+    """Background removal of the documents a deleted transaction or company leaves behind.
+
+    The parent is deleted by the request; a job then pages through dependents
+    with keys-only queries and deletes each page with a BulkWriter. Progress
+    is kept in a ``delete_jobs`` document so any worker can report it. A
+    failed company job can be re-run by deleting the company again.
+    """
+
+    def __init__(self, firebase_service, page_size: int = 500, workers: int = 2):
+        self.firebase_service = firebase_service
+        self.page_size = page_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cascade-delete")
+
+    def delete_transaction(self, transaction_id: str, company_id: Optional[str] = None) -> str:
+        """Start removing a deleted transaction's lines and payments; returns the job ID"""
+        return self._start("transaction", transaction_id, company_id, self._transaction_plan)
+
+    def delete_company(self, company_id: str) -> str:
+        """Start removing everything a deleted company owned; returns the job ID"""
+        return self._start("company", company_id, company_id, self._company_plan)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        job = self.firebase_service.get_document(JOBS_COLLECTION, job_id, allow_stale=False)
+        if job is not None:
+            job["id"] = job_id
+        return job
+
+    def _start(self, kind: str, target_id: str, company_id: Optional[str], plan) -> str:
+        job_id = self.firebase_service.new_document_id(JOBS_COLLECTION)
+        now = datetime.now(timezone.utc)
+        job = {
+            "kind": kind,
+            "targetId": target_id,
+            "status": "queued",
+            "deleted": {},
+            "failed": 0,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        self.firebase_service.set_document(JOBS_COLLECTION, job_id, job)
+        self.executor.submit(self._run, job_id, job, company_id, plan, target_id)
+        return job_id
+
+    def _save(self, job_id: str, job: dict, **changes) -> None:
+        job.update(changes, updatedAt=datetime.now(timezone.utc))
+        self.firebase_service.set_document(JOBS_COLLECTION, job_id, job)
+
+    def _run(self, job_id: str, job: dict, company_id: Optional[str], plan, target_id: str) -> None:
+        try:
+            self._save(job_id, job, status="running")
+            plan(job_id, job, company_id, target_id)
+            self._save(job_id, job, status="failed" if job["failed"] else "done",
+                       finishedAt=datetime.now(timezone.utc))
+        except Exception as e:
+            print(f"Cascade delete job {job_id} failed: {e}")
+            try:
+                self._save(job_id, job, status="failed", error=str(e), finishedAt=datetime.now(timezone.utc))
+            except Exception as save_error:
+                print(f"Could not record failure of job {job_id}: {save_error}")
+
+    def _delete_page(self, job_id: str, job: dict, collection_name: str, ids: list,
+                     company_id: Optional[str]) -> bool:
+        """Delete one page and record progress; False if any delete failed"""
+        failed = self.firebase_service.bulk_delete(collection_name, ids, company_id)
+        deleted = dict(job["deleted"])
+        deleted[collection_name] = deleted.get(collection_name, 0) + len(ids) - failed
+        self._save(job_id, job, deleted=deleted, failed=job["failed"] + failed)
+        return not failed
+
+    def _delete_where(self, job_id: str, job: dict, collection_name: str, field: str, op: str, value,
+                      company_id: Optional[str]) -> None:
+        # Deleted documents drop out of the query, so each page re-runs it from the start
+        while True:
+            ids = self.firebase_service.get_document_ids(collection_name, field, op, value, self.page_size)
+            if not ids:
+                return
+            if not self._delete_page(job_id, job, collection_name, ids, company_id):
+                # The same documents would come back on the next page
+                return
+
+    def _transaction_plan(self, job_id: str, job: dict, company_id: Optional[str], transaction_id: str) -> None:
+        for collection_name in TRANSACTION_DEPENDENTS:
+            self._delete_where(job_id, job, collection_name, "transactionId", "==", transaction_id, company_id)
+
+    def _company_plan(self, job_id: str, job: dict, company_id: Optional[str], target_id: str) -> None:
+        # Transactions first, with their dependents found by transactionId: lines
+        # written before they carried companyId would otherwise be missed
+        while True:
+            ids = self.firebase_service.get_document_ids("transactions", "companyId", "==", target_id,
+                                                         self.page_size)
+            if not ids:
+                break
+            for i in range(0, len(ids), IN_FILTER_LIMIT):
+                for collection_name in TRANSACTION_DEPENDENTS:
+                    self._delete_where(job_id, job, collection_name, "transactionId", "in",
+                                       ids[i:i + IN_FILTER_LIMIT], company_id)
+            if not self._delete_page(job_id, job, "transactions", ids, company_id):
+                break
+        for collection_name in COMPANY_DEPENDENTS:
+            self._delete_where(job_id, job, collection_name, "companyId", "==", target_id, company_id)
+
+
+def cascade_deleter_from_env(firebase_service) -> CascadeDeleter:
+    return CascadeDeleter(
+        firebase_service,
+        page_size=int(os.getenv("CASCADE_DELETE_PAGE_SIZE", 500)),
+        workers=int(os.getenv("CASCADE_DELETE_WORKERS", 2)),
+    )
@@ -0,0 +1,5 @@
+import os
+
+# Tests that import main run it against the in-memory Firestore fake
+os.environ.setdefault("FIRESTORE_BACKEND", "fake")
+os.environ.setdefault("TENANT_RATE_LIMIT_PER_SECOND", "0")
@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+CUSTOMERS_COLLECTION = "customers"
+LOOKUP_COLLECTION = "customer_lookup"
+VISITS_COLLECTION = "customer_visits"
+
+# Transactions in these states do not count towards a customer's lifetime totals
+UNCOUNTED_STATUSES = {"cancelled", "voided"}
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Digits only; a leading country code 1 on 11-digit numbers is dropped"""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits or None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email or None
+
+
+def lookup_id(company_id: str, kind: str, value: str) -> str:
+    """Document ID of the lookup entry for a normalized phone or email"""
+    if kind == "email":
+        value = hashlib.sha256(value.encode()).hexdigest()
+    return f"{company_id}_{kind}_{value}"
+
+
+def _utc(value: datetime) -> datetime:
+    """Treat naive client timestamps as UTC so stored dates stay comparable"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def encode_cursor(visit: dict) -> str:
+    payload = [visit["transactionDate"].isoformat(), visit["transactionId"]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    transaction_date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return {"transactionDate": datetime.fromisoformat(transaction_date), "transactionId": transaction_id}
+
+
+class CustomerDirectory:
+    """Customer records maintained from transaction writes.
+
+    Each transaction with customer details is linked to a ``customers``
+    document, found by customerId or through ``customer_lookup`` entries keyed
+    by normalized phone and email, so a front-desk lookup is a single document
+    read. Every linked transaction has a ``customer_visits`` record (keyed by
+    transaction ID) for paginated history, and the customer's visit count and
+    lifetime total are adjusted in the same Firestore transaction as the visit.
+    """
+
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+
+    def _collection(self, name: str):
+        return self.firebase_service.db.collection(name)
+
+    def find(self, company_id: str, phone: Optional[str] = None, email: Optional[str] = None) -> Optional[dict]:
+        """Customer matching a phone number or email, phone first"""
+        for kind, value in (("phone", normalize_phone(phone)), ("email", normalize_email(email))):
+            if not value:
+                continue
+            entry = self.firebase_service.get_document(LOOKUP_COLLECTION, lookup_id(company_id, kind, value))
+            if entry is None:
+                continue
+            customer = self.firebase_service.get_document(CUSTOMERS_COLLECTION, entry["customerId"])
+            if customer is not None:
+                customer["id"] = entry["customerId"]
+                return customer
+        return None
+
+    def get(self, customer_id: str) -> Optional[dict]:
+        customer = self.firebase_service.get_document(CUSTOMERS_COLLECTION, customer_id)
+        if customer is not None:
+            customer["id"] = customer_id
+        return customer
+
+    def history(self, customer_id: str, limit: int = 20, cursor: Optional[str] = None) -> dict:
+        """A page of past visits, newest first, with the cursor for the next page"""
+        visits = self.firebase_service.get_customer_visits(
+            customer_id, limit, decode_cursor(cursor) if cursor else None
+        )
+        next_cursor = encode_cursor(visits[-1]) if len(visits) == limit else None
+        return {"visits": visits, "nextCursor": next_cursor}
+
+    def _resolve(self, transaction, company_id: str, customer_id: Optional[str], contacts: list):
+        """Read the customer a sale belongs to: (customer_id, customer or None, lookup snapshots)"""
+        customers = self._collection(CUSTOMERS_COLLECTION)
+        lookups = {
+            kind: self._collection(LOOKUP_COLLECTION).document(lookup_id(company_id, kind, value)).get(transaction=transaction)
+            for kind, value in contacts
+        }
+        if customer_id:
+            snapshot = customers.document(customer_id).get(transaction=transaction)
+            if snapshot.exists:
+                return customer_id, snapshot.to_dict(), lookups
+        for kind, _ in contacts:
+            if lookups[kind].exists:
+                matched_id = lookups[kind].get("customerId")
+                snapshot = customers.document(matched_id).get(transaction=transaction)
+                if snapshot.exists:
+                    return matched_id, snapshot.to_dict(), lookups
+        return customer_id or customers.document().id, None, lookups
+
+    def record_visit(self, transaction_id: str, sale: dict) -> Optional[str]:
+        """Link a created or updated transaction to its customer and adjust their totals.
+
+        Returns the customer ID, or None for a walk-in without customer details.
+        """
+        company_id = sale["companyId"]
+        transaction_date = _utc(sale["transactionDate"])
+        phone = normalize_phone(sale.get("customerPhone"))
+        email = normalize_email(sale.get("customerEmail"))
+        contacts = [(kind, value) for kind, value in (("phone", phone), ("email", email)) if value]
+        if not (sale.get("customerId") or contacts):
+            self.remove_visit(transaction_id)
+            return None
+
+        def record(transaction):
+            visit_ref = self._collection(VISITS_COLLECTION).document(transaction_id)
+            visit = visit_ref.get(transaction=transaction)
+            previous = visit.to_dict() if visit.exists else None
+            customer_id, customer, lookups = self._resolve(transaction, company_id, sale.get("customerId"), contacts)
+            moved_from = None
+            if previous and previous["customerId"] != customer_id and previous["counted"]:
+                moved_from = self._collection(CUSTOMERS_COLLECTION).document(previous["customerId"])
+                snapshot = moved_from.get(transaction=transaction)
+                moved_from = (moved_from, snapshot.to_dict()) if snapshot.exists else None
+
+            # All reads are done; writes follow
+            now = datetime.now(timezone.utc)
+            if moved_from is not None:
+                ref, old = moved_from
+                transaction.update(ref, {
+                    "visitCount": old.get("visitCount", 0) - 1,
+                    "lifetimeTotal": round(old.get("lifetimeTotal", 0.0) - previous["total"], 2),
+                    "updatedAt": now,
+                })
+
+            counted = sale.get("status") not in UNCOUNTED_STATUSES
+            total = float(sale.get("total") or 0.0)
+            already_counted = previous is not None and previous["customerId"] == customer_id and previous["counted"]
+            customer = customer or {"companyId": company_id, "visitCount": 0, "lifetimeTotal": 0.0,
+                                    "firstVisitAt": transaction_date, "createdAt": now}
+            customer["visitCount"] = customer.get("visitCount", 0) - already_counted + counted
+            customer["lifetimeTotal"] = round(customer.get("lifetimeTotal", 0.0)
+                                              - (previous["total"] if already_counted else 0.0)
+                                              + (total if counted else 0.0), 2)
+            if counted and (customer.get("lastVisitAt") is None or customer["lastVisitAt"] < transaction_date):
+                customer["lastVisitAt"] = transaction_date
+            if sale.get("customerName"):
+                customer["name"] = sale["customerName"]
+            customer.setdefault("phone", sale.get("customerPhone"))
+            customer.setdefault("email", sale.get("customerEmail"))
+            if phone:
+                customer["normalizedPhone"] = customer.get("normalizedPhone") or phone
+            if email:
+                customer["normalizedEmail"] = customer.get("normalizedEmail") or email
+            customer["updatedAt"] = now
+            transaction.set(self._collection(CUSTOMERS_COLLECTION).document(customer_id), customer)
+
+            for kind, value in contacts:
+                if not lookups[kind].exists or lookups[kind].get("customerId") != customer_id:
+                    transaction.set(lookups[kind].reference, {
+                        "companyId": company_id, "kind": kind, "value": value,
+                        "customerId": customer_id, "updatedAt": now,
+                    })
+
+            transaction.set(visit_ref, {
+                "customerId": customer_id,
+                "companyId": company_id,
+                "transactionId": transaction_id,
+                "transactionNumber": sale.get("transactionNumber"),
+                "transactionDate": transaction_date,
+                "employeeId": sale.get("employeeId"),
+                "status": sale.get("status"),
+                "total": total,
+                "tip": float(sale.get("tip") or 0.0),
+                "counted": counted,
+                "updatedAt": now,
+            })
+            if sale.get("customerId") != customer_id:
+                transaction.update(self._collection("transactions").document(transaction_id),
+                                   {"customerId": customer_id, "updatedAt": now})
+            return customer_id
+
+        return self.firebase_service.run_transaction(
+            record, writes_to=(CUSTOMERS_COLLECTION, LOOKUP_COLLECTION, VISITS_COLLECTION, "transactions")
+        )
+
+    def remove_visit(self, transaction_id: str) -> None:
+        """Unlink a deleted (or no longer customer-bearing) transaction from its customer"""
+        def remove(transaction):
+            visit_ref = self._collection(VISITS_COLLECTION).document(transaction_id)
+            visit = visit_ref.get(transaction=transaction)
+            if not visit.exists:
+                return
+            previous = visit.to_dict()
+            customer_ref = self._collection(CUSTOMERS_COLLECTION).document(previous["customerId"])
+            customer = customer_ref.get(transaction=transaction)
+            if customer.exists and previous["counted"]:
+                transaction.update(customer_ref, {
+                    "visitCount": customer.get("visitCount") - 1,
+                    "lifetimeTotal": round(customer.get("lifetimeTotal") - previous["total"], 2),
+                    "updatedAt": datetime.now(timezone.utc),
+                })
+            transaction.delete(visit_ref)
+
+        self.firebase_service.run_transaction(remove, writes_to=(CUSTOMERS_COLLECTION, VISITS_COLLECTION))
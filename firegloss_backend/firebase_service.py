@@ -1,20 +1,74 @@
 import os
 import json
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
 from dotenv import load_dotenv
+from google.api_core import exceptions as gcp_exceptions
+from request_context import current_company, mark_stale
+from write_buffer import apply_update, write_buffer_from_env
+from query_stats import query_shape, query_stats_from_env
+from resilience import (
+    RETRYABLE_ERRORS, RequestDeadlineExceeded, budget_spent, retry_policy_from_env, hedger_from_env,
+    circuit_breaker_from_env, stale_cache_from_env, SingleFlight
+)
 
 load_dotenv()
 
+# Collections offline clients sync; deleting from them leaves a tombstone for GET /sync
+SYNCED_COLLECTIONS = (
+    "companies", "employees", "item_categories", "items",
+    "transactions", "transaction_lines", "customers",
+)
+# Collections whose documents carry a companyId; reads and writes are scoped to the request's company
+TENANT_SCOPED_COLLECTIONS = (
+    "employees", "item_categories", "items", "transactions", "transaction_lines", "customers", "payments",
+)
+TOMBSTONE_COLLECTION = "tombstones"
+TOMBSTONE_TTL_DAYS = float(os.getenv("SYNC_TOMBSTONE_TTL_DAYS", 30))
+# Markers that make a buffered change set with Increments commit at most once; give them a TTL policy on expiresAt
+WRITE_MARKER_COLLECTION = "write_log_commits"
+WRITE_MARKER_TTL_DAYS = 7
+
 class FirebaseService:
     def __init__(self):
         self.app = None
         self.db = None
+        self.retry_policy = retry_policy_from_env()
+        self.hedger = hedger_from_env()
+        self.circuit_breaker = circuit_breaker_from_env()
+        self.stale_cache = stale_cache_from_env()
+        self.single_flight = SingleFlight()
+        self.query_stats = query_stats_from_env()
+        # Runs independent queries of one request concurrently
+        self.query_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("FIRESTORE_QUERY_CONCURRENCY", 16)), thread_name_prefix="firestore-query"
+        )
+        self._write_listeners = {}
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
         self.initialize_firebase()
+        # Optional group commit through a local write-ahead log (WRITE_BUFFER_ENABLED)
+        self.write_buffer = write_buffer_from_env(self._commit_buffered, self._on_buffer_flushed) if self.db else None
     
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
+        if os.getenv('FIRESTORE_BACKEND', '').lower() == 'fake':
+            # In-memory Firestore for load tests and benchmarks
+            from firestore_fake import FakeFirestore
+            latency_ms = float(os.getenv('FIRESTORE_FAKE_LATENCY_MS', '0'))
+            jitter_ms = float(os.getenv('FIRESTORE_FAKE_JITTER_MS', '0'))
+            error_rate = float(os.getenv('FIRESTORE_FAKE_ERROR_RATE', '0'))
+            self.db = FakeFirestore(latency=latency_ms / 1000, jitter=jitter_ms / 1000, error_rate=error_rate)
+            print(f"Using in-memory Firestore fake ({latency_ms}ms latency)")
+            return
+
         try:
             # Check if Firebase is already initialized
             if not firebase_admin._apps:
@@ -45,13 +99,132 @@ class FirebaseService:
             self.app = None
             self.db = None
     
+    def _call(self, operation, idempotent: bool = True):
+        """Run a Firestore RPC under the request deadline with retries.
+
+        ``operation`` receives the per-attempt timeout. The client library's own
+        retry is disabled at each call site (retry=None) so attempts don't multiply.
+        Fails fast with CircuitOpenError while the circuit breaker is open.
+        """
+        self.circuit_breaker.before_call()
+        try:
+            result = self.retry_policy.call(operation, idempotent=idempotent)
+        except Exception as e:
+            if isinstance(e, RequestDeadlineExceeded) or (
+                    isinstance(e, gcp_exceptions.DeadlineExceeded) and budget_spent()):
+                # The caller ran out of time (a tiny X-Request-Timeout, a long admission
+                # wait): the attempt's timeout was the request's, not Firestore's
+                self.circuit_breaker.record_abandoned()
+            elif isinstance(e, RETRYABLE_ERRORS):
+                self.circuit_breaker.record_failure()
+            else:
+                # Firestore answered, it just didn't like the request
+                self.circuit_breaker.record_success()
+            raise
+        self.circuit_breaker.record_success()
+        return result
+    
+    def _read(self, key: tuple, fetch):
+        """Run a read, falling back to its last-known-good result if Firestore is unavailable.
+
+        ``key`` identifies the read's shape (collection, document ID or query) and
+        starts with the collection name. Concurrent identical reads share one
+        in-flight Firestore call. Stale answers are flagged on the request state
+        and trigger a background refresh. Last-known-good results are kept in the
+        request company's own stale cache partition.
+        """
+        company_id = current_company()
+        
+        def load():
+            result = fetch()
+            self.stale_cache.put(key, _copy_result(result), company_id)
+            return result
+        
+        try:
+            value, shared = self.single_flight.do(key, load)
+        except RETRYABLE_ERRORS:
+            cached = self.stale_cache.get(key, company_id)
+            if cached is None:
+                raise
+            value, age = cached
+            print(f"Serving stale {key} ({age:.0f}s old) - Firestore unavailable")
+            mark_stale(age)
+            self._revalidate(key, fetch, company_id)
+            return _copy_result(value)
+        return _copy_result(value) if shared else value
+    
+    def add_write_listener(self, collection_name: str, callback) -> None:
+        """Call callback(event, document_id, data) after each successful write to a collection.
+
+        ``event`` is "create", "set", "merge", "update" or "delete"; for "update"
+        and "merge" ``data`` holds only the written fields.
+        """
+        self._write_listeners.setdefault(collection_name, []).append(callback)
+    
+    def notify_write(self, collection_name: str, event: str, document_id: str, data: Optional[dict] = None) -> None:
+        """Report a write committed inside run_transaction to the collection's write listeners"""
+        self._after_write(collection_name, event, document_id, data)
+    
+    def _detach_reads(self, collection_name: str) -> None:
+        self.single_flight.forget(lambda key: key[0] == collection_name)
+    
+    def _after_write(self, collection_name: str, event: str = None, document_id: str = None,
+                     data: Optional[dict] = None) -> None:
+        """Detach in-flight reads of the collection and notify write listeners.
+
+        Reads that start after a write must go to Firestore instead of joining an older flight.
+        """
+        self._detach_reads(collection_name)
+        for callback in self._write_listeners.get(collection_name, []):
+            try:
+                callback(event, document_id, data)
+            except Exception as e:
+                print(f"Write listener for {collection_name} failed: {e}")
+    
+    def _revalidate(self, key: tuple, fetch, company_id: Optional[str] = None) -> None:
+        """Refresh a stale cache entry on a background thread, once per key"""
+        with self._revalidate_lock:
+            if (company_id, key) in self._revalidating:
+                return
+            self._revalidating.add((company_id, key))
+        
+        def refresh():
+            # New threads start with an empty context, so no request deadline applies
+            try:
+                self.stale_cache.put(key, _copy_result(fetch()), company_id)
+            except Exception as e:
+                print(f"Background refresh of {key} failed: {e}")
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard((company_id, key))
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def _tenant(self, collection_name: str) -> Optional[str]:
+        """Company the current request is scoped to, if the collection is tenant scoped"""
+        return current_company() if collection_name in TENANT_SCOPED_COLLECTIONS else None
+    
+    def _check_company(self, collection_name: str, data: dict, stamp: bool) -> dict:
+        """Refuse writes for another company; with stamp=True fill in the request's company"""
+        company_id = self._tenant(collection_name)
+        if company_id is None:
+            return data
+        if data.get("companyId") not in (None, company_id):
+            raise gcp_exceptions.PermissionDenied(
+                f"Cannot write {collection_name} of company {data['companyId']} as company {company_id}")
+        if stamp and data.get("companyId") is None:
+            data = {**data, "companyId": company_id}
+        return data
+    
     def create_user(self, user_data: dict) -> str:
         """Create a new user document"""
         if not self.db:
             raise Exception("Firebase not initialized - please set up credentials")
         try:
             doc_ref = self.db.collection('users').document()
-            doc_ref.set(user_data)
+            # The ID is generated client-side, so retrying the set is safe
+            self._call(lambda timeout: doc_ref.set(user_data, retry=None, timeout=timeout))
+            self._after_write('users', "create", doc_ref.id, user_data)
             return doc_ref.id
         except Exception as e:
             print(f"Error creating user: {e}")
@@ -63,11 +236,12 @@ class FirebaseService:
             raise Exception("Firebase not initialized - please set up credentials")
         try:
             doc_ref = self.db.collection('users').document(user_id)
-            doc = doc_ref.get()
             
-            if doc.exists:
-                return doc.to_dict()
-            return None
+            def fetch():
+                doc = self._call(lambda timeout: doc_ref.get(retry=None, timeout=timeout))
+                return doc.to_dict() if doc.exists else None
+            
+            return self._read(('users', user_id), fetch)
         except Exception as e:
             print(f"Error getting user: {e}")
             raise e
@@ -76,7 +250,8 @@ class FirebaseService:
         """Update a user document"""
         try:
             doc_ref = self.db.collection('users').document(user_id)
-            doc_ref.update(user_data)
+            self._call(lambda timeout: doc_ref.update(user_data, retry=None, timeout=timeout))
+            self._after_write('users', "update", user_id, user_data)
             return True
         except Exception as e:
             print(f"Error updating user: {e}")
@@ -86,7 +261,8 @@ class FirebaseService:
         """Delete a user document"""
         try:
             doc_ref = self.db.collection('users').document(user_id)
-            doc_ref.delete()
+            self._call(lambda timeout: doc_ref.delete(retry=None, timeout=timeout))
+            self._after_write('users', "delete", user_id)
             return True
         except Exception as e:
             print(f"Error deleting user: {e}")
@@ -95,60 +271,214 @@ class FirebaseService:
     def get_all_users(self) -> list:
         """Get all users from the collection"""
         try:
-            users = []
-            docs = self.db.collection('users').stream()
-            
-            for doc in docs:
-                user_data = doc.to_dict()
-                user_data['id'] = doc.id
-                users.append(user_data)
-            
-            return users
+            return self._read(('users',), lambda: self.query_documents('users'))
         except Exception as e:
             print(f"Error getting all users: {e}")
             raise e
     
+    def _buffer(self, writes: list) -> bool:
+        """Queue (kind, collection, document ID, data) writes in the write buffer.
+
+        Returns False when they must be written directly: no buffer, a
+        collection it doesn't take, or a full queue.
+        """
+        return self.write_buffer is not None and self.write_buffer.append(writes)
+    
+    def _drain(self, collections=None) -> None:
+        """Let buffered writes to ``collections`` reach Firestore before a direct write to them"""
+        if self.write_buffer is not None:
+            self.write_buffer.drain(collections)
+    
+    def _commit_buffered(self, change_sets: list) -> None:
+        """Commit a group of buffered change sets in one batch"""
+        batch = self.db.batch()
+        now = datetime.now(timezone.utc)
+        for change_set in change_sets:
+            for kind, collection_name, document_id, data in change_set.writes:
+                doc_ref = self.db.collection(collection_name).document(document_id)
+                if kind == "set":
+                    batch.set(doc_ref, data)
+                elif kind == "update":
+                    batch.update(doc_ref, data)
+                else:
+                    batch.delete(doc_ref)
+                    self.add_tombstone(batch, collection_name, document_id, data)
+            if change_set.increments:
+                # A resent or replayed change set fails on its marker instead of incrementing twice
+                batch.create(self.db.collection(WRITE_MARKER_COLLECTION).document(change_set.key), {
+                    "committedAt": now,
+                    "expiresAt": now + timedelta(days=WRITE_MARKER_TTL_DAYS),
+                })
+        self._call(lambda timeout: batch.commit(retry=None, timeout=timeout))
+    
+    def _on_buffer_flushed(self, collections: set) -> None:
+        for collection_name in collections:
+            self._detach_reads(collection_name)
+    
+    def _overlay(self, collection_name: str, documents: list, field: Optional[str] = None, value=None) -> list:
+        """Query results with this worker's buffered writes to the collection applied.
+
+        ``field``/``value`` is the query's equality filter, so buffered
+        documents that match it are added and ones that no longer do are dropped.
+        """
+        writes = self.write_buffer.pending_writes(collection_name) if self.write_buffer else []
+        if not writes:
+            return documents
+        by_id = {document["id"]: document for document in documents}
+        for kind, document_id, data in writes:
+            if kind == "set":
+                by_id[document_id] = {**data, "id": document_id}
+            elif kind == "update" and document_id in by_id:
+                by_id[document_id] = apply_update(by_id[document_id], data)
+            elif kind == "delete":
+                by_id.pop(document_id, None)
+        return [document for document in by_id.values() if field is None or document.get(field) == value]
+    
+    def _overlay_document(self, collection_name: str, document_id: str, document: Optional[dict]) -> Optional[dict]:
+        writes = self.write_buffer.pending_writes(collection_name) if self.write_buffer else []
+        for kind, written_id, data in writes:
+            if written_id != document_id:
+                continue
+            if kind == "set":
+                document = dict(data)
+            elif kind == "update" and document is not None:
+                document = apply_update(document, data)
+            elif kind == "delete":
+                document = None
+        return document
+    
     def create_document(self, collection_name: str, data: dict) -> str:
         """Create a document in any collection"""
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
+            data = self._check_company(collection_name, data, stamp=True)
             doc_ref = self.db.collection(collection_name).document()
-            doc_ref.set(data)
+            if self._buffer([("set", collection_name, doc_ref.id, data)]):
+                self._after_write(collection_name, "create", doc_ref.id, data)
+                return doc_ref.id
+            self._drain([collection_name])
+            # The ID is generated client-side, so retrying the set is safe
+            self._call(lambda timeout: doc_ref.set(data, retry=None, timeout=timeout))
+            self._after_write(collection_name, "create", doc_ref.id, data)
             return doc_ref.id
         except Exception as e:
             print(f"Error creating document in {collection_name}: {e}")
             raise e
     
-    def get_document(self, collection_name: str, document_id: str) -> Optional[dict]:
-        """Get a document from any collection"""
+    def create_document_with_id(self, collection_name: str, document_id: str, data: dict) -> None:
+        """Create a document with a known ID, raising AlreadyExists if it is taken"""
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
+            data = self._check_company(collection_name, data, stamp=True)
             doc_ref = self.db.collection(collection_name).document(document_id)
-            doc = doc_ref.get()
+            self._drain([collection_name])
+            # Not retried: a lost reply would turn a successful create into AlreadyExists
+            self._call(lambda timeout: doc_ref.create(data, retry=None, timeout=timeout), idempotent=False)
+            self._after_write(collection_name, "create", document_id, data)
+        except Exception as e:
+            print(f"Error creating document {document_id} in {collection_name}: {e}")
+            raise e
+    
+    def set_document(self, collection_name: str, document_id: str, data: dict, merge: bool = False) -> None:
+        """Create or overwrite a document with a known ID"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            data = self._check_company(collection_name, data, stamp=not merge)
+            doc_ref = self.db.collection(collection_name).document(document_id)
+            self._drain([collection_name])
+            self._call(lambda timeout: doc_ref.set(data, merge=merge, retry=None, timeout=timeout))
+            self._after_write(collection_name, "merge" if merge else "set", document_id, data)
+        except Exception as e:
+            print(f"Error setting document {document_id} in {collection_name}: {e}")
+            raise e
+    
+    def run_transaction(self, callback, *args, idempotent: bool = False, writes_to: tuple = ()):
+        """Run callback(transaction, *args) in a Firestore transaction.
+
+        Contention (ABORTED) is retried by firestore.transactional itself. Pass
+        idempotent=True only if re-running an already committed callback is
+        harmless, since a lost commit reply would otherwise apply it twice.
+        ``writes_to`` names collections whose in-flight reads must not be
+        shared past the commit; write listeners are not called, see notify_write.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        # The transaction reads what it writes, so buffered writes to those documents must land first
+        self._drain(writes_to)
+        transactional = firestore.transactional(callback)
+        
+        def attempt(timeout):
+            try:
+                return transactional(self.db.transaction(), *args)
+            except ValueError as e:
+                if isinstance(e.__cause__, gcp_exceptions.Aborted):
+                    raise gcp_exceptions.Aborted(f"Transaction contention: {e}") from e
+                raise
+        
+        try:
+            return self._call(attempt, idempotent=idempotent)
+        except Exception as e:
+            print(f"Error running transaction: {e}")
+            raise e
+        finally:
+            for collection_name in writes_to:
+                self._detach_reads(collection_name)
+    
+    def get_document(self, collection_name: str, document_id: str, allow_stale: bool = True) -> Optional[dict]:
+        """Get a document from any collection.
+
+        With allow_stale=False the read never falls back to last-known-good data.
+        A tenant-scoped document of another company reads as missing.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            doc_ref = self.db.collection(collection_name).document(document_id)
+            
+            def fetch():
+                if self.hedger:
+                    doc = self._call(lambda timeout: self.hedger.call(
+                        lambda: doc_ref.get(retry=None, timeout=timeout)))
+                else:
+                    doc = self._call(lambda timeout: doc_ref.get(retry=None, timeout=timeout))
+                return doc.to_dict() if doc.exists else None
             
-            if doc.exists:
-                return doc.to_dict()
-            return None
+            document = fetch() if not allow_stale else self._read((collection_name, document_id), fetch)
+            document = self._overlay_document(collection_name, document_id, document)
+            company_id = self._tenant(collection_name)
+            if document is not None and company_id is not None and document.get("companyId") not in (None, company_id):
+                return None
+            return document
         except Exception as e:
             print(f"Error getting document from {collection_name}: {e}")
             raise e
     
-    def get_all_documents(self, collection_name: str) -> list:
-        """Get all documents from any collection"""
+    def get_all_documents(self, collection_name: str, company_id: Optional[str] = None,
+                          all_companies: bool = False) -> list:
+        """Get all documents from any collection.
+
+        Tenant-scoped collections only return ``company_id``'s documents, by
+        default the request's company; all_companies=True is for services that
+        index every company themselves.
+        """
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
-            docs = self.db.collection(collection_name).get()
-            documents = []
+            if company_id is None and not all_companies:
+                company_id = self._tenant(collection_name)
+            filters = [("companyId", "==", company_id)] if company_id is not None else []
             
-            for doc in docs:
-                doc_data = doc.to_dict()
-                doc_data['id'] = doc.id
-                documents.append(doc_data)
+            def fetch():
+                return self.query_documents(collection_name, filters)
             
-            return documents
+            key = (collection_name, "companyId", company_id) if company_id is not None else (collection_name,)
+            documents = self._read(key, fetch)
+            if company_id is not None:
+                return self._overlay(collection_name, documents, "companyId", company_id)
+            return self._overlay(collection_name, documents)
         except Exception as e:
             print(f"Error getting documents from {collection_name}: {e}")
             raise e
@@ -158,23 +488,201 @@ class FirebaseService:
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
+            self._check_company(collection_name, data, stamp=False)
+            if self._buffer([("update", collection_name, document_id, data)]):
+                self._after_write(collection_name, "update", document_id, data)
+                return
+            self._drain([collection_name])
             doc_ref = self.db.collection(collection_name).document(document_id)
-            doc_ref.update(data)
+            self._call(lambda timeout: doc_ref.update(data, retry=None, timeout=timeout))
+            self._after_write(collection_name, "update", document_id, data)
         except Exception as e:
             print(f"Error updating document in {collection_name}: {e}")
             raise e
     
-    def delete_document(self, collection_name: str, document_id: str) -> None:
-        """Delete a document from any collection"""
+    def add_tombstone(self, batch, collection_name: str, document_id: str, company_id: Optional[str] = None) -> None:
+        """Record a delete in the same batch so sync clients learn about it.
+
+        The tombstone carries the company whose clients should see the delete;
+        one without a company is not sent to any company.
+        """
+        if collection_name not in SYNCED_COLLECTIONS:
+            return
+        if collection_name == "companies":
+            company_id = document_id
+        now = datetime.now(timezone.utc)
+        batch.set(self.db.collection(TOMBSTONE_COLLECTION).document(f"{collection_name}_{document_id}"), {
+            "collection": collection_name,
+            "documentId": document_id,
+            "companyId": company_id or self._tenant(collection_name),
+            "deletedAt": now,
+            "expiresAt": now + timedelta(days=TOMBSTONE_TTL_DAYS),
+        })
+    
+    def delete_document(self, collection_name: str, document_id: str, company_id: Optional[str] = None) -> None:
+        """Delete a document from any collection.
+
+        ``company_id`` is recorded on the tombstone; without it (or a request
+        company) the document's own companyId is read first.
+        """
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
             doc_ref = self.db.collection(collection_name).document(document_id)
-            doc_ref.delete()
+            self._drain([collection_name])
+            company_id = company_id or self._tenant(collection_name)
+            if company_id is None and collection_name in SYNCED_COLLECTIONS and collection_name != "companies":
+                snapshot = self._call(lambda timeout: doc_ref.get(retry=None, timeout=timeout))
+                company_id = (snapshot.to_dict() or {}).get("companyId") if snapshot.exists else None
+            batch = self.db.batch()
+            batch.delete(doc_ref)
+            self.add_tombstone(batch, collection_name, document_id, company_id)
+            self._call(lambda timeout: batch.commit(retry=None, timeout=timeout))
+            self._after_write(collection_name, "delete", document_id)
         except Exception as e:
             print(f"Error deleting document from {collection_name}: {e}")
             raise e
     
+    def delete_documents(self, collection_name: str, document_ids: list, company_id: Optional[str] = None,
+                         keyed_by: tuple = ()) -> None:
+        """Delete many documents of one company from a collection in batches of 500 writes.
+
+        ``keyed_by`` names collections whose documents share these IDs (such as
+        a transaction's customer visit); they are deleted in the same batches.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            collection_names = [collection_name, *keyed_by]
+            self._drain(collection_names)
+            writes_per_document = sum(2 if name in SYNCED_COLLECTIONS else 1 for name in collection_names)
+            chunk_size = 500 // writes_per_document
+            for i in range(0, len(document_ids), chunk_size):
+                chunk = document_ids[i:i + chunk_size]
+                batch = self.db.batch()
+                for document_id in chunk:
+                    for name in collection_names:
+                        batch.delete(self.db.collection(name).document(document_id))
+                        self.add_tombstone(batch, name, document_id, company_id)
+                # Deletes are idempotent, so a batch whose reply was lost can be resent
+                self._call(lambda timeout: batch.commit(retry=None, timeout=timeout))
+                for document_id in chunk:
+                    for name in collection_names:
+                        self._after_write(name, "delete", document_id)
+        except Exception as e:
+            print(f"Error deleting documents from {collection_name}: {e}")
+            raise e
+    
+    def new_document_id(self, collection_name: str) -> str:
+        """A fresh auto-generated document ID, for writes that are batched"""
+        return self.db.collection(collection_name).document().id
+    
+    def commit_changes(self, collection_name: str, sets: Optional[dict] = None, updates: Optional[dict] = None,
+                       deletes: Optional[list] = None, related_updates: Optional[dict] = None) -> None:
+        """Apply document sets, updates and deletes to a collection in one atomic batch.
+
+        ``sets`` and ``updates`` map document IDs to data; ``related_updates``
+        maps (collection, document ID) to updates of other documents that must
+        commit together with them, such as Increment deltas on a parent. Callers
+        keep the total under Firestore's 500 writes per batch (deletes of synced
+        collections count twice, for their tombstones). With the write buffer
+        on, changes to buffered collections are acknowledged once logged
+        locally and reach Firestore a few milliseconds later in a grouped batch.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        sets, updates, deletes = sets or {}, updates or {}, deletes or []
+        related_updates = related_updates or {}
+        if not (sets or updates or deletes or related_updates):
+            return
+        try:
+            for document_id, data in sets.items():
+                sets[document_id] = self._check_company(collection_name, data, stamp=True)
+            for data in updates.values():
+                self._check_company(collection_name, data, stamp=False)
+            writes = ([("set", collection_name, document_id, data) for document_id, data in sets.items()]
+                      + [("update", collection_name, document_id, data) for document_id, data in updates.items()]
+                      + [("delete", collection_name, document_id, self._tenant(collection_name))
+                         for document_id in deletes]
+                      + [("update", other_collection, document_id, data)
+                         for (other_collection, document_id), data in related_updates.items()])
+            if not self._buffer(writes):
+                self._drain({collection_name, *(other for other, _ in related_updates)})
+                collection = self.db.collection(collection_name)
+                batch = self.db.batch()
+                for document_id, data in sets.items():
+                    batch.set(collection.document(document_id), data)
+                for document_id, data in updates.items():
+                    batch.update(collection.document(document_id), data)
+                for document_id in deletes:
+                    batch.delete(collection.document(document_id))
+                    self.add_tombstone(batch, collection_name, document_id)
+                for (other_collection, document_id), data in related_updates.items():
+                    batch.update(self.db.collection(other_collection).document(document_id), data)
+                # Increments must not be applied twice, so only plain writes are resent
+                self._call(lambda timeout: batch.commit(retry=None, timeout=timeout), idempotent=not related_updates)
+            for document_id, data in sets.items():
+                self._after_write(collection_name, "set", document_id, data)
+            for document_id, data in updates.items():
+                self._after_write(collection_name, "update", document_id, data)
+            for document_id in deletes:
+                self._after_write(collection_name, "delete", document_id)
+            for (other_collection, document_id), data in related_updates.items():
+                self._after_write(other_collection, "update", document_id, data)
+        except Exception as e:
+            print(f"Error committing changes to {collection_name}: {e}")
+            raise e
+    
+    def get_document_ids(self, collection_name: str, field: str, op: str, value, limit: int) -> list:
+        """IDs of up to ``limit`` documents matching one filter, from a keys-only query"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            documents = self.query_documents(collection_name, [(field, op, value)], limit=limit, fields=["__name__"])
+            return [document["id"] for document in documents]
+        except Exception as e:
+            print(f"Error getting document IDs from {collection_name}: {e}")
+            raise e
+    
+    def bulk_delete(self, collection_name: str, document_ids: list, company_id: Optional[str] = None) -> int:
+        """Delete documents with a BulkWriter and return how many writes failed.
+
+        The BulkWriter sends batches in parallel, throttled to
+        BULK_WRITE_OPS_PER_SECOND, and retries failed writes with backoff.
+        Unlike delete_documents the writes are not atomic. ``company_id``
+        is recorded on tombstones when there is no request to take it from.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            ops_per_second = int(os.getenv("BULK_WRITE_OPS_PER_SECOND", 500))
+            writer = self.db.bulk_writer(BulkWriterOptions(initial_ops_per_second=ops_per_second,
+                                                           max_ops_per_second=ops_per_second))
+            max_attempts = int(os.getenv("BULK_WRITE_MAX_ATTEMPTS", 10))
+            failures = []
+            
+            def on_error(failure, _writer) -> bool:
+                if failure.attempts < max_attempts:
+                    return True
+                failures.append(failure.message)
+                return False
+            
+            writer.on_write_error(on_error)
+            self._drain([collection_name])
+            collection = self.db.collection(collection_name)
+            for document_id in document_ids:
+                writer.delete(collection.document(document_id))
+                self.add_tombstone(writer, collection_name, document_id, company_id)
+            writer.close()
+            if failures:
+                print(f"{len(failures)} bulk deletes from {collection_name} failed, e.g. {failures[0]}")
+            for document_id in document_ids:
+                self._after_write(collection_name, "delete", document_id)
+            return len(failures)
+        except Exception as e:
+            print(f"Error bulk deleting documents from {collection_name}: {e}")
+            raise e
+    
     # Transaction-specific methods
     def create_transaction(self, transaction_data: dict) -> str:
         """Create a new transaction document"""
@@ -206,18 +714,28 @@ class FirebaseService:
         if not self.db:
             raise Exception("Firebase not initialized")
         try:
-            lines_ref = self.db.collection("transaction_lines").where("transactionId", "==", transaction_id)
-            docs = lines_ref.stream()
-            lines = []
-            for doc in docs:
-                line_data = doc.to_dict()
-                line_data['id'] = doc.id
-                lines.append(line_data)
-            return lines
+            def fetch():
+                return self.query_documents("transaction_lines", [("transactionId", "==", transaction_id)])
+            
+            lines = self._read(("transaction_lines", "transactionId", transaction_id), fetch)
+            return self._overlay("transaction_lines", lines, "transactionId", transaction_id)
         except Exception as e:
             print(f"Error getting transaction lines: {e}")
             raise e
     
+    def get_payments(self, transaction_id: str) -> list:
+        """Get all payments recorded against a transaction"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            def fetch():
+                return self.query_documents("payments", [("transactionId", "==", transaction_id)])
+            
+            return self._read(("payments", "transactionId", transaction_id), fetch)
+        except Exception as e:
+            print(f"Error getting payments: {e}")
+            raise e
+    
     def update_transaction_line(self, line_id: str, line_data: dict) -> None:
         """Update a transaction line"""
         self.update_document("transaction_lines", line_id, line_data)
@@ -225,6 +743,210 @@ class FirebaseService:
     def delete_transaction_line(self, line_id: str) -> None:
         """Delete a transaction line"""
         self.delete_document("transaction_lines", line_id)
+    
+    def query_documents(self, collection_name: str, filters=(), order_by=(), limit: Optional[int] = None,
+                        fields: Optional[list] = None, start_after: Optional[dict] = None) -> list:
+        """Run a query and return its documents, each with its ``id``.
+
+        ``filters`` are (field, op, value) and ``order_by`` (field, direction)
+        tuples; ``fields`` limits the transfer to those columns. Every query
+        is recorded in ``query_stats`` by its shape, with latency and result size.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        query = self.db.collection(collection_name)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        for field, direction in order_by:
+            query = query.order_by(field, direction=direction)
+        if limit is not None:
+            query = query.limit(limit)
+        if start_after:
+            query = query.start_after(start_after)
+        if fields:
+            query = query.select(fields)
+        shape = query_shape(collection_name, filters, order_by, limit)
+        started = time.perf_counter()
+        try:
+            docs = self._call(lambda timeout: list(query.stream(retry=None, timeout=timeout)))
+        except Exception as e:
+            self.query_stats.record(shape, time.perf_counter() - started, 0, e)
+            raise
+        self.query_stats.record(shape, time.perf_counter() - started, len(docs))
+        results = []
+        for doc in docs:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            results.append(data)
+        return results
+    
+    # Reporting queries. Results can be very large, so they skip the stale cache
+    # and read coalescing, and ``fields`` limits the transfer to the columns needed.
+    
+    def get_transactions_between(self, company_id: str, start, end, fields: Optional[list] = None) -> list:
+        """Get a company's transactions with start <= transactionDate < end"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            return self.query_documents("transactions", [
+                ("companyId", "==", company_id),
+                ("transactionDate", ">=", start),
+                ("transactionDate", "<", end),
+            ], fields=fields)
+        except Exception as e:
+            print(f"Error getting transactions between {start} and {end}: {e}")
+            raise e
+    
+    def get_transactions_before(self, cutoff, statuses: list, limit: int) -> list:
+        """Get up to ``limit`` transactions in the given statuses dated before cutoff"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            return self.query_documents("transactions", [
+                ("status", "in", statuses),
+                ("transactionDate", "<", cutoff),
+            ], limit=limit)
+        except Exception as e:
+            print(f"Error getting transactions before {cutoff}: {e}")
+            raise e
+    
+    def get_transaction_lines_between(self, company_id: str, start, end, fields: Optional[list] = None) -> list:
+        """Get a company's transaction lines by their (denormalized) transactionDate"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            return self.query_documents("transaction_lines", [
+                ("companyId", "==", company_id),
+                ("transactionDate", ">=", start),
+                ("transactionDate", "<", end),
+            ], fields=fields)
+        except Exception as e:
+            print(f"Error getting transaction lines between {start} and {end}: {e}")
+            raise e
+    
+    def get_documents_updated_since(self, collection_name: str, since=None, fields: Optional[list] = None,
+                                    company_id: Optional[str] = None) -> list:
+        """Get documents with updatedAt > since (the whole collection when since is None)"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            filters = []
+            if company_id is not None:
+                filters.append(("companyId", "==", company_id))
+            if since is not None:
+                filters.append(("updatedAt", ">", since))
+            return self.query_documents(collection_name, filters, fields=fields)
+        except Exception as e:
+            print(f"Error getting {collection_name} updated since {since}: {e}")
+            raise e
+    
+    def aggregate_transactions(self, company_id: str, start, end, groups: dict) -> dict:
+        """Server-side count and sums of total and tip per group.
+
+        ``groups`` maps a field to the values to aggregate separately, e.g.
+        {"status": [...], "paymentMethod": [...]}; the result is keyed the same
+        way. Covers a company's transactions with start <= transactionDate < end.
+        All aggregation queries run concurrently and only the aggregates cross
+        the wire.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            base = (self.db.collection("transactions")
+                    .where("companyId", "==", company_id)
+                    .where("transactionDate", ">=", start)
+                    .where("transactionDate", "<", end))
+            
+            def aggregate(field, value):
+                query = (base.where(field, "==", value)
+                         .count(alias="count").sum("total", alias="total").sum("tip", alias="tips"))
+                shape = query_shape("transactions", [("companyId", "==", None), (field, "==", None),
+                                                     ("transactionDate", ">=", None), ("transactionDate", "<", None)],
+                                    aggregate=True)
+                started = time.perf_counter()
+                try:
+                    results = self._call(lambda timeout: query.get(retry=None, timeout=timeout))
+                except Exception as e:
+                    self.query_stats.record(shape, time.perf_counter() - started, 0, e)
+                    raise
+                self.query_stats.record(shape, time.perf_counter() - started, 1)
+                return {result.alias: result.value or 0 for result in results[0]}
+            
+            def fetch():
+                futures = {
+                    (field, value): self.query_executor.submit(contextvars.copy_context().run, aggregate, field, value)
+                    for field, values in groups.items() for value in values
+                }
+                summary = {field: {} for field in groups}
+                for (field, value), future in futures.items():
+                    summary[field][value] = future.result()
+                return summary
+            
+            key = tuple((field, tuple(values)) for field, values in groups.items())
+            return self._read(("transactions", "aggregate", company_id, start, end, key), fetch)
+        except Exception as e:
+            print(f"Error aggregating transactions: {e}")
+            raise e
+    
+    def get_tombstones_since(self, collection_names: list, since, company_id: Optional[str] = None) -> list:
+        """Get deletes recorded in the given collections after since (only company_id's when given)"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            filters = [("collection", "in", list(collection_names))]
+            if company_id is not None:
+                filters.append(("companyId", "==", company_id))
+            filters.append(("deletedAt", ">", since))
+            return self.query_documents(TOMBSTONE_COLLECTION, filters,
+                                        fields=["collection", "documentId", "companyId", "deletedAt"])
+        except Exception as e:
+            print(f"Error getting tombstones since {since}: {e}")
+            raise e
+    
+    def get_lines_for_transactions(self, transaction_ids: list, fields: Optional[list] = None) -> list:
+        """Get the lines of many transactions (30 per query, Firestore's "in" limit)"""
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            lines = []
+            for i in range(0, len(transaction_ids), 30):
+                lines.extend(self.query_documents("transaction_lines", [("transactionId", "in", transaction_ids[i:i + 30])],
+                                                  fields=fields))
+            return lines
+        except Exception as e:
+            print(f"Error getting lines for transactions: {e}")
+            raise e
+    
+    # Customer methods
+    def get_customer_visits(self, customer_id: str, limit: int, start_after: Optional[dict] = None) -> list:
+        """Get a page of a customer's visits, newest first.
+
+        ``start_after`` holds the transactionDate and transactionId of the last
+        visit on the previous page.
+        """
+        if not self.db:
+            raise Exception("Firebase not initialized")
+        try:
+            def fetch():
+                return self.query_documents(
+                    "customer_visits", [("customerId", "==", customer_id)],
+                    order_by=[("transactionDate", firestore.Query.DESCENDING),
+                              ("transactionId", firestore.Query.DESCENDING)],
+                    limit=limit, start_after=start_after)
+            
+            cursor = tuple(sorted(start_after.items())) if start_after else None
+            return self._read(("customer_visits", "customerId", customer_id, limit, cursor), fetch)
+        except Exception as e:
+            print(f"Error getting customer visits: {e}")
+            raise e
+
+def _copy_result(value):
+    """Shallow-copy read results so callers can't mutate cached copies"""
+    if isinstance(value, list):
+        return [dict(item) for item in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
 
 # Create a singleton instance
 firebase_service = FirebaseService()
\ No newline at end of file
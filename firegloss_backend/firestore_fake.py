@@ -0,0 +1,558 @@
+import copy
+import random
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud.firestore_v1.transforms import Increment
+
+
+def _auto_id() -> str:
+    """Generate a 20 character document ID like Firestore does"""
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(random.choice(alphabet) for _ in range(20))
+
+
+def _get_field(data: dict, field_path: str):
+    """Resolve a dotted field path inside a document"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _encode(value):
+    """Deep-copy a value the way Firestore stores it (naive datetimes are UTC)"""
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return copy.deepcopy(value)
+
+
+def _apply_write(existing: Optional[dict], data: dict) -> dict:
+    """Field values for a write; Increment transforms add to the stored number (or zero)"""
+    result = dict(existing or {})
+    for field, value in data.items():
+        if isinstance(value, Increment):
+            current = result.get(field)
+            result[field] = (current if isinstance(current, (int, float)) else 0) + value.value
+        else:
+            result[field] = _encode(value)
+    return result
+
+
+def _after_cursor(data: dict, orders: list, cursor: dict) -> bool:
+    """Whether a document sorts strictly after a start_after cursor"""
+    for field_path, direction in orders:
+        value, bound = _get_field(data, field_path), cursor.get(field_path)
+        if value == bound:
+            continue
+        return value < bound if direction == 'DESCENDING' else value > bound
+    return False
+
+
+def _matches(value, op: str, expected) -> bool:
+    """Evaluate a single Firestore filter operator"""
+    if op == '==':
+        return value == expected
+    if op == '!=':
+        return value is not None and value != expected
+    if op == 'in':
+        return value in expected
+    if op == 'not-in':
+        return value is not None and value not in expected
+    if op == 'array-contains':
+        return isinstance(value, list) and expected in value
+    if op == 'array-contains-any':
+        return isinstance(value, list) and any(v in value for v in expected)
+    if value is None:
+        return False
+    try:
+        if op == '<':
+            return value < expected
+        if op == '<=':
+            return value <= expected
+        if op == '>':
+            return value > expected
+        if op == '>=':
+            return value >= expected
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class FakeDocumentSnapshot:
+    """Snapshot returned by FakeDocumentReference.get() and queries"""
+
+    def __init__(self, reference, data: Optional[dict], update_time: Optional[datetime] = None):
+        self.reference = reference
+        self.id = reference.id
+        self.update_time = update_time
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        if self._data is None:
+            return None
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        return _get_field(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    """In-memory stand-in for google.cloud.firestore.DocumentReference"""
+
+    def __init__(self, client, collection_name: str, document_id: str):
+        self._client = client
+        self._collection_name = collection_name
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection_name}/{self.id}"
+
+    def get(self, transaction=None, **kwargs) -> FakeDocumentSnapshot:
+        self._client._rpc(kwargs.get('timeout'))
+        with self._client._lock:
+            snapshot = self._client._snapshot(self)
+        if transaction is not None:
+            transaction._record_read(self, snapshot.update_time)
+        return snapshot
+
+    def set(self, data: dict, merge: bool = False, **kwargs) -> None:
+        self._client._rpc(kwargs.get('timeout'))
+        self._client._commit_writes([('set', self, data, merge)])
+
+    def create(self, data: dict, **kwargs) -> None:
+        self._client._rpc(kwargs.get('timeout'))
+        self._client._commit_writes([('create', self, data, False)])
+
+    def update(self, data: dict, **kwargs) -> None:
+        self._client._rpc(kwargs.get('timeout'))
+        self._client._commit_writes([('update', self, data, False)])
+
+    def delete(self, **kwargs) -> None:
+        self._client._rpc(kwargs.get('timeout'))
+        self._client._commit_writes([('delete', self, None, False)])
+
+
+class FakeTransaction:
+    """Optimistic transaction compatible with firestore.transactional.
+
+    Reads record the document's update time; commit aborts (and the decorator
+    retries) if any of them changed in the meantime, like Firestore's
+    server-side conflict detection.
+    """
+
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client):
+        self._client = client
+        self._id = None
+        self._reads = {}
+        self._writes = []
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+    def _clean_up(self) -> None:
+        self._id = None
+        self._reads = {}
+        self._writes = []
+
+    def _begin(self, retry_id=None) -> None:
+        self._id = _auto_id()
+
+    def _record_read(self, reference, update_time) -> None:
+        self._reads.setdefault((reference._collection_name, reference.id), update_time)
+
+    def _commit(self) -> list:
+        self._client._rpc()
+        try:
+            self._client._commit_writes(self._writes, reads=self._reads)
+        finally:
+            self._clean_up()
+        return []
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return ref_or_query.get(transaction=self, **kwargs)
+        snapshots = ref_or_query.get(**kwargs)
+        for snapshot in snapshots:
+            self._record_read(snapshot.reference, snapshot.update_time)
+        return iter(snapshots)
+
+    def set(self, reference, data: dict, merge: bool = False) -> None:
+        self._writes.append(('set', reference, data, merge))
+
+    def create(self, reference, data: dict) -> None:
+        self._writes.append(('create', reference, data, False))
+
+    def update(self, reference, data: dict, option=None) -> None:
+        self._writes.append(('update', reference, data, False))
+
+    def delete(self, reference, option=None) -> None:
+        self._writes.append(('delete', reference, None, False))
+
+
+class FakeWriteBatch:
+    """Up to 500 writes committed atomically in one round trip"""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    def set(self, reference, data: dict, merge: bool = False):
+        self._writes.append(('set', reference, data, merge))
+        return self
+
+    def create(self, reference, data: dict):
+        self._writes.append(('create', reference, data, False))
+        return self
+
+    def update(self, reference, data: dict, option=None):
+        self._writes.append(('update', reference, data, False))
+        return self
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, False))
+        return self
+
+    def commit(self, **kwargs) -> list:
+        if len(self._writes) > 500:
+            raise gcp_exceptions.InvalidArgument("A write batch can contain at most 500 operations")
+        self._client._rpc(kwargs.get('timeout'))
+        self._client._commit_writes(self._writes)
+        return []
+
+
+class FakeBulkWriteFailure:
+    """What a BulkWriter error callback receives"""
+
+    def __init__(self, operation, error: Exception, attempts: int):
+        self.operation = operation
+        self.code = getattr(error, 'grpc_status_code', None)
+        self.message = str(error)
+        self.attempts = attempts
+
+
+class FakeBulkWriter:
+    """Writes sent in parallel batches of 20; unlike a WriteBatch they are not atomic.
+
+    A failed write is retried while the on_write_error callback returns True
+    (by default up to 15 attempts, like the real BulkWriter).
+    """
+
+    batch_size = 20
+
+    def __init__(self, client, options=None):
+        self._client = client
+        self._operations = []
+        self._on_error = lambda failure, writer: failure.attempts < 15
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fake-bulk-writer")
+
+    def on_write_error(self, callback) -> None:
+        self._on_error = callback
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._operations.append(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data: dict):
+        self._operations.append(('create', reference, document_data, False))
+
+    def update(self, reference, field_updates: dict, option=None):
+        self._operations.append(('update', reference, field_updates, False))
+
+    def delete(self, reference, option=None):
+        self._operations.append(('delete', reference, None, False))
+
+    def _send(self, operations: list) -> None:
+        """One round trip for the batch; each write succeeds or fails on its own"""
+        attempts = 0
+        while operations:
+            attempts += 1
+            try:
+                self._client._rpc()
+            except gcp_exceptions.GoogleAPICallError as e:
+                operations = [op for op in operations if self._on_error(FakeBulkWriteFailure(op, e, attempts), self)]
+                continue
+            failed = []
+            for operation in operations:
+                try:
+                    self._client._commit_writes([operation])
+                except gcp_exceptions.GoogleAPICallError as e:
+                    if self._on_error(FakeBulkWriteFailure(operation, e, attempts), self):
+                        failed.append(operation)
+            operations = failed
+
+    def flush(self) -> None:
+        operations, self._operations = self._operations, []
+        batches = [operations[i:i + self.batch_size] for i in range(0, len(operations), self.batch_size)]
+        for future in [self._executor.submit(self._send, batch) for batch in batches]:
+            future.result()
+
+    def close(self) -> None:
+        self.flush()
+        self._executor.shutdown()
+
+
+class FakeQuery:
+    """Filtered, ordered and limited view over a fake collection"""
+
+    def __init__(self, client, collection_name: str, filters=None, orders=None, limit_count=None,
+                 start_after=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit_count
+        self._start_after = start_after
+        self._projection = None
+
+    def _copy(self, **changes):
+        query = FakeQuery(self._client, self._collection_name,
+                          list(self._filters), list(self._orders), self._limit, self._start_after)
+        query._projection = self._projection
+        for key, value in changes.items():
+            setattr(query, key, value)
+        return query
+
+    def where(self, field_path: str = None, op_string: str = None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(_filters=self._filters + [(field_path, op_string, _encode(value))])
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING'):
+        return self._copy(_orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count: int):
+        return self._copy(_limit=count)
+
+    def select(self, field_paths):
+        return self._copy(_projection=list(field_paths))
+
+    def start_after(self, document_fields):
+        if isinstance(document_fields, FakeDocumentSnapshot):
+            document_fields = document_fields.to_dict()
+        return self._copy(_start_after=_encode(dict(document_fields)))
+
+    def _run(self, timeout: Optional[float] = None) -> list:
+        self._client._rpc(timeout)
+        with self._client._lock:
+            documents = self._client._collection(self._collection_name)
+            results = []
+            update_times = self._client._update_times
+            for document_id, data in documents.items():
+                if all(_matches(_get_field(data, f), op, v) for f, op, v in self._filters):
+                    results.append((document_id, copy.deepcopy(data),
+                                    update_times.get((self._collection_name, document_id))))
+        for field_path, direction in reversed(self._orders):
+            results = [r for r in results if _get_field(r[1], field_path) is not None]
+            results.sort(key=lambda r: _get_field(r[1], field_path),
+                         reverse=direction == 'DESCENDING')
+        if self._start_after is not None:
+            results = [r for r in results if _after_cursor(r[1], self._orders, self._start_after)]
+        if self._limit is not None:
+            results = results[:self._limit]
+        if self._projection is not None:
+            results = [(document_id, {f: data[f] for f in self._projection if f in data}, update_time)
+                       for document_id, data, update_time in results]
+        return [
+            FakeDocumentSnapshot(
+                FakeDocumentReference(self._client, self._collection_name, document_id), data, update_time
+            )
+            for document_id, data, update_time in results
+        ]
+
+    def get(self, **kwargs) -> list:
+        return self._run(kwargs.get('timeout'))
+
+    def stream(self, **kwargs):
+        return iter(self._run(kwargs.get('timeout')))
+
+    def count(self, alias: Optional[str] = None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None):
+        return FakeAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None):
+        return FakeAggregationQuery(self).avg(field_ref, alias)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias: str, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """Server-side count/sum/avg over a fake query, answered in one round trip"""
+
+    def __init__(self, query: FakeQuery):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind: str, field_ref: Optional[str], alias: Optional[str]):
+        self._aggregations.append((kind, field_ref, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias: Optional[str] = None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None):
+        return self._add('sum', field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None):
+        return self._add('avg', field_ref, alias)
+
+    def get(self, **kwargs) -> list:
+        documents = [snapshot.to_dict() for snapshot in self._query._run(kwargs.get('timeout'))]
+        results = []
+        for kind, field_ref, alias in self._aggregations:
+            if kind == 'count':
+                value = len(documents)
+            else:
+                numbers = [v for v in (_get_field(d, field_ref) for d in documents)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == 'sum':
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+
+class FakeCollectionReference(FakeQuery):
+    """In-memory stand-in for google.cloud.firestore.CollectionReference"""
+
+    def __init__(self, client, collection_name: str):
+        super().__init__(client, collection_name)
+        self.id = collection_name
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._collection_name, document_id or _auto_id())
+
+
+class FakeFirestore:
+    """In-memory implementation of the Firestore client subset used by FirebaseService.
+
+    Every document read, write and query sleeps for ``latency`` seconds (plus up
+    to ``jitter`` seconds of uniform noise) to imitate a network round trip, and
+    fails with UNAVAILABLE at ``error_rate``. RPCs slower than the caller's
+    ``timeout`` raise DeadlineExceeded like a gRPC deadline would.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rpc_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._data = {}
+        self._update_times = {}
+        self._last_update_time = datetime.now(timezone.utc)
+
+    def _collection(self, collection_name: str) -> dict:
+        return self._data.setdefault(collection_name, {})
+
+    def _snapshot(self, reference: FakeDocumentReference) -> FakeDocumentSnapshot:
+        key = (reference._collection_name, reference.id)
+        data = self._collection(reference._collection_name).get(reference.id)
+        return FakeDocumentSnapshot(reference, copy.deepcopy(data), self._update_times.get(key))
+
+    def _commit_writes(self, writes: list, reads: Optional[dict] = None) -> None:
+        """Validate and apply a group of writes atomically.
+
+        ``reads`` maps (collection, id) to the update time a transaction saw;
+        any change since then aborts the whole commit.
+        """
+        with self._lock:
+            for key, seen in (reads or {}).items():
+                if self._update_times.get(key) != seen:
+                    raise gcp_exceptions.Aborted(f"Transaction conflict on {key[0]}/{key[1]}")
+
+            exists = {}
+            for kind, reference, _, _ in writes:
+                key = (reference._collection_name, reference.id)
+                present = exists.get(key, reference.id in self._collection(reference._collection_name))
+                if kind == 'create' and present:
+                    raise gcp_exceptions.AlreadyExists(f"Document already exists: {reference.path}")
+                if kind == 'update' and not present:
+                    raise gcp_exceptions.NotFound(f"No document to update: {reference.path}")
+                exists[key] = kind != 'delete'
+
+            now = max(datetime.now(timezone.utc), self._last_update_time + timedelta(microseconds=1))
+            self._last_update_time = now
+            for kind, reference, data, merge in writes:
+                documents = self._collection(reference._collection_name)
+                key = (reference._collection_name, reference.id)
+                if kind == 'delete':
+                    documents.pop(reference.id, None)
+                    self._update_times.pop(key, None)
+                    continue
+                if kind == 'update' or (kind == 'set' and merge and reference.id in documents):
+                    documents[reference.id] = _apply_write(documents[reference.id], data)
+                else:
+                    documents[reference.id] = _apply_write(None, data)
+                self._update_times[key] = now
+
+    def _rpc(self, timeout: Optional[float] = None) -> None:
+        """Account for and simulate one round trip to Firestore"""
+        with self._lock:
+            self.rpc_count += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise gcp_exceptions.DeadlineExceeded("Deadline Exceeded")
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise gcp_exceptions.ServiceUnavailable("Injected fake Firestore failure")
+
+    def collection(self, collection_name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, collection_name)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def bulk_writer(self, options=None) -> FakeBulkWriter:
+        return FakeBulkWriter(self, options)
+
+    def reset(self) -> None:
+        """Drop all stored documents and counters"""
+        with self._lock:
+            self._data.clear()
+            self._update_times.clear()
+            self.rpc_count = 0
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from google.api_core import exceptions as gcp_exceptions
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+
+from resilience import RETRYABLE_ERRORS
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+
+# Endpoints that honour the Idempotency-Key header
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/transactions$")),
+    ("POST", re.compile(r"^/transactions/[^/]+/lines$")),
+    # A retried "next customer" must not take a second ticket
+    ("POST", re.compile(r"^/queue/next$")),
+]
+
+# Responses that must not be replayed: the client should be free to retry them
+_NOT_STORED = {409, 429}
+
+
+class IdempotencyConflict(Exception):
+    """The key is being processed right now, or was used for a different request"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IdempotencyStore:
+    """Remembers the first response for each Idempotency-Key.
+
+    Recent keys live in a bounded, expiring in-memory LRU; every key is also
+    claimed and recorded in Firestore so retries that land on another worker
+    replay the same response. Records carry an ``expiresAt`` field suitable for
+    a Firestore TTL policy.
+    """
+
+    def __init__(self, firebase_service, ttl: float = 86400, max_entries: int = 10000,
+                 pending_timeout: float = 30, persist: bool = True):
+        self.firebase_service = firebase_service
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pending_timeout = pending_timeout
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def record_id(scope: str, key: str) -> str:
+        return hashlib.sha256(f"{scope}\n{key}".encode()).hexdigest()
+
+    def _local_get(self, record_id: str) -> Optional[dict]:
+        entry = self._entries.get(record_id)
+        if entry is None:
+            return None
+        if entry["expires"] < time.time():
+            del self._entries[record_id]
+            return None
+        self._entries.move_to_end(record_id)
+        return entry
+
+    def _local_put(self, record_id: str, entry: dict) -> None:
+        self._entries[record_id] = entry
+        self._entries.move_to_end(record_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _check(self, entry: dict, fingerprint: str) -> Optional[dict]:
+        if entry["fingerprint"] != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request", 422)
+        if entry["status"] == "complete":
+            return entry["response"]
+        raise IdempotencyConflict("A request with this Idempotency-Key is still in progress", 409)
+
+    def begin(self, record_id: str, fingerprint: str) -> Optional[dict]:
+        """Claim a key. Returns the stored response to replay, or None to execute the request."""
+        now = time.time()
+        with self._lock:
+            entry = self._local_get(record_id)
+            if entry is not None:
+                return self._check(entry, fingerprint)
+            # Claim locally first so concurrent duplicates on this worker see it
+            self._local_put(record_id, {"fingerprint": fingerprint, "status": "pending",
+                                        "response": None, "expires": now + self.ttl})
+        if not self.persist:
+            return None
+
+        claim = {
+            "fingerprint": fingerprint,
+            "status": "pending",
+            "claimedAt": datetime.now(timezone.utc),
+            "expiresAt": datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+        }
+        try:
+            self.firebase_service.create_document_with_id(IDEMPOTENCY_COLLECTION, record_id, claim)
+            return None
+        except gcp_exceptions.AlreadyExists:
+            pass
+        except Exception:
+            self._forget(record_id)
+            raise
+
+        stored = self.firebase_service.get_document(IDEMPOTENCY_COLLECTION, record_id, allow_stale=False)
+        if stored is None or stored["expiresAt"].timestamp() < now:
+            # Expired (or deleted by TTL) between our create and read: take it over
+            self.firebase_service.set_document(IDEMPOTENCY_COLLECTION, record_id, claim)
+            return None
+        if stored["status"] == "pending" and stored["claimedAt"].timestamp() < now - self.pending_timeout:
+            # The worker that claimed it died mid-request
+            self.firebase_service.set_document(IDEMPOTENCY_COLLECTION, record_id, claim)
+            return None
+
+        entry = {"fingerprint": stored["fingerprint"], "status": stored["status"],
+                 "response": stored.get("response"), "expires": stored["expiresAt"].timestamp()}
+        with self._lock:
+            if entry["status"] == "complete":
+                self._local_put(record_id, entry)
+            else:
+                self._entries.pop(record_id, None)
+        return self._check(entry, fingerprint)
+
+    def complete(self, record_id: str, fingerprint: str, response: dict) -> None:
+        """Store the response to replay for later retries"""
+        with self._lock:
+            self._local_put(record_id, {"fingerprint": fingerprint, "status": "complete",
+                                        "response": response, "expires": time.time() + self.ttl})
+        if self.persist:
+            self.firebase_service.update_document(IDEMPOTENCY_COLLECTION, record_id, {
+                "status": "complete",
+                "response": response,
+            })
+
+    def abandon(self, record_id: str) -> None:
+        """Release a claim so the request can be retried (it failed without a replayable answer)"""
+        self._forget(record_id)
+        if self.persist:
+            try:
+                self.firebase_service.delete_document(IDEMPOTENCY_COLLECTION, record_id)
+            except Exception as e:
+                print(f"Error releasing idempotency key {record_id}: {e}")
+
+    def _forget(self, record_id: str) -> None:
+        with self._lock:
+            self._entries.pop(record_id, None)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware replaying the stored response for a repeated Idempotency-Key.
+
+    Written as plain ASGI (not BaseHTTPMiddleware) because it has to read the
+    request body and then hand it on to the endpoint.
+    """
+
+    def __init__(self, app, store: IdempotencyStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        key = headers.get(b"idempotency-key")
+        method, path = scope["method"], scope["path"]
+        if not key or not any(method == m and pattern.match(path) for m, pattern in IDEMPOTENT_ROUTES):
+            return await self.app(scope, receive, send)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        record_id = self.store.record_id(f"{method} {path}", key.decode("latin-1"))
+        fingerprint = hashlib.sha256(body).hexdigest()
+        try:
+            stored = await run_in_threadpool(self.store.begin, record_id, fingerprint)
+        except IdempotencyConflict as e:
+            headers = {"Retry-After": "1"} if e.status_code == 409 else None
+            return await JSONResponse({"detail": str(e)}, status_code=e.status_code, headers=headers)(scope, receive, send)
+        except RETRYABLE_ERRORS as e:
+            return await JSONResponse({"detail": str(e)}, status_code=503,
+                                      headers={"Retry-After": "1"})(scope, receive, send)
+        if stored is not None:
+            replay = Response(stored["body"], status_code=stored["status_code"],
+                              media_type=stored["media_type"], headers={"Idempotent-Replayed": "true"})
+            return await replay(scope, receive, send)
+
+        async def replay_body():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        captured = {"status": 500, "media_type": "application/json", "body": b""}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        captured["media_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                captured["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture_send)
+        except Exception:
+            await run_in_threadpool(self.store.abandon, record_id)
+            raise
+
+        status = captured["status"]
+        if status >= 500 or status in _NOT_STORED:
+            await run_in_threadpool(self.store.abandon, record_id)
+            return
+        response = {
+            "status_code": status,
+            "media_type": captured["media_type"],
+            "body": captured["body"].decode("utf-8"),
+        }
+        try:
+            await run_in_threadpool(self.store.complete, record_id, fingerprint, response)
+        except Exception as e:
+            # The write itself succeeded; the local record still guards this worker
+            print(f"Error storing idempotent response {record_id}: {e}")
+
+
+def idempotency_store_from_env(firebase_service) -> IdempotencyStore:
+    return IdempotencyStore(
+        firebase_service,
+        ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400)),
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000)),
+        pending_timeout=float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT_SECONDS", 30)),
+        persist=os.getenv("IDEMPOTENCY_PERSIST", "True").lower() == "true",
+    )
@@ -0,0 +1,165 @@
+"""Composite index advice from recorded query shapes.
+
+Every Firestore query the backend runs is recorded by shape (collection,
+filter fields and operators, ordering, whether it is limited) with its
+latency and result size; GET /query-stats serves one worker's numbers. This
+report merges them, flags slow, high fan-out and failing shapes, and derives
+the composite indexes the shapes need in firestore.indexes.json form.
+
+Usage (from firegloss_backend/):
+    python index_advisor.py                                   # ask the local server
+    python index_advisor.py --url http://10.0.0.5:8000 --url http://10.0.0.6:8000
+    python index_advisor.py --stats worker1.json --stats worker2.json
+    python index_advisor.py --write ../firestore.indexes.json  # merge the indexes into the file
+"""
+import argparse
+import json
+import os
+import urllib.request
+from typing import Optional
+
+EQUALITY_OPS = {"==", "in"}
+ARRAY_OPS = {"array_contains", "array-contains", "array_contains_any", "array-contains-any"}
+
+
+def _key(shape: dict) -> tuple:
+    return (shape["collection"], tuple(map(tuple, shape["filters"])), tuple(map(tuple, shape["orderBy"])),
+            shape["limited"], shape["aggregate"])
+
+
+def merge(snapshots: list) -> list:
+    """Combine per-worker snapshots of the same shapes"""
+    merged = {}
+    for shapes in snapshots:
+        for shape in shapes:
+            key = _key(shape)
+            current = merged.get(key)
+            if current is None:
+                merged[key] = dict(shape)
+                continue
+            count = current["count"] + shape["count"]
+            current["meanMs"] = round((current["meanMs"] * current["count"] + shape["meanMs"] * shape["count"]) / count, 2)
+            current["meanDocuments"] = round((current["meanDocuments"] * current["count"]
+                                              + shape["meanDocuments"] * shape["count"]) / count, 1)
+            current["count"] = count
+            current["errors"] += shape["errors"]
+            current["lastError"] = shape["lastError"] or current["lastError"]
+            # Per-worker p95s can't be combined exactly; the worst one is the conservative answer
+            for field in ("p95Ms", "maxMs", "maxDocuments"):
+                current[field] = max(current[field], shape[field])
+            current["totalMs"] = round(current["totalMs"] + shape["totalMs"], 2)
+    return sorted(merged.values(), key=lambda s: s["totalMs"], reverse=True)
+
+
+def required_index(shape: dict) -> Optional[dict]:
+    """The composite index a shape needs, or None when single-field indexes serve it.
+
+    Equality fields come first (in any order), then an array-contains field,
+    then the inequality field (ordered as the query orders it), then the
+    remaining sort fields.
+    """
+    equality, array, ranges = [], None, []
+    for field, op in shape["filters"]:
+        if op in EQUALITY_OPS:
+            if field not in equality:
+                equality.append(field)
+        elif op in ARRAY_OPS:
+            array = field
+        elif field not in ranges:
+            ranges.append(field)
+    orders = [(field, direction.upper()) for field, direction in shape["orderBy"] if field not in equality]
+    order_directions = dict(orders)
+
+    fields = [{"fieldPath": field, "order": "ASCENDING"} for field in sorted(equality)]
+    if array:
+        fields.append({"fieldPath": array, "arrayConfig": "CONTAINS"})
+    for field in ranges:
+        fields.append({"fieldPath": field, "order": order_directions.get(field, "ASCENDING")})
+    fields += [{"fieldPath": field, "order": direction} for field, direction in orders if field not in ranges]
+    # One field (or equalities alone, which Firestore merges) needs no composite index
+    if len(fields) < 2 or not (array or ranges or orders):
+        return None
+    return {"collectionGroup": shape["collection"], "queryScope": "COLLECTION", "fields": fields}
+
+
+def findings(shape: dict, slow_ms: float, max_documents: int) -> list:
+    notes = []
+    if shape["errors"]:
+        error = shape["lastError"] or ""
+        notes.append("missing index" if "index" in error.lower() else f"{shape['errors']} errors")
+    if shape["p95Ms"] > slow_ms:
+        notes.append(f"slow (p95 {shape['p95Ms']:.0f}ms)")
+    if shape["meanDocuments"] > max_documents:
+        notes.append(f"high fan-out ({shape['meanDocuments']:.0f} documents per query)")
+    elif not shape["limited"] and not shape["aggregate"] and shape["maxDocuments"] > max_documents:
+        notes.append(f"unbounded (up to {shape['maxDocuments']} documents)")
+    return notes
+
+
+def describe(shape: dict) -> str:
+    parts = [f"{field} {op}" for field, op in shape["filters"]]
+    parts += [f"order by {field} {direction.lower()}" for field, direction in shape["orderBy"]]
+    if shape["limited"]:
+        parts.append("limit")
+    kind = "aggregate" if shape["aggregate"] else "query"
+    return f"{shape['collection']} {kind}" + (f" [{', '.join(parts)}]" if parts else " [all documents]")
+
+
+def merge_index_file(path: str, indexes: list) -> int:
+    """Add indexes missing from a firestore.indexes.json file; returns how many were added"""
+    existing = {"indexes": [], "fieldOverrides": []}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+    known = {json.dumps(index, sort_keys=True) for index in existing.get("indexes", [])}
+    added = 0
+    for index in indexes:
+        if json.dumps(index, sort_keys=True) not in known:
+            existing.setdefault("indexes", []).append(index)
+            known.add(json.dumps(index, sort_keys=True))
+            added += 1
+    with open(path, "w") as f:
+        json.dump(existing, f, indent=2)
+        f.write("\n")
+    return added
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report slow and unindexed Firestore query shapes")
+    parser.add_argument("--url", action="append", help="backend base URL to read /query-stats from (repeatable)")
+    parser.add_argument("--stats", action="append", help="saved /query-stats response (repeatable)")
+    parser.add_argument("--slow-ms", type=float, default=float(os.getenv("QUERY_SLOW_MS", 500)))
+    parser.add_argument("--max-documents", type=int, default=int(os.getenv("QUERY_LARGE_RESULT_DOCUMENTS", 1000)))
+    parser.add_argument("--write", metavar="PATH", help="merge the recommended indexes into this firestore.indexes.json")
+    args = parser.parse_args()
+
+    snapshots = []
+    for path in args.stats or []:
+        with open(path) as f:
+            snapshots.append(json.load(f)["shapes"])
+    for url in args.url or ([] if args.stats else ["http://127.0.0.1:8000"]):
+        with urllib.request.urlopen(f"{url.rstrip('/')}/query-stats", timeout=10) as response:
+            snapshots.append(json.load(response)["shapes"])
+    shapes = merge(snapshots)
+
+    indexes = {}
+    print(f"{'calls':>8} {'mean ms':>9} {'p95 ms':>9} {'mean docs':>10}  shape")
+    for shape in shapes:
+        index = required_index(shape)
+        notes = findings(shape, args.slow_ms, args.max_documents)
+        if index:
+            indexes[json.dumps(index, sort_keys=True)] = index
+            notes.append("needs composite index")
+        print(f"{shape['count']:>8} {shape['meanMs']:>9.1f} {shape['p95Ms']:>9.1f} {shape['meanDocuments']:>10.1f}  "
+              f"{describe(shape)}" + (f"  <- {'; '.join(notes)}" if notes else ""))
+
+    print(f"\n{len(shapes)} query shapes, {len(indexes)} composite indexes needed")
+    if args.write:
+        added = merge_index_file(args.write, list(indexes.values()))
+        print(f"Added {added} indexes to {args.write}")
+    elif indexes:
+        print(json.dumps({"indexes": list(indexes.values()), "fieldOverrides": []}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,38 @@
 import os
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-from firebase_service import firebase_service
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
+from google.api_core import exceptions as gcp_exceptions
+from firebase_service import firebase_service, SYNCED_COLLECTIONS, TENANT_SCOPED_COLLECTIONS
+from admission import admission_controller, tenant_quotas, classify, AdmissionRejected
+from idempotency import IdempotencyMiddleware, idempotency_store_from_env
+from transaction_numbers import allocator_from_env, business_day
+from search_index import item_search_index_from_env
+from customers import CustomerDirectory
+from payroll import PayrollCalculator
+from analytics import sales_analytics_from_env
+from archive import archive_from_env
+from sync import delta_sync_from_env
+from payments import PaymentLedger, PaymentRejected
+from cascade import cascade_deleter_from_env
+from scheduling import technician_schedule_from_env
+from walk_in_queue import walk_in_queue_from_env
+from totals import LineConflict, round_money, ticket_total, ticket_totals_from_env
+from request_context import begin_request, current_company, current_request, remaining_time
+from resilience import RETRYABLE_ERRORS
 from models import (
     UserCreate, UserUpdate, UserResponse, APIResponse,
     CompanyCreate, CompanyUpdate, EmployeeCreate, EmployeeUpdate,
     CategoryCreate, CategoryUpdate, ItemCreate, ItemUpdate,
-    TransactionCreate, TransactionUpdate, TransactionLineCreate, TransactionLineUpdate,
-    TransactionStatus, PaymentMethod, ItemType
+    TransactionCreate, TransactionUpdate, TransactionLineCreate, TransactionLineUpdate, TransactionLineReplace,
+    PaymentCreate, QueueAssign, TransactionStatus, PaymentMethod, ItemType,
+    TransactionData, TransactionList, TransactionLineList, ItemList, EmployeeList,
+    TransactionResponse, TransactionListResponse, TransactionLineListResponse, ItemListResponse, EmployeeListResponse
 )
+from responses import trusted_response
 
 app = FastAPI(
     title="FireGloss Backend API",
@@ -18,7 +40,115 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Add CORS middleware
+transaction_numbers = allocator_from_env(firebase_service)
+item_search = item_search_index_from_env(firebase_service)
+customers = CustomerDirectory(firebase_service)
+payroll = PayrollCalculator(firebase_service)
+sales_analytics = sales_analytics_from_env(firebase_service)
+transaction_archive = archive_from_env()
+delta_sync = delta_sync_from_env(firebase_service)
+payment_ledger = PaymentLedger(firebase_service)
+ticket_totals = ticket_totals_from_env(firebase_service)
+cascade_deleter = cascade_deleter_from_env(firebase_service)
+technician_schedule = technician_schedule_from_env(firebase_service)
+walk_in_queue = walk_in_queue_from_env(firebase_service)
+
+# Default end-to-end budget for a request; clients may ask for less via X-Request-Timeout
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", 10))
+# Floor for X-Request-Timeout; a budget of 0 would mean "no deadline" to begin_request
+MIN_REQUEST_BUDGET_SECONDS = float(os.getenv("MIN_REQUEST_BUDGET_SECONDS", 0.05))
+
+def service_error(e: Exception) -> HTTPException:
+    """Map a FirebaseService failure to the HTTP error the client should see"""
+    if isinstance(e, gcp_exceptions.PermissionDenied):
+        return HTTPException(status_code=403, detail=str(e))
+    if isinstance(e, gcp_exceptions.DeadlineExceeded):
+        return HTTPException(status_code=504, detail="Firestore request timed out")
+    if isinstance(e, RETRYABLE_ERRORS):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    return HTTPException(status_code=500, detail=str(e))
+
+# Transaction fields copied onto customer visit records
+CUSTOMER_VISIT_FIELDS = {"customerId", "customerName", "customerPhone", "customerEmail", "status", "total", "tip"}
+
+def link_customer(transaction_id: str, transaction_data: dict) -> None:
+    """Record the sale in its customer's history; a failure here must not fail the sale"""
+    try:
+        transaction_data["customerId"] = customers.record_visit(transaction_id, transaction_data)
+    except Exception as e:
+        print(f"Error linking transaction {transaction_id} to a customer: {e}")
+
+# Replays the first response for a repeated Idempotency-Key (innermost, so it runs
+# under the request deadline and after admission)
+idempotency_store = idempotency_store_from_env(firebase_service)
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Bound concurrent Firestore-bound work and shed low priority traffic under overload"""
+    priority = classify(request.method, request.url.path) if admission_controller else None
+    if priority is None:
+        return await call_next(request)
+    
+    try:
+        await admission_controller.acquire(priority, timeout=remaining_time())
+    except AdmissionRejected as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    try:
+        return await call_next(request)
+    finally:
+        admission_controller.release(priority)
+
+# Reads under these paths come from tenant-scoped collections, so they must name a company
+TENANT_SCOPED_PATHS = {"employees", "categories", "items", "transactions", "customers"}
+
+@app.middleware("http")
+async def tenant_scope(request: Request, call_next):
+    """Scope the request to the company in X-Company-Id (or companyId) and apply its quota"""
+    header = request.headers.get("X-Company-Id")
+    param = request.query_params.get("companyId")
+    if header and param and header != param:
+        return JSONResponse(status_code=403, content={"detail": "companyId does not match X-Company-Id"})
+    company_id = header or param
+    if not company_id:
+        if request.method == "GET" and request.url.path.split("/")[1] in TENANT_SCOPED_PATHS:
+            return JSONResponse(status_code=400, content={"detail": "X-Company-Id (or companyId) is required"})
+        return await call_next(request)
+    
+    if tenant_quotas:
+        retry_after = tenant_quotas.acquire(company_id)
+        if retry_after is not None:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": f"Request quota exceeded for company {company_id}"},
+                headers={"Retry-After": str(retry_after)}
+            )
+    current_request().company_id = company_id
+    return await call_next(request)
+
+@app.middleware("http")
+async def request_state(request: Request, call_next):
+    """Start the request deadline and report stale (degraded mode) answers"""
+    budget = REQUEST_BUDGET_SECONDS
+    requested = request.headers.get("X-Request-Timeout")
+    if requested:
+        try:
+            budget = min(budget, max(MIN_REQUEST_BUDGET_SECONDS, float(requested)))
+        except ValueError:
+            pass
+    state = begin_request(budget)
+    response = await call_next(request)
+    if state.stale_age is not None:
+        response.headers["X-Data-Stale"] = "true"
+        response.headers["Age"] = str(int(state.stale_age))
+    return response
+
+# Add CORS middleware (registered last so it also wraps shed responses)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # In production, specify your Flutter app's origin
@@ -30,12 +160,29 @@ app.add_middleware(
 @app.get("/")
 async def health_check():
     """Health check endpoint"""
-    firebase_status = "connected" if firebase_service.db else "not connected"
+    if not firebase_service.db:
+        firebase_status = "not connected"
+    elif firebase_service.circuit_breaker.state != "closed":
+        firebase_status = "degraded"
+    else:
+        firebase_status = "connected"
     return {
         "status": "healthy",
         "message": "FireGloss Backend API is running",
         "firebase_status": firebase_status,
-        "timestamp": datetime.now().isoformat()
+        "admission": admission_controller.stats() if admission_controller else None,
+        "hedged_reads": firebase_service.hedger.stats() if firebase_service.hedger else None,
+        "circuit_breaker": firebase_service.circuit_breaker.stats(),
+        "read_coalescing": firebase_service.single_flight.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+@app.get("/query-stats")
+async def query_stats():
+    """This worker's Firestore query shapes with latency and result sizes (input for index_advisor.py)"""
+    return {
+        "shapes": firebase_service.query_stats.snapshot(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
 @app.get("/test")
@@ -47,12 +194,12 @@ async def test_endpoint():
         "test_data": {
             "server": "FastAPI",
             "python_version": "3.x",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat()
         }
     }
 
 @app.post("/users", response_model=APIResponse)
-async def create_user(user: UserCreate):
+def create_user(user: UserCreate):
     """Create a new user"""
     try:
         user_data = {
@@ -60,8 +207,8 @@ async def create_user(user: UserCreate):
             "name": user.name,
             "phone": user.phone,
             "avatar_url": user.avatar_url,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
         }
         
         user_id = firebase_service.create_user(user_data)
@@ -72,10 +219,10 @@ async def create_user(user: UserCreate):
             data={"user_id": user_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.get("/users/{user_id}", response_model=APIResponse)
-async def get_user(user_id: str):
+def get_user(user_id: str):
     """Get user by ID"""
     try:
         user_data = firebase_service.get_user(user_id)
@@ -91,10 +238,10 @@ async def get_user(user_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.put("/users/{user_id}", response_model=APIResponse)
-async def update_user(user_id: str, user_update: UserUpdate):
+def update_user(user_id: str, user_update: UserUpdate):
     """Update user"""
     try:
         # Check if user exists
@@ -111,7 +258,7 @@ async def update_user(user_id: str, user_update: UserUpdate):
         if user_update.avatar_url is not None:
             update_data["avatar_url"] = user_update.avatar_url
         
-        update_data["updated_at"] = datetime.now()
+        update_data["updated_at"] = datetime.now(timezone.utc)
         
         firebase_service.update_user(user_id, update_data)
         
@@ -123,10 +270,10 @@ async def update_user(user_id: str, user_update: UserUpdate):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/users/{user_id}", response_model=APIResponse)
-async def delete_user(user_id: str):
+def delete_user(user_id: str):
     """Delete user"""
     try:
         # Check if user exists
@@ -144,10 +291,10 @@ async def delete_user(user_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.get("/users", response_model=APIResponse)
-async def get_all_users():
+def get_all_users():
     """Get all users"""
     try:
         users = firebase_service.get_all_users()
@@ -158,17 +305,17 @@ async def get_all_users():
             data={"users": users, "count": len(users)}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 # Company Endpoints
 @app.post("/companies", response_model=APIResponse)
-async def create_company(company: CompanyCreate):
+def create_company(company: CompanyCreate):
     """Create a new company"""
     try:
         company_data = {
-            **company.dict(),
-            "createdAt": datetime.now(),
-            "updatedAt": datetime.now()
+            **company.model_dump(),
+            "createdAt": datetime.now(timezone.utc),
+            "updatedAt": datetime.now(timezone.utc)
         }
         
         company_id = firebase_service.create_document("companies", company_data)
@@ -179,10 +326,10 @@ async def create_company(company: CompanyCreate):
             data={"id": company_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.get("/companies", response_model=APIResponse)
-async def get_companies():
+def get_companies():
     """Get all companies"""
     try:
         companies = firebase_service.get_all_documents("companies")
@@ -193,14 +340,14 @@ async def get_companies():
             data={"companies": companies, "count": len(companies)}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.put("/companies/{company_id}", response_model=APIResponse)
-async def update_company(company_id: str, company_update: CompanyUpdate):
+def update_company(company_id: str, company_update: CompanyUpdate):
     """Update company"""
     try:
-        update_data = {k: v for k, v in company_update.dict().items() if v is not None}
-        update_data["updatedAt"] = datetime.now()
+        update_data = {k: v for k, v in company_update.model_dump().items() if v is not None}
+        update_data["updatedAt"] = datetime.now(timezone.utc)
         
         firebase_service.update_document("companies", company_id, update_data)
         
@@ -209,31 +356,36 @@ async def update_company(company_id: str, company_update: CompanyUpdate):
             message="Company updated successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/companies/{company_id}", response_model=APIResponse)
-async def delete_company(company_id: str):
-    """Delete company"""
+def delete_company(company_id: str):
+    """Delete company; its employees, catalog, customers and transactions are removed in the background"""
+    # Only the company itself may start the cascade over everything it owns
+    if current_company() != company_id:
+        raise HTTPException(status_code=403, detail="X-Company-Id must name the company being deleted")
     try:
         firebase_service.delete_document("companies", company_id)
+        job_id = cascade_deleter.delete_company(company_id)
         
         return APIResponse(
             success=True,
-            message="Company deleted successfully"
+            message="Company deleted successfully",
+            data={"jobId": job_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 # Employee Endpoints
 @app.post("/employees", response_model=APIResponse)
-async def create_employee(employee: EmployeeCreate):
+def create_employee(employee: EmployeeCreate):
     """Create a new employee"""
     try:
         employee_data = {
-            **employee.dict(),
+            **employee.model_dump(),
             "isActive": True,
-            "createdAt": datetime.now(),
-            "updatedAt": datetime.now()
+            "createdAt": datetime.now(timezone.utc),
+            "updatedAt": datetime.now(timezone.utc)
         }
         
         employee_id = firebase_service.create_document("employees", employee_data)
@@ -244,28 +396,25 @@ async def create_employee(employee: EmployeeCreate):
             data={"id": employee_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
-@app.get("/employees", response_model=APIResponse)
-async def get_employees():
+@app.get("/employees", response_model=EmployeeListResponse)
+def get_employees():
     """Get all employees"""
     try:
         employees = firebase_service.get_all_documents("employees")
         
-        return APIResponse(
-            success=True,
-            message=f"Retrieved {len(employees)} employees",
-            data={"employees": employees, "count": len(employees)}
-        )
+        return trusted_response(EmployeeListResponse, f"Retrieved {len(employees)} employees",
+                                EmployeeList.from_store(employees))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.put("/employees/{employee_id}", response_model=APIResponse)
-async def update_employee(employee_id: str, employee_update: EmployeeUpdate):
+def update_employee(employee_id: str, employee_update: EmployeeUpdate):
     """Update employee"""
     try:
-        update_data = {k: v for k, v in employee_update.dict().items() if v is not None}
-        update_data["updatedAt"] = datetime.now()
+        update_data = {k: v for k, v in employee_update.model_dump().items() if v is not None}
+        update_data["updatedAt"] = datetime.now(timezone.utc)
         
         firebase_service.update_document("employees", employee_id, update_data)
         
@@ -274,10 +423,10 @@ async def update_employee(employee_id: str, employee_update: EmployeeUpdate):
             message="Employee updated successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/employees/{employee_id}", response_model=APIResponse)
-async def delete_employee(employee_id: str):
+def delete_employee(employee_id: str):
     """Delete employee"""
     try:
         firebase_service.delete_document("employees", employee_id)
@@ -287,18 +436,18 @@ async def delete_employee(employee_id: str):
             message="Employee deleted successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 # Item Category Endpoints
 @app.post("/categories", response_model=APIResponse)
-async def create_category(category: CategoryCreate):
+def create_category(category: CategoryCreate):
     """Create a new item category"""
     try:
         category_data = {
-            **category.dict(),
+            **category.model_dump(),
             "isActive": True,
-            "createdAt": datetime.now(),
-            "updatedAt": datetime.now()
+            "createdAt": datetime.now(timezone.utc),
+            "updatedAt": datetime.now(timezone.utc)
         }
         
         category_id = firebase_service.create_document("item_categories", category_data)
@@ -309,10 +458,10 @@ async def create_category(category: CategoryCreate):
             data={"id": category_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.get("/categories", response_model=APIResponse)
-async def get_categories():
+def get_categories():
     """Get all item categories"""
     try:
         categories = firebase_service.get_all_documents("item_categories")
@@ -323,14 +472,14 @@ async def get_categories():
             data={"categories": categories, "count": len(categories)}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.put("/categories/{category_id}", response_model=APIResponse)
-async def update_category(category_id: str, category_update: CategoryUpdate):
+def update_category(category_id: str, category_update: CategoryUpdate):
     """Update category"""
     try:
-        update_data = {k: v for k, v in category_update.dict().items() if v is not None}
-        update_data["updatedAt"] = datetime.now()
+        update_data = {k: v for k, v in category_update.model_dump().items() if v is not None}
+        update_data["updatedAt"] = datetime.now(timezone.utc)
         
         firebase_service.update_document("item_categories", category_id, update_data)
         
@@ -339,10 +488,10 @@ async def update_category(category_id: str, category_update: CategoryUpdate):
             message="Category updated successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/categories/{category_id}", response_model=APIResponse)
-async def delete_category(category_id: str):
+def delete_category(category_id: str):
     """Delete category"""
     try:
         firebase_service.delete_document("item_categories", category_id)
@@ -352,18 +501,18 @@ async def delete_category(category_id: str):
             message="Category deleted successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 # Item Endpoints
 @app.post("/items", response_model=APIResponse)
-async def create_item(item: ItemCreate):
+def create_item(item: ItemCreate):
     """Create a new item"""
     try:
         item_data = {
-            **item.dict(),
+            **item.model_dump(),
             "isActive": True,
-            "createdAt": datetime.now(),
-            "updatedAt": datetime.now()
+            "createdAt": datetime.now(timezone.utc),
+            "updatedAt": datetime.now(timezone.utc)
         }
         
         item_id = firebase_service.create_document("items", item_data)
@@ -374,28 +523,40 @@ async def create_item(item: ItemCreate):
             data={"id": item_id}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
-@app.get("/items", response_model=APIResponse)
-async def get_items():
+@app.get("/items", response_model=ItemListResponse)
+def get_items():
     """Get all items"""
     try:
         items = firebase_service.get_all_documents("items")
         
-        return APIResponse(
-            success=True,
-            message=f"Retrieved {len(items)} items",
-            data={"items": items, "count": len(items)}
-        )
+        return trusted_response(ItemListResponse, f"Retrieved {len(items)} items", ItemList.from_store(items))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
+
+@app.get("/items/search", response_model=ItemListResponse)
+def search_items(
+    q: str = Query(..., min_length=1),
+    companyId: Optional[str] = None,
+    item_type: Optional[ItemType] = Query(None, alias="type"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Search items by name, SKU, category or description (prefix and typo tolerant)"""
+    try:
+        items = item_search.search(q, company_id=companyId or current_company(),
+                                   item_type=item_type.value if item_type else None, limit=limit)
+        
+        return trusted_response(ItemListResponse, f"Found {len(items)} items", ItemList.from_store(items))
+    except Exception as e:
+        raise service_error(e)
 
 @app.put("/items/{item_id}", response_model=APIResponse)
-async def update_item(item_id: str, item_update: ItemUpdate):
+def update_item(item_id: str, item_update: ItemUpdate):
     """Update item"""
     try:
-        update_data = {k: v for k, v in item_update.dict().items() if v is not None}
-        update_data["updatedAt"] = datetime.now()
+        update_data = {k: v for k, v in item_update.model_dump().items() if v is not None}
+        update_data["updatedAt"] = datetime.now(timezone.utc)
         
         firebase_service.update_document("items", item_id, update_data)
         
@@ -404,10 +565,10 @@ async def update_item(item_id: str, item_update: ItemUpdate):
             message="Item updated successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/items/{item_id}", response_model=APIResponse)
-async def delete_item(item_id: str):
+def delete_item(item_id: str):
     """Delete item"""
     try:
         firebase_service.delete_document("items", item_id)
@@ -417,33 +578,342 @@ async def delete_item(item_id: str):
             message="Item deleted successfully"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
+
+# Sync endpoint
+@app.get("/sync", response_model=APIResponse)
+def sync_changes(since: Optional[str] = None, collections: Optional[str] = None, companyId: Optional[str] = None):
+    """Documents changed (by updatedAt) and deleted since a sync token, plus the next token.
+
+    Omit ``since`` for a full snapshot; ``collections`` is a comma-separated subset.
+    """
+    names = collections.split(",") if collections else list(SYNCED_COLLECTIONS)
+    company_id = companyId or current_company()
+    if not company_id and set(names) & set(TENANT_SCOPED_COLLECTIONS):
+        raise HTTPException(status_code=400, detail="X-Company-Id (or companyId) is required")
+    try:
+        result = delta_sync.sync(since, names, company_id=company_id)
+        changed = sum(len(documents) for documents in result["changes"].values())
+        
+        return APIResponse(
+            success=True,
+            message=f"{changed} changed, {sum(len(ids) for ids in result['deleted'].values())} deleted",
+            data=result
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid sync request: {e}")
+    except Exception as e:
+        raise service_error(e)
+
+# Customer endpoints
+@app.get("/customers/lookup", response_model=APIResponse)
+def lookup_customer(companyId: str, phone: Optional[str] = None, email: Optional[str] = None):
+    """Find a customer by phone number or email"""
+    if not phone and not email:
+        raise HTTPException(status_code=400, detail="Provide phone or email")
+    try:
+        customer = customers.find(companyId, phone=phone, email=email)
+        
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        return APIResponse(
+            success=True,
+            message="Customer retrieved successfully",
+            data={"customer": customer}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+@app.get("/customers/{customer_id}", response_model=APIResponse)
+def get_customer(customer_id: str):
+    """Get customer by ID, with lifetime totals"""
+    try:
+        customer = customers.get(customer_id)
+        
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        return APIResponse(
+            success=True,
+            message="Customer retrieved successfully",
+            data={"customer": customer}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+@app.get("/customers/{customer_id}/history", response_model=APIResponse)
+def get_customer_history(customer_id: str, limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    """Get a customer's past visits, newest first (pass nextCursor to get the next page)"""
+    try:
+        customer = customers.get(customer_id)
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        try:
+            page = customers.history(customer_id, limit=limit, cursor=cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        
+        return APIResponse(
+            success=True,
+            message=f"Retrieved {len(page['visits'])} visits",
+            data={"customer": customer, **page}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+# Payroll endpoints
+@app.get("/payroll", response_model=APIResponse)
+def get_payroll(
+    companyId: str,
+    start_date: date = Query(..., alias="from"),
+    end_date: date = Query(..., alias="to")
+):
+    """Commission, tips and service hours per technician for a pay period (inclusive dates)"""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    try:
+        report = payroll.period(companyId, start_date, end_date)
+        
+        return APIResponse(
+            success=True,
+            message=f"Computed payroll for {len(report['technicians'])} technicians",
+            data=report
+        )
+    except Exception as e:
+        raise service_error(e)
+
+# Scheduling endpoints
+@app.get("/availability", response_model=APIResponse)
+def get_availability(
+    duration: int = Query(..., gt=0, le=24 * 60),
+    companyId: Optional[str] = None,
+    day: Optional[date] = Query(None, alias="date"),
+    at: Optional[time] = None,
+    opens: time = time(9),
+    closes: time = time(18),
+    utcOffsetMinutes: int = 0
+):
+    """Free windows per technician for a ``duration``-minute service on one (local) day
+    between ``opens`` and ``closes``; with ``at`` (local time), also who is free then."""
+    companyId = companyId or current_company()
+    if not companyId:
+        raise HTTPException(status_code=400, detail="companyId (or X-Company-Id) is required")
+    if closes <= opens:
+        raise HTTPException(status_code=400, detail="'closes' must be after 'opens'")
+    offset = timedelta(minutes=utcOffsetMinutes)
+    day = day or (datetime.now(timezone.utc) + offset).date()
+    
+    def local(t: time) -> datetime:
+        return datetime.combine(day, t, tzinfo=timezone.utc) - offset
+    
+    try:
+        technicians = {
+            e["id"]: f"{e.get('firstName', '')} {e.get('lastName', '')}".strip()
+            for e in firebase_service.get_all_documents("employees", companyId)
+            if str(e.get("role", "")).lower() == "technician" and e.get("isActive") is not False
+        }
+        availability = technician_schedule.availability(
+            companyId, technicians, local(opens), local(closes), duration,
+            at=local(at) if at is not None else None
+        )
+        
+        return APIResponse(
+            success=True,
+            message="Technician availability retrieved successfully",
+            data={"companyId": companyId, "date": day.isoformat(), "duration": duration, **availability}
+        )
+    except Exception as e:
+        raise service_error(e)
+
+# Walk-in queue endpoints
+def queue_company(companyId: Optional[str]) -> str:
+    companyId = companyId or current_company()
+    if not companyId:
+        raise HTTPException(status_code=400, detail="companyId (or X-Company-Id) is required")
+    return companyId
+
+@app.get("/queue", response_model=APIResponse)
+def get_queue(companyId: Optional[str] = None):
+    """Tickets waiting for a technician, in serving order"""
+    companyId = queue_company(companyId)
+    try:
+        tickets = walk_in_queue.waiting(companyId)
+        
+        return APIResponse(
+            success=True,
+            message=f"{len(tickets)} customers waiting",
+            data={"companyId": companyId, "tickets": tickets}
+        )
+    except Exception as e:
+        raise service_error(e)
+
+@app.post("/queue/next", response_model=APIResponse)
+def assign_next_customer(assignment: QueueAssign, companyId: Optional[str] = None):
+    """Assign the next waiting ticket (or the next one that asked for them) to a technician"""
+    companyId = queue_company(companyId)
+    try:
+        employee = firebase_service.get_document("employees", assignment.technicianId)
+        if not employee or employee.get("companyId") != companyId:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        if employee.get("isActive") is False:
+            raise HTTPException(status_code=400, detail="Employee is not active")
+        
+        transaction = walk_in_queue.assign_next(companyId, assignment.technicianId)
+        if transaction is None:
+            return APIResponse(success=True, message="No customers waiting", data={"transaction": None})
+        
+        return trusted_response(TransactionResponse, "Customer assigned successfully",
+                                TransactionData.from_store(round_money(transaction)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+@app.get("/queue/events")
+def stream_queue(companyId: Optional[str] = None):
+    """Server-sent events: a snapshot of the queue, then each ticket queued, updated or removed"""
+    companyId = queue_company(companyId)
+    try:
+        subscriber = walk_in_queue.subscribe(companyId)
+    except Exception as e:
+        raise service_error(e)
+    return StreamingResponse(
+        walk_in_queue.stream(companyId, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Analytics endpoints
+@app.get("/analytics/sales", response_model=APIResponse)
+def get_sales_analytics(
+    companyId: str,
+    groupBy: str,
+    start_date: Optional[date] = Query(None, alias="from"),
+    end_date: Optional[date] = Query(None, alias="to"),
+    status: str = "complete",
+    employeeId: Optional[str] = None,
+    paymentMethod: Optional[str] = None,
+    utcOffsetMinutes: int = 0
+):
+    """Sales grouped by hour, weekday, date, employee, paymentMethod, status, category, item,
+    technician or itemType. ``status`` is a comma-separated list or "all"; dates are inclusive
+    local days at ``utcOffsetMinutes``."""
+    offset = timedelta(minutes=utcOffsetMinutes)
+    start = datetime.combine(start_date, time.min, tzinfo=timezone.utc) - offset if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc) - offset if end_date else None
+    try:
+        report = sales_analytics.sales_report(
+            companyId, groupBy, start=start, end=end,
+            statuses=None if status == "all" else status.split(","),
+            employee_id=employeeId, payment_method=paymentMethod,
+            utc_offset_minutes=utcOffsetMinutes
+        )
+        
+        return APIResponse(
+            success=True,
+            message=f"Sales by {groupBy}",
+            data=report
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
 
 # Transaction endpoints
-@app.get("/transactions", response_model=APIResponse)
-async def get_transactions():
-    """Get all transactions"""
+@app.get("/transactions", response_model=TransactionListResponse)
+def get_transactions(
+    companyId: Optional[str] = None,
+    start_date: Optional[date] = Query(None, alias="from"),
+    end_date: Optional[date] = Query(None, alias="to")
+):
+    """Get all transactions, or a company's transactions for a date range (inclusive UTC days).
+
+    Date ranges that reach back past the retention window also return archived
+    transactions, flagged with ``archived: true``.
+    """
+    try:
+        if not start_date and not end_date:
+            transactions = firebase_service.get_all_transactions()
+            
+            return trusted_response(TransactionListResponse, "Transactions retrieved successfully",
+                                    TransactionList.from_store([round_money(t) for t in transactions]))
+        
+        companyId = companyId or current_company()
+        if not companyId:
+            raise HTTPException(status_code=400, detail="companyId (or X-Company-Id) is required with from/to")
+        start = datetime.combine(start_date or date(1970, 1, 1), time.min, tzinfo=timezone.utc)
+        end = datetime.combine((end_date or datetime.now(timezone.utc).date()) + timedelta(days=1), time.min,
+                               tzinfo=timezone.utc)
+        transactions = {t["id"]: t for t in firebase_service.get_transactions_between(companyId, start, end)}
+        archived = 0
+        if transaction_archive.covers(companyId, start, end):
+            for record in transaction_archive.read(companyId, start, end):
+                if record["id"] not in transactions:
+                    transactions[record["id"]] = record
+                    archived += 1
+        
+        return trusted_response(TransactionListResponse, "Transactions retrieved successfully", TransactionList.from_store(
+            sorted((round_money(t) for t in transactions.values()), key=lambda t: t["transactionDate"], reverse=True),
+            archived=archived
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+@app.get("/transactions/summary", response_model=APIResponse)
+def get_transactions_summary(
+    companyId: str,
+    summary_date: Optional[date] = Query(None, alias="date"),
+    utcOffsetMinutes: int = 0
+):
+    """Counts and totals per status and payment method for one (local) day, via aggregation queries"""
+    offset = timedelta(minutes=utcOffsetMinutes)
+    summary_date = summary_date or (datetime.now(timezone.utc) + offset).date()
+    start = datetime.combine(summary_date, time.min, tzinfo=timezone.utc) - offset
     try:
-        transactions = firebase_service.get_all_transactions()
+        groups = firebase_service.aggregate_transactions(companyId, start, start + timedelta(days=1), {
+            "status": [s.value for s in TransactionStatus],
+            "paymentMethod": [m.value for m in PaymentMethod],
+        })
+        completed = groups["status"][TransactionStatus.COMPLETE.value]
         
         return APIResponse(
             success=True,
-            message="Transactions retrieved successfully",
-            data={"transactions": transactions}
+            message="Transaction summary retrieved successfully",
+            data={
+                "companyId": companyId,
+                "date": summary_date.isoformat(),
+                "count": sum(g["count"] for g in groups["status"].values()),
+                "revenue": round(completed["total"], 2),
+                "tips": round(completed["tips"], 2),
+                "byStatus": groups["status"],
+                "byPaymentMethod": groups["paymentMethod"],
+            }
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
-@app.post("/transactions", response_model=APIResponse)
-async def create_transaction(transaction: TransactionCreate):
+@app.post("/transactions", response_model=TransactionResponse)
+def create_transaction(transaction: TransactionCreate):
     """Create a new transaction"""
     try:
-        # Use the client-provided timestamps if available, otherwise use UTC time
-        from datetime import timezone
         current_time = datetime.now(timezone.utc)
+        transaction_number = transaction_numbers.allocate(
+            transaction.companyId, business_day(transaction.transactionDate, transaction.utcOffsetMinutes)
+        )
         transaction_data = {
             "companyId": transaction.companyId,
-            "transactionNumber": transaction.transactionNumber,
+            "transactionNumber": transaction_number,
+            "clientTransactionNumber": transaction.transactionNumber,
             "transactionDate": transaction.transactionDate,
             "customerId": transaction.customerId,
             "customerName": transaction.customerName,
@@ -452,32 +922,36 @@ async def create_transaction(transaction: TransactionCreate):
             "employeeId": transaction.employeeId,
             "status": transaction.status,
             "paymentMethod": transaction.paymentMethod,
-            "subtotal": transaction.subtotal,
-            "tax": transaction.tax,
+            "priority": transaction.priority,
+            "requestedTechnicianId": transaction.requestedTechnicianId,
+            # subtotal and tax follow the lines added later; client values are ignored
+            "subtotal": 0.0,
+            "tax": 0.0,
             "discount": transaction.discount,
             "tip": transaction.tip,
-            "total": transaction.total,
             "notes": transaction.notes,
-            "createdAt": transaction.createdAt if hasattr(transaction, 'createdAt') and transaction.createdAt else current_time,
-            "updatedAt": transaction.updatedAt if hasattr(transaction, 'updatedAt') and transaction.updatedAt else current_time
+            # Sync tokens compare against server time, so client clocks must not set these
+            "createdAt": current_time,
+            "updatedAt": current_time
         }
         
+        transaction_data["total"] = ticket_total(transaction_data)
+        transaction_data["balance"] = transaction_data["total"]
+        
         transaction_id = firebase_service.create_transaction(transaction_data)
+        link_customer(transaction_id, transaction_data)
         
         # Get the created transaction to return it
         created_transaction = firebase_service.get_transaction(transaction_id)
         created_transaction['id'] = transaction_id
         
-        return APIResponse(
-            success=True,
-            message="Transaction created successfully",
-            data={"transaction": created_transaction}
-        )
+        return trusted_response(TransactionResponse, "Transaction created successfully",
+                                TransactionData.from_store(round_money(created_transaction)))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
-@app.get("/transactions/{transaction_id}", response_model=APIResponse)
-async def get_transaction(transaction_id: str):
+@app.get("/transactions/{transaction_id}", response_model=TransactionResponse)
+def get_transaction(transaction_id: str):
     """Get transaction by ID"""
     try:
         transaction = firebase_service.get_transaction(transaction_id)
@@ -487,18 +961,15 @@ async def get_transaction(transaction_id: str):
         
         transaction['id'] = transaction_id
         
-        return APIResponse(
-            success=True,
-            message="Transaction retrieved successfully",
-            data={"transaction": transaction}
-        )
+        return trusted_response(TransactionResponse, "Transaction retrieved successfully",
+                                TransactionData.from_store(round_money(transaction)))
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.put("/transactions/{transaction_id}", response_model=APIResponse)
-async def update_transaction(transaction_id: str, transaction_update: TransactionUpdate):
+def update_transaction(transaction_id: str, transaction_update: TransactionUpdate):
     """Update transaction"""
     try:
         # Check if transaction exists
@@ -508,7 +979,7 @@ async def update_transaction(transaction_id: str, transaction_update: Transactio
         
         # Prepare update data
         update_data = {
-            "updatedAt": datetime.now()
+            "updatedAt": datetime.now(timezone.utc)
         }
         
         # Add only provided fields to update data
@@ -524,20 +995,24 @@ async def update_transaction(transaction_id: str, transaction_update: Transactio
             update_data["status"] = transaction_update.status
         if transaction_update.paymentMethod is not None:
             update_data["paymentMethod"] = transaction_update.paymentMethod
-        if transaction_update.subtotal is not None:
-            update_data["subtotal"] = transaction_update.subtotal
-        if transaction_update.tax is not None:
-            update_data["tax"] = transaction_update.tax
+        if transaction_update.priority is not None:
+            update_data["priority"] = transaction_update.priority
+        if transaction_update.requestedTechnicianId is not None:
+            update_data["requestedTechnicianId"] = transaction_update.requestedTechnicianId or None
         if transaction_update.discount is not None:
             update_data["discount"] = transaction_update.discount
         if transaction_update.tip is not None:
             update_data["tip"] = transaction_update.tip
-        if transaction_update.total is not None:
-            update_data["total"] = transaction_update.total
         if transaction_update.notes is not None:
             update_data["notes"] = transaction_update.notes
         
-        firebase_service.update_transaction(transaction_id, update_data)
+        if update_data.keys() & {"discount", "tip"}:
+            # The total, balance and settlement depend on these, so re-derive them atomically
+            payment_ledger.update_header(transaction_id, update_data)
+        else:
+            firebase_service.update_transaction(transaction_id, update_data)
+        if update_data.keys() & CUSTOMER_VISIT_FIELDS:
+            link_customer(transaction_id, {**existing_transaction, **update_data})
         
         return APIResponse(
             success=True,
@@ -546,10 +1021,10 @@ async def update_transaction(transaction_id: str, transaction_update: Transactio
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 @app.delete("/transactions/{transaction_id}", response_model=APIResponse)
-async def delete_transaction(transaction_id: str):
+def delete_transaction(transaction_id: str):
     """Delete transaction"""
     try:
         # Check if transaction exists
@@ -558,19 +1033,42 @@ async def delete_transaction(transaction_id: str):
             raise HTTPException(status_code=404, detail="Transaction not found")
         
         firebase_service.delete_transaction(transaction_id)
+        try:
+            customers.remove_visit(transaction_id)
+        except Exception as e:
+            print(f"Error unlinking transaction {transaction_id} from its customer: {e}")
+        job_id = cascade_deleter.delete_transaction(transaction_id, existing_transaction.get("companyId"))
         
         return APIResponse(
             success=True,
-            message="Transaction deleted successfully"
+            message="Transaction deleted successfully",
+            data={"jobId": job_id}
         )
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
 # Transaction Lines endpoints
-@app.get("/transactions/{transaction_id}/lines", response_model=APIResponse)
-async def get_transaction_lines(transaction_id: str):
+# Line fields a client sets; a bulk replace only writes lines where one of these changed
+LINE_FIELDS = ("itemId", "itemName", "itemType", "quantity", "unitPrice", "lineTotal",
+               "technicianId", "serviceDuration", "scheduledStart", "notes")
+MAX_LINES_PER_TRANSACTION = 200
+
+def new_line_data(transaction_id: str, transaction: dict, line) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "transactionId": transaction_id,
+        # Denormalized so reporting can query lines by company and date
+        "companyId": transaction.get("companyId"),
+        "transactionDate": transaction.get("transactionDate"),
+        **{field: getattr(line, field) for field in LINE_FIELDS},
+        "createdAt": now,
+        "updatedAt": now
+    }
+
+@app.get("/transactions/{transaction_id}/lines", response_model=TransactionLineListResponse)
+def get_transaction_lines(transaction_id: str):
     """Get all lines for a transaction"""
     try:
         # Check if transaction exists
@@ -580,51 +1078,213 @@ async def get_transaction_lines(transaction_id: str):
         
         lines = firebase_service.get_transaction_lines(transaction_id)
         
+        return trusted_response(TransactionLineListResponse, "Transaction lines retrieved successfully",
+                                TransactionLineList.from_store(lines))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+@app.post("/transactions/{transaction_id}/lines", response_model=APIResponse)
+def add_transaction_line(transaction_id: str, line: TransactionLineCreate):
+    """Add a line to a transaction"""
+    try:
+        # The header is read in the same transaction, so a payment landing meanwhile still re-settles the ticket
+        line_id = firebase_service.new_document_id("transaction_lines")
+        ticket_totals.edit_lines(transaction_id, lambda header, stored: (
+            {line_id: ticket_totals.price(header, new_line_data(transaction_id, header, line))}, {}, []
+        ), line_ids=[])
+        
         return APIResponse(
             success=True,
-            message="Transaction lines retrieved successfully",
-            data={"lines": lines}
+            message="Transaction line added successfully",
+            data={"line_id": line_id}
         )
     except HTTPException:
         raise
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
 
-@app.post("/transactions/{transaction_id}/lines", response_model=APIResponse)
-async def add_transaction_line(transaction_id: str, line: TransactionLineCreate):
-    """Add a line to a transaction"""
+@app.put("/transactions/{transaction_id}/lines", response_model=APIResponse)
+def replace_transaction_lines(transaction_id: str, lines: List[TransactionLineReplace]):
+    """Replace a transaction's lines, writing only the lines that were added, changed or removed"""
+    if len(lines) > MAX_LINES_PER_TRANSACTION:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LINES_PER_TRANSACTION} lines per transaction")
+    for line in lines:
+        if line.transactionId not in (None, transaction_id):
+            raise HTTPException(status_code=400, detail=f"Line {line.id} belongs to another transaction")
+    new_ids = {index: firebase_service.new_document_id("transaction_lines")
+               for index, line in enumerate(lines) if not line.id}
+    unchanged = []
+    
+    def replace(transaction: dict, stored: dict) -> tuple:
+        sets, updates, kept = {}, {}, set()
+        for index, line in enumerate(lines):
+            current = stored.get(line.id)
+            if current is None:
+                sets[line.id or new_ids[index]] = ticket_totals.price(
+                    transaction, new_line_data(transaction_id, transaction, line))
+                continue
+            kept.add(line.id)
+            changed = {field: getattr(line, field) for field in LINE_FIELDS
+                       if getattr(line, field) != current.get(field)}
+            if changed:
+                updates[line.id] = line_changes(transaction, current, changed)
+        unchanged[:] = [line_id for line_id in kept if line_id not in updates]
+        return sets, updates, [line_id for line_id in stored if line_id not in kept]
+    
+    try:
+        sets, updates, deletes, _ = ticket_totals.edit_lines(transaction_id, replace)
+        
+        return APIResponse(
+            success=True,
+            message="Transaction lines replaced successfully",
+            data={
+                "created": list(sets),
+                "updated": list(updates),
+                "deleted": deletes,
+                "unchanged": len(unchanged)
+            }
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LineConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
+
+def line_changes(transaction: dict, current: dict, changed: dict) -> dict:
+    """Update data for an edit of a line, re-taxed if lineTotal changed"""
+    update_data = {**changed, "updatedAt": datetime.now(timezone.utc)}
+    if "lineTotal" in changed or current.get("tax") is None:
+        priced = ticket_totals.price(transaction, {**current, **changed}, previous=current)
+        update_data.update(taxRate=priced["taxRate"], tax=priced["tax"])
+    return update_data
+
+def line_of(transaction_id: str, line_id: str, stored: dict) -> dict:
+    """The stored line, or LookupError if it doesn't exist on this transaction"""
+    line = stored.get(line_id)
+    if not line or line.get("transactionId") != transaction_id:
+        raise LookupError("Transaction line not found")
+    return line
+
+@app.put("/transactions/{transaction_id}/lines/{line_id}", response_model=APIResponse)
+def update_transaction_line(transaction_id: str, line_id: str, line_update: TransactionLineUpdate):
+    """Update a transaction line"""
+    changed = {k: v for k, v in line_update.model_dump().items() if v is not None}
+    try:
+        # Read, re-price and write in one transaction so concurrent edits each move the header once
+        ticket_totals.edit_lines(transaction_id, lambda transaction, stored: (
+            {}, {line_id: line_changes(transaction, line_of(transaction_id, line_id, stored), changed)}, []
+        ), line_ids=[line_id])
+        
+        return APIResponse(
+            success=True,
+            message="Transaction line updated successfully"
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
+
+@app.delete("/transactions/{transaction_id}/lines/{line_id}", response_model=APIResponse)
+def delete_transaction_line(transaction_id: str, line_id: str):
+    """Delete a transaction line"""
+    try:
+        ticket_totals.edit_lines(transaction_id, lambda transaction, stored: (
+            {}, {}, [line_of(transaction_id, line_id, stored)["id"]]
+        ), line_ids=[line_id])
+        
+        return APIResponse(
+            success=True,
+            message="Transaction line deleted successfully"
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
+
+# Background job status
+@app.get("/jobs/{job_id}", response_model=APIResponse)
+def get_job(job_id: str):
+    """Progress of a background cascade delete"""
+    try:
+        job = cascade_deleter.status(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return APIResponse(
+            success=True,
+            message=f"Job is {job['status']}",
+            data={"job": job}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise service_error(e)
+
+# Payment endpoints
+@app.post("/payments", response_model=APIResponse)
+def create_payment(payment: PaymentCreate):
+    """Record a payment and settle the ticket's paid amount, balance and status in one commit"""
+    try:
+        payment_id, transaction = payment_ledger.record({**payment.model_dump(), "method": payment.method.value})
+        if transaction.get("settledAt") and transaction.get("status") == TransactionStatus.COMPLETE:
+            link_customer(payment.transactionId, transaction)
+        
+        return APIResponse(
+            success=True,
+            message="Payment recorded successfully",
+            data={"id": payment_id, "transaction": round_money(transaction)}
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except PaymentRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
+
+@app.get("/transactions/{transaction_id}/payments", response_model=APIResponse)
+def get_transaction_payments(transaction_id: str):
+    """Get the payments recorded against a transaction, oldest first"""
     try:
-        # Check if transaction exists
         transaction = firebase_service.get_transaction(transaction_id)
         if not transaction:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
-        line_data = {
-            "transactionId": transaction_id,
-            "itemId": line.itemId,
-            "itemName": line.itemName,
-            "itemType": line.itemType,
-            "quantity": line.quantity,
-            "unitPrice": line.unitPrice,
-            "lineTotal": line.lineTotal,
-            "technicianId": line.technicianId,
-            "serviceDuration": line.serviceDuration,
-            "notes": line.notes,
-            "createdAt": datetime.now(),
-            "updatedAt": datetime.now()
-        }
-        
-        line_id = firebase_service.create_transaction_line(line_data)
+        payments = payment_ledger.for_transaction(transaction_id)
         
         return APIResponse(
             success=True,
-            message="Transaction line added successfully",
-            data={"line_id": line_id}
+            message=f"Retrieved {len(payments)} payments",
+            data={
+                "payments": payments,
+                "paidAmount": transaction.get("paidAmount", 0.0),
+                "balance": transaction.get("balance", transaction.get("total"))
+            }
         )
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise service_error(e)
+
+@app.delete("/payments/{payment_id}", response_model=APIResponse)
+def delete_payment(payment_id: str):
+    """Remove a payment and re-settle its ticket"""
+    try:
+        transaction = payment_ledger.remove(payment_id)
+        
+        return APIResponse(
+            success=True,
+            message="Payment deleted successfully",
+            data={"transaction": round_money(transaction)}
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise service_error(e)
 
 if __name__ == "__main__":
     host = os.getenv("API_HOST", "127.0.0.1")
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
+from request_context import served_stale
 
 class UserBase(BaseModel):
     email: str
@@ -31,6 +32,7 @@ class CompanyCreate(BaseModel):
     email: str
     website: Optional[str] = None
     taxId: Optional[str] = None
+    taxRate: Optional[float] = Field(None, ge=0, le=100)  # percent applied to transaction lines
     logoUrl: Optional[str] = None
 
 class CompanyUpdate(BaseModel):
@@ -40,6 +42,7 @@ class CompanyUpdate(BaseModel):
     email: Optional[str] = None
     website: Optional[str] = None
     taxId: Optional[str] = None
+    taxRate: Optional[float] = Field(None, ge=0, le=100)
     logoUrl: Optional[str] = None
     isActive: Optional[bool] = None
 
@@ -71,6 +74,7 @@ class CategoryCreate(BaseModel):
     name: str
     description: str
     color: Optional[str] = None
+    companyId: Optional[str] = None  # defaults to the request's company
 
 class CategoryUpdate(BaseModel):
     name: Optional[str] = None
@@ -88,6 +92,7 @@ class ItemCreate(BaseModel):
     durationMinutes: Optional[int] = None
     sku: Optional[str] = None
     stockQuantity: Optional[int] = None
+    companyId: Optional[str] = None  # defaults to the request's company
 
 class ItemUpdate(BaseModel):
     name: Optional[str] = None
@@ -122,8 +127,11 @@ class ItemType(str, Enum):
 
 class TransactionCreate(BaseModel):
     companyId: str
-    transactionNumber: str
+    # Assigned by the server; a client-generated number is kept as clientTransactionNumber
+    transactionNumber: Optional[str] = None
     transactionDate: datetime
+    # The shop's offset from UTC; its local day of transactionDate numbers the ticket
+    utcOffsetMinutes: Optional[int] = Field(None, ge=-14 * 60, le=14 * 60)
     customerId: Optional[str] = None
     customerName: Optional[str] = None
     customerPhone: Optional[str] = None
@@ -131,14 +139,16 @@ class TransactionCreate(BaseModel):
     employeeId: str
     status: TransactionStatus = TransactionStatus.NEW
     paymentMethod: PaymentMethod = PaymentMethod.CASH
+    # Walk-in queue order: higher priority first, then arrival; a requested technician gets the ticket
+    priority: int = 0
+    requestedTechnicianId: Optional[str] = None
+    # subtotal, tax and total are maintained by the server from the lines; sent values are ignored
     subtotal: float = 0.0
     tax: float = 0.0
     discount: float = 0.0
     tip: float = 0.0
     total: float = 0.0
     notes: Optional[str] = None
-    createdAt: Optional[datetime] = None
-    updatedAt: Optional[datetime] = None
 
 class TransactionUpdate(BaseModel):
     customerId: Optional[str] = None
@@ -147,6 +157,9 @@ class TransactionUpdate(BaseModel):
     customerEmail: Optional[str] = None
     status: Optional[TransactionStatus] = None
     paymentMethod: Optional[PaymentMethod] = None
+    priority: Optional[int] = None
+    requestedTechnicianId: Optional[str] = None
+    # Ignored, see TransactionCreate
     subtotal: Optional[float] = None
     tax: Optional[float] = None
     discount: Optional[float] = None
@@ -164,17 +177,178 @@ class TransactionLineCreate(BaseModel):
     lineTotal: float
     technicianId: Optional[str] = None
     serviceDuration: Optional[int] = None
+    scheduledStart: Optional[datetime] = None  # when the service is booked; the ticket's date if unset
     notes: Optional[str] = None
 
+class TransactionLineReplace(TransactionLineCreate):
+    # Lines without an ID (or with one not yet stored) are created
+    id: Optional[str] = Field(None, pattern=r"^[^/]+$")
+    transactionId: Optional[str] = None
+
 class TransactionLineUpdate(BaseModel):
     quantity: Optional[int] = None
     unitPrice: Optional[float] = None
     lineTotal: Optional[float] = None
     technicianId: Optional[str] = None
     serviceDuration: Optional[int] = None
+    scheduledStart: Optional[datetime] = None
     notes: Optional[str] = None
 
+class QueueAssign(BaseModel):
+    technicianId: str
+
+class PaymentCreate(BaseModel):
+    # Client-generated IDs make a retried payment idempotent
+    id: Optional[str] = Field(None, pattern=r"^[^/]+$")
+    transactionId: str
+    method: PaymentMethod
+    amount: float = Field(..., gt=0)
+    paymentDate: Optional[datetime] = None
+    referenceNumber: Optional[str] = None
+    notes: Optional[str] = None
+    createdAt: Optional[datetime] = None
+
 class APIResponse(BaseModel):
     success: bool
     message: str
-    data: Optional[dict] = None
\ No newline at end of file
+    data: Optional[dict] = None
+    # True when any of the data came from the last-known-good cache
+    stale: bool = Field(default_factory=served_stale)
+
+# Response models. Documents read back from Firestore were validated on write,
+# so responses are assembled with model_construct (no validation) and rendered
+# by the models' compiled serializers, see responses.trusted_response.
+class StoredDocument(BaseModel):
+    # Fields not declared here (added by newer writers) are passed through
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+
+    @classmethod
+    def from_store(cls, document: dict):
+        return cls.model_construct(**document)
+
+class TransactionOut(StoredDocument):
+    companyId: Optional[str] = None
+    transactionNumber: Optional[str] = None
+    clientTransactionNumber: Optional[str] = None
+    transactionDate: Optional[datetime] = None
+    customerId: Optional[str] = None
+    customerName: Optional[str] = None
+    customerPhone: Optional[str] = None
+    customerEmail: Optional[str] = None
+    employeeId: Optional[str] = None
+    status: Optional[TransactionStatus] = None
+    paymentMethod: Optional[PaymentMethod] = None
+    subtotal: Optional[float] = None
+    tax: Optional[float] = None
+    discount: Optional[float] = None
+    tip: Optional[float] = None
+    total: Optional[float] = None
+    paidAmount: Optional[float] = None
+    balance: Optional[float] = None
+    paidByMethod: Optional[Dict[str, float]] = None
+    settledAt: Optional[datetime] = None
+    priority: Optional[int] = None
+    requestedTechnicianId: Optional[str] = None
+    technicianId: Optional[str] = None  # set when the walk-in queue assigns the ticket
+    assignedAt: Optional[datetime] = None
+    notes: Optional[str] = None
+    archived: Optional[bool] = None  # set on transactions read from the archive
+
+class TransactionLineOut(StoredDocument):
+    transactionId: Optional[str] = None
+    companyId: Optional[str] = None
+    transactionDate: Optional[datetime] = None
+    itemId: Optional[str] = None
+    itemName: Optional[str] = None
+    itemType: Optional[ItemType] = None
+    quantity: Optional[int] = None
+    unitPrice: Optional[float] = None
+    lineTotal: Optional[float] = None
+    taxRate: Optional[float] = None
+    tax: Optional[float] = None
+    technicianId: Optional[str] = None
+    serviceDuration: Optional[int] = None
+    scheduledStart: Optional[datetime] = None
+    notes: Optional[str] = None
+
+class ItemOut(StoredDocument):
+    companyId: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    type: Optional[str] = None
+    categoryId: Optional[str] = None
+    price: Optional[float] = None
+    durationMinutes: Optional[int] = None
+    sku: Optional[str] = None
+    stockQuantity: Optional[int] = None
+    isActive: Optional[bool] = None
+
+class EmployeeOut(StoredDocument):
+    uid: Optional[str] = None
+    companyId: Optional[str] = None
+    email: Optional[str] = None
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
+    phone: Optional[str] = None
+    role: Optional[str] = None
+    hourlyRate: Optional[float] = None
+    commissionRate: Optional[float] = None
+    hiredDate: Optional[datetime] = None
+    isActive: Optional[bool] = None
+
+class TransactionData(BaseModel):
+    transaction: TransactionOut
+
+    @classmethod
+    def from_store(cls, transaction: dict) -> "TransactionData":
+        return cls.model_construct(transaction=TransactionOut.from_store(transaction))
+
+class TransactionList(BaseModel):
+    transactions: List[TransactionOut]
+    archived: Optional[int] = None  # how many came from the archive (date range queries only)
+
+    @classmethod
+    def from_store(cls, transactions: list, **extra) -> "TransactionList":
+        return cls.model_construct(transactions=[TransactionOut.from_store(t) for t in transactions], **extra)
+
+class TransactionLineList(BaseModel):
+    lines: List[TransactionLineOut]
+
+    @classmethod
+    def from_store(cls, lines: list) -> "TransactionLineList":
+        return cls.model_construct(lines=[TransactionLineOut.from_store(line) for line in lines])
+
+class ItemList(BaseModel):
+    items: List[ItemOut]
+    count: int
+
+    @classmethod
+    def from_store(cls, items: list) -> "ItemList":
+        return cls.model_construct(items=[ItemOut.from_store(item) for item in items], count=len(items))
+
+class EmployeeList(BaseModel):
+    employees: List[EmployeeOut]
+    count: int
+
+    @classmethod
+    def from_store(cls, employees: list) -> "EmployeeList":
+        return cls.model_construct(employees=[EmployeeOut.from_store(e) for e in employees], count=len(employees))
+
+class TransactionResponse(APIResponse):
+    data: Optional[TransactionData] = None
+
+class TransactionListResponse(APIResponse):
+    data: Optional[TransactionList] = None
+
+class TransactionLineListResponse(APIResponse):
+    data: Optional[TransactionLineList] = None
+
+class ItemListResponse(APIResponse):
+    data: Optional[ItemList] = None
+
+class EmployeeListResponse(APIResponse):
+    data: Optional[EmployeeList] = None
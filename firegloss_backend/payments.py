@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+from request_context import current_company
+from totals import CLOSED_STATUSES, settle, ticket_total
+
+PAYMENTS_COLLECTION = "payments"
+
+
+class PaymentRejected(Exception):
+    """The payment conflicts with the ticket's state or an earlier payment"""
+
+
+def _cents(value) -> float:
+    return round(float(value or 0.0), 2)
+
+
+class PaymentLedger:
+    """Payments against transactions, settled atomically.
+
+    Each payment is a ``payments`` document; the ticket's paidAmount,
+    balance (negative when change is due), paidByMethod and status are updated
+    in the same Firestore transaction that writes or deletes the payment, so
+    concurrent split tenders can't lose an update. A ticket whose balance
+    reaches zero is marked complete.
+    """
+
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+
+    def _collection(self, name: str):
+        return self.firebase_service.db.collection(name)
+
+    def _header(self, transaction, transaction_id: str):
+        ref = self._collection("transactions").document(transaction_id)
+        snapshot = ref.get(transaction=transaction)
+        header = snapshot.to_dict() if snapshot.exists else None
+        company_id = current_company()
+        if header is None or (company_id and header.get("companyId") not in (None, company_id)):
+            raise LookupError(f"Transaction {transaction_id} not found")
+        return ref, header
+
+    def record(self, payment: dict) -> tuple:
+        """Add a payment and settle its ticket; returns (payment ID, updated header).
+
+        A payment sent again with the same ID is not applied twice.
+        """
+        transaction_id = payment["transactionId"]
+
+        def apply(transaction):
+            payments = self._collection(PAYMENTS_COLLECTION)
+            payment_ref = payments.document(payment["id"]) if payment.get("id") else payments.document()
+            existing = payment_ref.get(transaction=transaction)
+            ref, header = self._header(transaction, transaction_id)
+            if existing.exists:
+                previous = existing.to_dict()
+                if previous["transactionId"] != transaction_id or _cents(previous["amount"]) != _cents(payment["amount"]):
+                    raise PaymentRejected(f"Payment {payment_ref.id} already exists with different details")
+                return payment_ref.id, header, {}
+            if header.get("status") in CLOSED_STATUSES:
+                raise PaymentRejected(f"Transaction {transaction_id} is {header['status']}")
+
+            now = datetime.now(timezone.utc)
+            paid_by_method = dict(header.get("paidByMethod") or {})
+            paid_by_method[payment["method"]] = _cents(paid_by_method.get(payment["method"], 0.0) + payment["amount"])
+            changes = settle(header, paid_by_method, now)
+            transaction.set(payment_ref, {
+                "transactionId": transaction_id,
+                "companyId": header.get("companyId"),
+                "method": payment["method"],
+                "amount": _cents(payment["amount"]),
+                "paymentDate": payment.get("paymentDate") or now,
+                "referenceNumber": payment.get("referenceNumber"),
+                "notes": payment.get("notes"),
+                "createdAt": payment.get("createdAt") or now,
+                "updatedAt": now,
+            })
+            transaction.update(ref, changes)
+            return payment_ref.id, {**header, **changes}, changes
+
+        payment_id, header, changes = self.firebase_service.run_transaction(
+            apply, writes_to=(PAYMENTS_COLLECTION, "transactions"))
+        if changes:
+            self.firebase_service.notify_write("transactions", "update", transaction_id, changes)
+        header["id"] = transaction_id
+        return payment_id, header
+
+    def remove(self, payment_id: str) -> dict:
+        """Delete a payment and re-settle its ticket; returns the updated header"""
+        def apply(transaction):
+            payment_ref = self._collection(PAYMENTS_COLLECTION).document(payment_id)
+            snapshot = payment_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                raise LookupError(f"Payment {payment_id} not found")
+            payment = snapshot.to_dict()
+            ref, header = self._header(transaction, payment["transactionId"])
+
+            now = datetime.now(timezone.utc)
+            paid_by_method = dict(header.get("paidByMethod") or {})
+            remaining = _cents(paid_by_method.get(payment["method"], 0.0) - payment["amount"])
+            if remaining > 0:
+                paid_by_method[payment["method"]] = remaining
+            else:
+                paid_by_method.pop(payment["method"], None)
+            changes = settle(header, paid_by_method, now)
+            transaction.delete(payment_ref)
+            transaction.update(ref, changes)
+            return {**header, **changes, "id": payment["transactionId"]}, changes
+
+        header, changes = self.firebase_service.run_transaction(apply, writes_to=(PAYMENTS_COLLECTION, "transactions"))
+        self.firebase_service.notify_write("transactions", "update", header["id"], changes)
+        return header
+
+    def update_header(self, transaction_id: str, update_data: dict) -> None:
+        """Apply a header update that moves the total (discount or tip), re-deriving total, balance and status"""
+        def apply(transaction):
+            ref, header = self._header(transaction, transaction_id)
+            header = {**header, **update_data}
+            changes = {**update_data, "total": ticket_total(header)}
+            header["total"] = changes["total"]
+            if header.get("paidByMethod"):
+                changes.update(settle(header, header["paidByMethod"], update_data.get("updatedAt") or
+                                       datetime.now(timezone.utc)))
+                # A status the client set explicitly wins over the derived one
+                changes.update({k: v for k, v in update_data.items() if k == "status"})
+            else:
+                changes["balance"] = changes["total"]
+            transaction.update(ref, changes)
+            return changes
+
+        changes = self.firebase_service.run_transaction(apply, idempotent=True, writes_to=("transactions",))
+        self.firebase_service.notify_write("transactions", "update", transaction_id, changes)
+
+    def for_transaction(self, transaction_id: str) -> list:
+        payments = self.firebase_service.get_payments(transaction_id)
+        return sorted(payments, key=lambda p: (p["paymentDate"], p["id"]))
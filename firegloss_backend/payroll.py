@@ -0,0 +1,133 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+
+# Only completed sales are paid out
+PAYABLE_STATUS = "complete"
+
+TRANSACTION_FIELDS = ["employeeId", "tip", "status"]
+LINE_FIELDS = ["transactionId", "technicianId", "itemType", "lineTotal", "serviceDuration"]
+
+
+def _column(rows: list, field: str, dtype, default) -> np.ndarray:
+    return np.fromiter((row.get(field) or default for row in rows), dtype=dtype, count=len(rows))
+
+
+def _sums(codes: np.ndarray, weights: np.ndarray, n: int) -> np.ndarray:
+    # A weighted bincount of nothing comes back as int64; the sums are always money or minutes
+    return np.bincount(codes, weights=weights, minlength=n).astype(np.float64)
+
+
+def compute_payroll(transactions: list, lines: list, employees: dict) -> list:
+    """Per-technician pay for a period, computed with vectorized group-bys.
+
+    ``transactions`` are the period's completed sales, ``lines`` their lines and
+    ``employees`` maps employee ID to its record. Commission is
+    ``commissionRate`` percent of service sales; each transaction's tip is split
+    across its lines in proportion to lineTotal (to the transaction's employee
+    when it has no priced lines); hourly pay covers service hours only.
+    """
+    transaction_index = {t["id"]: i for i, t in enumerate(transactions)}
+    lines = [line for line in lines if line.get("transactionId") in transaction_index]
+    tips = _column(transactions, "tip", np.float64, 0.0)
+
+    # Dictionary-encode technicians across line technicians and sale employees
+    line_technicians = [line.get("technicianId") or "" for line in lines]
+    sale_employees = [t.get("employeeId") or "" for t in transactions]
+    technician_ids, codes = np.unique(np.array(line_technicians + sale_employees, dtype=object).astype(str),
+                                      return_inverse=True)
+    codes = codes.reshape(-1)
+    line_codes, sale_codes = codes[:len(lines)], codes[len(lines):]
+    n = len(technician_ids)
+
+    line_transaction = np.fromiter((transaction_index[line["transactionId"]] for line in lines),
+                                   dtype=np.int64, count=len(lines))
+    line_total = _column(lines, "lineTotal", np.float64, 0.0)
+    minutes = _column(lines, "serviceDuration", np.float64, 0.0)
+    is_service = np.fromiter((line.get("itemType") == "service" for line in lines), dtype=bool, count=len(lines))
+
+    sales = _sums(line_codes, line_total, n)
+    service_sales = _sums(line_codes, np.where(is_service, line_total, 0.0), n)
+    service_minutes = _sums(line_codes, np.where(is_service, minutes, 0.0), n)
+    services = np.bincount(line_codes[is_service], minlength=n)
+
+    transaction_sales = _sums(line_transaction, line_total, len(transactions))
+    line_sales = transaction_sales[line_transaction]
+    share = np.divide(line_total, line_sales, out=np.zeros_like(line_total), where=line_sales > 0)
+    tips_earned = _sums(line_codes, tips[line_transaction] * share, n)
+    unallocated = transaction_sales <= 0
+    tips_earned += _sums(sale_codes[unallocated], tips[unallocated], n)
+
+    commission_rates = np.array([(employees.get(t) or {}).get("commissionRate") or 0.0 for t in technician_ids])
+    hourly_rates = np.array([(employees.get(t) or {}).get("hourlyRate") or 0.0 for t in technician_ids])
+    commission = service_sales * commission_rates / 100
+    service_hours = service_minutes / 60
+    hourly_pay = service_hours * hourly_rates
+    total_pay = commission + tips_earned + hourly_pay
+
+    results = []
+    for i in np.flatnonzero((sales != 0) | (tips_earned != 0)):
+        technician_id = str(technician_ids[i])
+        if not technician_id:
+            continue
+        employee = employees.get(technician_id) or {}
+        results.append({
+            "technicianId": technician_id,
+            "name": " ".join(filter(None, [employee.get("firstName"), employee.get("lastName")])) or None,
+            "services": int(services[i]),
+            "serviceSales": round(float(service_sales[i]), 2),
+            "productSales": round(float(sales[i] - service_sales[i]), 2),
+            "serviceHours": round(float(service_hours[i]), 2),
+            "commissionRate": float(commission_rates[i]),
+            "commission": round(float(commission[i]), 2),
+            "tips": round(float(tips_earned[i]), 2),
+            "hourlyRate": float(hourly_rates[i]),
+            "hourlyPay": round(float(hourly_pay[i]), 2),
+            "totalPay": round(float(total_pay[i]), 2),
+        })
+    results.sort(key=lambda r: -r["totalPay"])
+    return results
+
+
+class PayrollCalculator:
+    """Loads a pay period from Firestore and runs compute_payroll over it"""
+
+    def __init__(self, firebase_service):
+        self.firebase_service = firebase_service
+
+    def _load_lines(self, company_id: str, start: datetime, end: datetime, transactions: list) -> list:
+        lines = self.firebase_service.get_transaction_lines_between(company_id, start, end, LINE_FIELDS)
+        # Lines written before companyId/transactionDate were denormalized onto them
+        covered = {line["transactionId"] for line in lines}
+        missing = [t["id"] for t in transactions if t["id"] not in covered]
+        if missing:
+            lines += self.firebase_service.get_lines_for_transactions(missing, LINE_FIELDS)
+        return lines
+
+    def period(self, company_id: str, start_date: date, end_date: date) -> dict:
+        """Payroll for start_date through end_date inclusive (UTC days)"""
+        start = datetime.combine(start_date, time.min, tzinfo=timezone.utc)
+        end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+        transactions = [
+            t for t in self.firebase_service.get_transactions_between(company_id, start, end, TRANSACTION_FIELDS)
+            if t.get("status") == PAYABLE_STATUS
+        ]
+        lines = self._load_lines(company_id, start, end, transactions)
+        employees = {}
+        for employee in self.firebase_service.get_all_documents("employees", company_id=company_id):
+            employees[employee["id"]] = employee
+            employees.setdefault(employee.get("uid"), employee)
+
+        technicians = compute_payroll(transactions, lines, employees)
+        return {
+            "companyId": company_id,
+            "from": start_date.isoformat(),
+            "to": end_date.isoformat(),
+            "transactions": len(transactions),
+            "lines": len(lines),
+            "technicians": technicians,
+            "totals": {
+                key: round(sum(t[key] for t in technicians), 2)
+                for key in ("serviceSales", "productSales", "commission", "tips", "hourlyPay", "totalPay")
+            },
+        }
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+def query_shape(collection_name: str, filters=(), order_by=(), limit: Optional[int] = None,
+                aggregate: bool = False) -> tuple:
+    """A query without its values: what decides the index it needs and how much it can return"""
+    return (
+        collection_name,
+        tuple((field, op) for field, op, _ in filters),
+        tuple((field, direction) for field, direction in order_by),
+        limit is not None,
+        aggregate,
+    )
+
+
+def shape_dict(shape: tuple) -> dict:
+    collection_name, filters, order_by, limited, aggregate = shape
+    return {
+        "collection": collection_name,
+        "filters": [list(f) for f in filters],
+        "orderBy": [list(o) for o in order_by],
+        "limited": limited,
+        "aggregate": aggregate,
+    }
+
+
+class _ShapeStats:
+    def __init__(self, samples: int):
+        self.count = 0
+        self.errors = 0
+        self.last_error = None
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_documents = 0
+        self.max_documents = 0
+        self.latencies = deque(maxlen=samples)
+        self.last_logged = 0.0
+
+
+class QueryStats:
+    """Counts, latency and result sizes of Firestore queries, per query shape.
+
+    Shapes leave out filter values, so there are only as many as there are
+    query call sites and branches; ``max_shapes`` bounds memory all the same.
+    Queries slower than ``slow_seconds`` or returning more than
+    ``large_result`` documents are printed, at most once a minute per shape.
+    ``python index_advisor.py`` turns a snapshot into index recommendations.
+    """
+
+    def __init__(self, slow_seconds: float = 0.5, large_result: int = 1000, max_shapes: int = 500,
+                 samples: int = 256):
+        self.slow_seconds = slow_seconds
+        self.large_result = large_result
+        self.max_shapes = max_shapes
+        self.samples = samples
+        self._shapes = {}
+        self._lock = threading.Lock()
+
+    def record(self, shape: tuple, seconds: float, documents: int, error: Optional[Exception] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                if len(self._shapes) >= self.max_shapes:
+                    return
+                stats = self._shapes[shape] = _ShapeStats(self.samples)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.latencies.append(seconds)
+            stats.total_documents += documents
+            stats.max_documents = max(stats.max_documents, documents)
+            if error is not None:
+                stats.errors += 1
+                stats.last_error = f"{type(error).__name__}: {error}"
+            notable = error is not None or seconds > self.slow_seconds or documents > self.large_result
+            log = notable and now - stats.last_logged >= 60
+            if log:
+                stats.last_logged = now
+        if log:
+            outcome = f"failed ({type(error).__name__})" if error is not None else f"returned {documents} documents"
+            print(f"Query {shape_dict(shape)} took {seconds * 1000:.0f}ms and {outcome}")
+
+    def snapshot(self) -> list:
+        """Per-shape summaries, most total time first"""
+        with self._lock:
+            items = [(shape, stats, sorted(stats.latencies)) for shape, stats in self._shapes.items()]
+            summaries = []
+            for shape, stats, latencies in items:
+                summaries.append({
+                    **shape_dict(shape),
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "lastError": stats.last_error,
+                    "meanMs": round(stats.total_seconds / stats.count * 1000, 2),
+                    "p95Ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+                    "maxMs": round(stats.max_seconds * 1000, 2),
+                    "meanDocuments": round(stats.total_documents / stats.count, 1),
+                    "maxDocuments": stats.max_documents,
+                    "totalMs": round(stats.total_seconds * 1000, 2),
+                })
+        return sorted(summaries, key=lambda s: s["totalMs"], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+
+
+def query_stats_from_env() -> QueryStats:
+    return QueryStats(
+        slow_seconds=float(os.getenv("QUERY_SLOW_MS", 500)) / 1000,
+        large_result=int(os.getenv("QUERY_LARGE_RESULT_DOCUMENTS", 1000)),
+        max_shapes=int(os.getenv("QUERY_STATS_MAX_SHAPES", 500)),
+    )
@@ -0,0 +1,64 @@
+import contextvars
+import time
+from typing import Optional
+
+
+class RequestState:
+    """Per-request state shared between middleware, handlers and FirebaseService.
+
+    The object is mutable on purpose: handlers run in threadpool workers with a
+    copy of the request context, so they can only report back to the middleware
+    by mutating the state object, not by setting context variables.
+    """
+
+    def __init__(self, deadline: Optional[float] = None, company_id: Optional[str] = None):
+        self.deadline = deadline      # time.monotonic() value, None = unbounded
+        self.stale_age = None         # age in seconds of the oldest stale read served
+        self.company_id = company_id  # tenant the request acts for, None = unscoped
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the request budget, or None if there is no deadline"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+_current_request = contextvars.ContextVar("firegloss_request_state", default=None)
+
+
+def begin_request(budget_seconds: Optional[float] = None, company_id: Optional[str] = None) -> RequestState:
+    """Install fresh request state for the current context"""
+    deadline = time.monotonic() + budget_seconds if budget_seconds else None
+    state = RequestState(deadline, company_id)
+    _current_request.set(state)
+    return state
+
+
+def current_request() -> Optional[RequestState]:
+    """State of the request being served, or None outside a request"""
+    return _current_request.get()
+
+
+def current_company() -> Optional[str]:
+    """Company the current request is scoped to, None outside a request or when unscoped"""
+    state = _current_request.get()
+    return state.company_id if state else None
+
+
+def mark_stale(age_seconds: float) -> None:
+    """Record that the current request was answered from last-known-good data"""
+    state = _current_request.get()
+    if state is not None:
+        state.stale_age = max(state.stale_age or 0.0, age_seconds)
+
+
+def served_stale() -> bool:
+    """Whether the current request has served any stale data so far"""
+    state = _current_request.get()
+    return state is not None and state.stale_age is not None
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, None if unbounded"""
+    state = _current_request.get()
+    return state.remaining() if state else None
@@ -0,0 +1,408 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from google.api_core import exceptions as gcp_exceptions
+
+from request_context import remaining_time
+
+# Errors worth retrying; everything else (NotFound, InvalidArgument, ...) fails fast
+RETRYABLE_ERRORS = (
+    gcp_exceptions.ServiceUnavailable,
+    gcp_exceptions.InternalServerError,
+    gcp_exceptions.DeadlineExceeded,
+    gcp_exceptions.Aborted,
+    gcp_exceptions.ResourceExhausted,
+)
+
+
+class CircuitOpenError(gcp_exceptions.ServiceUnavailable):
+    """Raised without calling Firestore while the circuit breaker is open"""
+
+
+class RequestDeadlineExceeded(gcp_exceptions.DeadlineExceeded):
+    """The request's own budget ran out; says nothing about Firestore's health"""
+
+
+def budget_spent() -> bool:
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+class RetryPolicy:
+    """Per-operation deadlines plus jittered exponential backoff.
+
+    Each attempt gets ``min(op_timeout, time left in the request budget)`` as its
+    RPC timeout. Only idempotent operations are retried, using "full jitter"
+    backoff so retries from many workers do not synchronise.
+    """
+
+    def __init__(self, op_timeout: float = 5.0, max_attempts: int = 4,
+                 initial_backoff: float = 0.05, max_backoff: float = 1.0,
+                 multiplier: float = 2.0):
+        self.op_timeout = op_timeout
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+
+    def attempt_timeout(self) -> float:
+        """RPC timeout for the next attempt, raising if the budget is spent"""
+        remaining = remaining_time()
+        if remaining is None:
+            return self.op_timeout
+        if remaining <= 0:
+            raise RequestDeadlineExceeded("Request deadline exceeded")
+        return min(self.op_timeout, remaining)
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.max_backoff, self.initial_backoff * (self.multiplier ** attempt))
+        return random.uniform(0, ceiling)
+
+    def call(self, operation: Callable[[float], object], idempotent: bool = True):
+        """Run ``operation(timeout)`` under the deadline, retrying if allowed"""
+        attempts = self.max_attempts if idempotent else 1
+        for attempt in range(attempts):
+            timeout = self.attempt_timeout()
+            try:
+                return operation(timeout)
+            except RETRYABLE_ERRORS:
+                if attempt + 1 >= attempts:
+                    raise
+                delay = self.backoff(attempt)
+                remaining = remaining_time()
+                if remaining is not None and delay >= remaining:
+                    raise
+                time.sleep(delay)
+
+
+class LatencyTracker:
+    """Rolling window of operation latencies"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Hedger:
+    """Issues a backup request when the first one is slower than the p95.
+
+    Hedges are capped at ``max_ratio`` of calls so a slow backend does not see
+    its load doubled, and are only sent once enough samples exist to trust the
+    percentile estimate.
+    """
+
+    def __init__(self, max_workers: int = 16, min_delay: float = 0.005,
+                 max_ratio: float = 0.1, min_samples: int = 20):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firestore-hedge")
+        self.tracker = LatencyTracker()
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedges = 0
+
+    def _submit(self, operation: Callable[[], object]):
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self._timed, operation)
+
+    def _timed(self, operation: Callable[[], object]):
+        start = time.monotonic()
+        result = operation()
+        self.tracker.record(time.monotonic() - start)
+        return result
+
+    def call(self, operation: Callable[[], object]):
+        self.calls += 1
+        p95 = self.tracker.percentile(95)
+        if len(self.tracker) < self.min_samples or p95 is None:
+            return self._timed(operation)
+
+        primary = self._submit(operation)
+        done, _ = wait([primary], timeout=max(self.min_delay, p95))
+        if done or self.hedges >= self.calls * self.max_ratio:
+            return primary.result()
+
+        self.hedges += 1
+        pending = {primary, self._submit(operation)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> dict:
+        p95 = self.tracker.percentile(95)
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+        }
+
+
+class CircuitBreaker:
+    """Fails fast after repeated Firestore infrastructure errors.
+
+    closed -> open after ``failure_threshold`` consecutive failures; after
+    ``reset_timeout`` seconds one probe call is let through (half-open) and its
+    outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+        raise CircuitOpenError("Firestore circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """A call that ended without telling us anything; a probe may be sent again"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⚠️  Firestore circuit breaker opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def _result_size(value) -> int:
+    """Documents held by a cached read result, the unit of stale cache budgets"""
+    return len(value) if isinstance(value, list) else 1
+
+
+class StaleCache:
+    """Bounded LRU of last-known-good read results for degraded mode.
+
+    Bounded both by entry count and by ``max_documents``, the total number of
+    documents held (a list result counts each of its documents).
+    """
+
+    def __init__(self, max_entries: int = 1000, max_age: float = 3600.0, max_documents: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_documents = max_documents
+        self.documents = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, value) -> None:
+        size = _result_size(value)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.documents -= _result_size(previous[0])
+            if self.max_documents is not None and size > self.max_documents:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self.documents += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_documents is not None and self.documents > self.max_documents):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.documents -= _result_size(evicted)
+
+    def get(self, key):
+        """Return (value, age_seconds) or None if missing or too old"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age > self.max_age:
+                del self._entries[key]
+                self.documents -= _result_size(value)
+                return None
+            self._entries.move_to_end(key)
+            return value, age
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TenantStaleCache:
+    """One StaleCache per company, so a large tenant can't evict a small one's entries.
+
+    Each partition has its own entry and document budget; at most
+    ``max_tenants`` partitions are kept, least recently used dropped first.
+    Reads made outside any tenant share the ``None`` partition.
+    """
+
+    def __init__(self, max_tenants: int = 100, max_entries: int = 1000, max_age: float = 3600.0,
+                 max_documents: Optional[int] = None):
+        self.max_tenants = max_tenants
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_documents = max_documents
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def partition(self, company_id: Optional[str], create: bool = True) -> Optional[StaleCache]:
+        with self._lock:
+            cache = self._partitions.get(company_id)
+            if cache is None and create:
+                cache = StaleCache(self.max_entries, self.max_age, self.max_documents)
+                self._partitions[company_id] = cache
+                while len(self._partitions) > self.max_tenants:
+                    self._partitions.popitem(last=False)
+            if cache is not None:
+                self._partitions.move_to_end(company_id)
+            return cache
+
+    def put(self, key, value, company_id: Optional[str] = None) -> None:
+        self.partition(company_id).put(key, value)
+
+    def get(self, key, company_id: Optional[str] = None):
+        """Return (value, age_seconds) or None if missing or too old"""
+        cache = self.partition(company_id, create=False)
+        return cache.get(key) if cache else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(cache) for cache in self._partitions.values())
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls into one in-flight execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or exception). Followers give up
+    when their own request deadline passes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn: Callable[[], object]):
+        """Return (result, shared) where shared is True for followers"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            remaining = remaining_time()
+            try:
+                return future.result(timeout=None if remaining is None else max(0.0, remaining)), True
+            except FutureTimeoutError:
+                raise RequestDeadlineExceeded("Request deadline exceeded waiting for shared read")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def forget(self, predicate: Callable[[tuple], bool]) -> None:
+        """Stop new callers joining matching in-flight calls (e.g. after a write)"""
+        with self._lock:
+            for key in [k for k in self._calls if predicate(k)]:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "coalesced": self.coalesced}
+
+
+def retry_policy_from_env() -> RetryPolicy:
+    return RetryPolicy(
+        op_timeout=float(os.getenv("FIRESTORE_OP_TIMEOUT_SECONDS", 5)),
+        max_attempts=int(os.getenv("FIRESTORE_RETRY_MAX_ATTEMPTS", 4)),
+        initial_backoff=float(os.getenv("FIRESTORE_RETRY_INITIAL_BACKOFF_MS", 50)) / 1000,
+        max_backoff=float(os.getenv("FIRESTORE_RETRY_MAX_BACKOFF_MS", 1000)) / 1000,
+    )
+
+
+def hedger_from_env() -> Optional[Hedger]:
+    if os.getenv("FIRESTORE_HEDGED_READS", "False").lower() != "true":
+        return None
+    return Hedger(
+        min_delay=float(os.getenv("FIRESTORE_HEDGE_MIN_DELAY_MS", 5)) / 1000,
+        max_ratio=float(os.getenv("FIRESTORE_HEDGE_MAX_RATIO", 0.1)),
+    )
+
+
+def circuit_breaker_from_env() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv("FIRESTORE_BREAKER_FAILURE_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("FIRESTORE_BREAKER_RESET_SECONDS", 10)),
+    )
+
+
+def stale_cache_from_env() -> TenantStaleCache:
+    max_documents = int(os.getenv("STALE_CACHE_MAX_DOCUMENTS", 20000))
+    return TenantStaleCache(
+        max_tenants=int(os.getenv("STALE_CACHE_MAX_TENANTS", 100)),
+        max_entries=int(os.getenv("STALE_CACHE_MAX_ENTRIES", 1000)),
+        max_age=float(os.getenv("STALE_CACHE_MAX_AGE_SECONDS", 3600)),
+        max_documents=max_documents if max_documents > 0 else None,
+    )
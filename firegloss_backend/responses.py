@@ -0,0 +1,28 @@
+from typing import Type
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from models import APIResponse
+from request_context import served_stale
+
+
+class TrustedJSONResponse(Response):
+    """JSON rendered directly by a response model's compiled serializer.
+
+    FastAPI would otherwise dump a returned model, validate the dump against
+    response_model and serialize it again; returning a Response skips both
+    passes while the route's response_model still documents the schema.
+    Fields a document doesn't have are left out, as they were with plain dicts.
+    """
+    media_type = "application/json"
+
+    def render(self, content: BaseModel) -> bytes:
+        # Stored values are trusted, so type mismatches (an int price) are not warned about
+        return content.__pydantic_serializer__.to_json(content, exclude_unset=True, warnings=False)
+
+
+def trusted_response(response_model: Type[APIResponse], message: str, data: BaseModel) -> TrustedJSONResponse:
+    """A successful envelope around data built from stored documents, without validation"""
+    return TrustedJSONResponse(response_model.model_construct(
+        success=True, message=message, data=data, stale=served_stale()))
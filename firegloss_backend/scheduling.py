@@ -0,0 +1,405 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from request_context import current_company
+
+# Tickets whose service lines still hold a technician's time
+OPEN_STATUSES = ("newTransaction", "assigned", "inProgress", "onHold")
+TRANSACTION_FIELDS = ["companyId", "status", "transactionDate"]
+LINE_FIELDS = ["transactionId", "companyId", "technicianId", "serviceDuration", "scheduledStart"]
+
+
+def _timestamp(value) -> Optional[float]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+class _Node:
+    __slots__ = ("start", "end", "key", "priority", "left", "right", "max_end")
+
+    def __init__(self, start: float, end: float, key: str):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+def _fix(node: _Node) -> None:
+    node.max_end = max(node.end,
+                       node.left.max_end if node.left else node.end,
+                       node.right.max_end if node.right else node.end)
+
+
+def _rotate_right(node: _Node) -> _Node:
+    top = node.left
+    node.left = top.right
+    _fix(node)
+    top.right = node
+    _fix(top)
+    return top
+
+
+def _rotate_left(node: _Node) -> _Node:
+    top = node.right
+    node.right = top.left
+    _fix(node)
+    top.left = node
+    _fix(top)
+    return top
+
+
+def _insert(node: Optional[_Node], new: _Node) -> _Node:
+    if node is None:
+        return new
+    if (new.start, new.key) < (node.start, node.key):
+        node.left = _insert(node.left, new)
+        if node.left.priority > node.priority:
+            return _rotate_right(node)
+    else:
+        node.right = _insert(node.right, new)
+        if node.right.priority > node.priority:
+            return _rotate_left(node)
+    _fix(node)
+    return node
+
+
+def _join(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _join(left.right, right)
+        _fix(left)
+        return left
+    right.left = _join(left, right.left)
+    _fix(right)
+    return right
+
+
+def _remove(node: Optional[_Node], start: float, key: str) -> Optional[_Node]:
+    if node is None:
+        return None
+    if (start, key) == (node.start, node.key):
+        return _join(node.left, node.right)
+    if (start, key) < (node.start, node.key):
+        node.left = _remove(node.left, start, key)
+    else:
+        node.right = _remove(node.right, start, key)
+    _fix(node)
+    return node
+
+
+class IntervalTree:
+    """Half-open [start, end) intervals in a treap keyed by start, each node
+    holding the latest end in its subtree.
+
+    Insert, remove and "does anything overlap [start, end)" are O(log n)
+    expected; listing the k intervals in a window is O(k log n).
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def insert(self, start: float, end: float, key: str) -> None:
+        self._root = _insert(self._root, _Node(start, end, key))
+        self._size += 1
+
+    def remove(self, start: float, key: str) -> None:
+        self._root = _remove(self._root, start, key)
+        self._size -= 1
+
+    def find_overlap(self, start: float, end: float) -> Optional[tuple]:
+        """Some (start, end, key) overlapping [start, end), or None"""
+        node = self._root
+        while node is not None:
+            if node.start < end and start < node.end:
+                return node.start, node.end, node.key
+            # An interval on the left ending after start either overlaps or starts
+            # after end, and then so does everything on the right
+            if node.left is not None and node.left.max_end > start:
+                node = node.left
+            else:
+                node = node.right
+        return None
+
+    def overlapping(self, start: float, end: float) -> list:
+        """All (start, end, key) overlapping [start, end), by start"""
+        found = []
+
+        def visit(node):
+            if node is None or node.max_end <= start:
+                return
+            visit(node.left)
+            if node.start >= end:
+                return
+            if start < node.end:
+                found.append((node.start, node.end, node.key))
+            visit(node.right)
+
+        visit(self._root)
+        return found
+
+
+class TechnicianSchedule:
+    """Booked service time per technician, for availability queries.
+
+    A line with a ``technicianId`` and ``serviceDuration`` (minutes) on an open
+    ticket books that technician from its ``scheduledStart`` (the ticket's
+    ``transactionDate`` when unset). Bookings live in one interval tree per
+    (company, technician). A company is loaded from Firestore on its first
+    query, then kept current from FirebaseService write events; it is reloaded
+    in the background every ``refresh_interval`` seconds to pick up writes made
+    by other workers.
+    """
+
+    def __init__(self, firebase_service, refresh_interval: float = 300):
+        self.firebase_service = firebase_service
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._loaded = {}                 # company_id -> monotonic load time
+        self._company_transactions = {}   # company_id -> {transaction_id}
+        self._transactions = {}           # transaction_id -> header fields
+        self._transaction_lines = {}      # transaction_id -> {line_id}
+        self._lines = {}                  # line_id -> line fields
+        self._booked = {}                 # line_id -> (company_id, technician_id, start)
+        self._trees = {}                  # company_id -> {technician_id: IntervalTree}
+        self._building = None
+        self._pending = []
+        firebase_service.add_write_listener("transactions", self._on_transaction_write)
+        firebase_service.add_write_listener("transaction_lines", self._on_line_write)
+
+    # Index maintenance (callers hold self._lock)
+
+    def _interval(self, line: dict) -> Optional[tuple]:
+        transaction = self._transactions.get(line.get("transactionId"))
+        if transaction is None or transaction.get("status") not in OPEN_STATUSES:
+            return None
+        minutes = line.get("serviceDuration")
+        if not line.get("technicianId") or not isinstance(minutes, (int, float)) or minutes <= 0:
+            return None
+        start = _timestamp(line.get("scheduledStart")) or _timestamp(transaction.get("transactionDate"))
+        if start is None:
+            return None
+        return transaction["companyId"], line["technicianId"], start, start + minutes * 60
+
+    def _unbook(self, line_id: str) -> None:
+        booked = self._booked.pop(line_id, None)
+        if booked is None:
+            return
+        company_id, technician_id, start = booked
+        trees = self._trees[company_id]
+        trees[technician_id].remove(start, line_id)
+        if not len(trees[technician_id]):
+            del trees[technician_id]
+
+    def _book(self, line_id: str) -> None:
+        self._unbook(line_id)
+        interval = self._interval(self._lines[line_id])
+        if interval is None:
+            return
+        company_id, technician_id, start, end = interval
+        self._trees.setdefault(company_id, {}).setdefault(technician_id, IntervalTree()).insert(start, end, line_id)
+        self._booked[line_id] = (company_id, technician_id, start)
+
+    def _set_line(self, line_id: str, line: dict) -> None:
+        previous = self._lines.get(line_id)
+        if previous is not None and previous.get("transactionId") != line.get("transactionId"):
+            self._transaction_lines.get(previous.get("transactionId"), set()).discard(line_id)
+        self._lines[line_id] = line
+        self._transaction_lines.setdefault(line.get("transactionId"), set()).add(line_id)
+        self._book(line_id)
+
+    def _remove_line(self, line_id: str) -> None:
+        self._unbook(line_id)
+        line = self._lines.pop(line_id, None)
+        if line is not None:
+            self._transaction_lines.get(line.get("transactionId"), set()).discard(line_id)
+
+    def _remove_transaction(self, transaction_id: str) -> None:
+        transaction = self._transactions.pop(transaction_id, None)
+        for line_id in self._transaction_lines.pop(transaction_id, set()):
+            self._unbook(line_id)
+            self._lines.pop(line_id, None)
+        if transaction is not None:
+            self._company_transactions.get(transaction["companyId"], set()).discard(transaction_id)
+
+    def _forget_company(self, company_id: str) -> None:
+        for transaction_id in list(self._company_transactions.pop(company_id, ())):
+            self._remove_transaction(transaction_id)
+        self._trees.pop(company_id, None)
+        self._loaded.pop(company_id, None)
+
+    def _apply(self, collection: str, event: str, document_id: str, data: Optional[dict],
+               company_hint: Optional[str]) -> None:
+        data = data or {}
+        if collection == "transaction_lines":
+            if event == "delete":
+                self._remove_line(document_id)
+            elif event in ("update", "merge"):
+                if document_id in self._lines:
+                    self._set_line(document_id, {**self._lines[document_id], **data})
+            elif data.get("transactionId") in self._transactions:
+                self._set_line(document_id, dict(data))
+            return
+
+        transaction = self._transactions.get(document_id)
+        if event == "delete":
+            self._remove_transaction(document_id)
+        elif transaction is not None:
+            merged = {**transaction, **data} if event in ("update", "merge") else {**data}
+            merged.setdefault("companyId", transaction["companyId"])
+            if merged.get("status") not in OPEN_STATUSES:
+                # Closed tickets free their technicians
+                self._remove_transaction(document_id)
+                return
+            self._transactions[document_id] = merged
+            for line_id in self._transaction_lines.get(document_id, ()):
+                self._book(line_id)
+        elif data.get("status") in OPEN_STATUSES:
+            company_id = data.get("companyId") or company_hint
+            if event in ("update", "merge"):
+                # A reopened ticket's lines were dropped when it closed
+                if company_id in self._loaded:
+                    self._forget_company(company_id)
+            elif company_id in self._loaded:
+                self._transactions[document_id] = {**data, "companyId": company_id}
+                self._company_transactions.setdefault(company_id, set()).add(document_id)
+
+    def _on_write(self, collection: str, event: str, document_id: str, data: Optional[dict]) -> None:
+        # Resolved now: the request that made the write owns this thread
+        company_hint = current_company()
+        with self._lock:
+            if self._building is not None:
+                self._pending.append((collection, event, document_id, data, company_hint))
+            self._apply(collection, event, document_id, data, company_hint)
+
+    def _on_transaction_write(self, event, document_id, data):
+        self._on_write("transactions", event, document_id, data)
+
+    def _on_line_write(self, event, document_id, data):
+        self._on_write("transaction_lines", event, document_id, data)
+
+    # Loading
+
+    def load(self, company_id: str) -> None:
+        """(Re)load a company's open tickets and their lines from Firestore"""
+        with self._build_lock:
+            with self._lock:
+                self._building = company_id
+                self._pending = []
+            try:
+                transactions = self.firebase_service.query_documents("transactions", [
+                    ("companyId", "==", company_id),
+                    ("status", "in", list(OPEN_STATUSES)),
+                ], fields=TRANSACTION_FIELDS)
+                lines = self.firebase_service.get_lines_for_transactions(
+                    [t["id"] for t in transactions], fields=LINE_FIELDS)
+            except Exception:
+                with self._lock:
+                    self._building = None
+                    self._pending = []
+                raise
+            with self._lock:
+                self._forget_company(company_id)
+                for transaction in transactions:
+                    transaction = {**transaction, "companyId": company_id}
+                    self._transactions[transaction.pop("id")] = transaction
+                self._company_transactions[company_id] = {t["id"] for t in transactions}
+                for line in lines:
+                    self._set_line(line.pop("id"), line)
+                self._loaded[company_id] = time.monotonic()
+                # Writes made while the queries ran may be missing from their results
+                for event in self._pending:
+                    self._apply(*event)
+                self._building = None
+                self._pending = []
+
+    def ensure_loaded(self, company_id: str) -> None:
+        loaded_at = self._loaded.get(company_id)
+        if loaded_at is None:
+            self.load(company_id)
+        elif time.monotonic() - loaded_at > self.refresh_interval:
+            # Only one refresh is started per interval
+            self._loaded[company_id] = time.monotonic()
+            threading.Thread(target=self._background_load, args=(company_id,), daemon=True).start()
+
+    def _background_load(self, company_id: str) -> None:
+        try:
+            self.load(company_id)
+        except Exception as e:
+            print(f"Schedule refresh for company {company_id} failed: {e}")
+
+    # Querying
+
+    def availability(self, company_id: str, technicians: dict, opens: datetime, closes: datetime,
+                     duration_minutes: int, at: Optional[datetime] = None) -> dict:
+        """Free windows between opens and closes long enough for the service, per technician.
+
+        ``technicians`` maps technician IDs to names; technicians with bookings
+        but not listed are included too. With ``at``, also lists who is free for
+        the whole service starting then (one O(log n) probe per technician).
+        """
+        self.ensure_loaded(company_id)
+        window_start, window_end = _timestamp(opens), _timestamp(closes)
+        duration = duration_minutes * 60
+        with self._lock:
+            trees = self._trees.get(company_id, {})
+            results = []
+            available_at = []
+            for technician_id in sorted(set(technicians) | set(trees)):
+                tree = trees.get(technician_id)
+                booked = tree.overlapping(window_start, window_end) if tree else []
+                free, cursor = [], window_start
+                for start, end, _ in booked:
+                    if start - cursor >= duration:
+                        free.append((cursor, start))
+                    cursor = max(cursor, end)
+                if window_end - cursor >= duration:
+                    free.append((cursor, window_end))
+                results.append({
+                    "technicianId": technician_id,
+                    "name": technicians.get(technician_id),
+                    "booked": [{"start": _datetime(start), "end": _datetime(end),
+                                "transactionId": self._lines[line_id].get("transactionId"), "lineId": line_id}
+                               for start, end, line_id in booked],
+                    "free": [{"start": _datetime(start), "end": _datetime(end),
+                              "latestStart": _datetime(end - duration)} for start, end in free],
+                })
+                if at is not None:
+                    start = _timestamp(at)
+                    if tree is None or tree.find_overlap(start, start + duration) is None:
+                        available_at.append(technician_id)
+        availability = {"technicians": results}
+        if at is not None:
+            availability["availableAt"] = available_at
+        return availability
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"companies": len(self._loaded), "openTransactions": len(self._transactions),
+                    "bookings": len(self._booked)}
+
+
+def technician_schedule_from_env(firebase_service) -> TechnicianSchedule:
+    return TechnicianSchedule(
+        firebase_service,
+        refresh_interval=float(os.getenv("SCHEDULE_REFRESH_SECONDS", 300)),
+    )
@@ -0,0 +1,343 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+# How much a match in each field counts towards an item's score
+FIELD_WEIGHTS = {"sku": 4.0, "name": 3.0, "category": 2.0, "description": 1.0}
+
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+FUZZY_MATCH = {1: 0.6, 2: 0.4}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> list:
+    """Lowercase, accent-folded alphanumeric tokens"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    return _TOKEN_RE.findall(folded)
+
+
+def max_edit_distance(token: str) -> int:
+    """Typo tolerance grows with the length of the query token"""
+    if len(token) < 4:
+        return 0
+    if len(token) < 8:
+        return 1
+    return 2
+
+
+class _TrieNode:
+    __slots__ = ("children", "terminal")
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+
+class PrefixTrie:
+    """Character trie over indexed terms for prefix and edit-distance lookups"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, term: str) -> None:
+        node = self.root
+        for ch in term:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.terminal = True
+
+    def remove(self, term: str) -> None:
+        path = [self.root]
+        for ch in term:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].terminal = False
+        # Prune now-empty branches
+        for depth in range(len(term), 0, -1):
+            node = path[depth]
+            if node.terminal or node.children:
+                break
+            del path[depth - 1].children[term[depth - 1]]
+
+    def prefixed(self, prefix: str, limit: int) -> list:
+        """Up to ``limit`` terms starting with prefix, shortest first"""
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        terms = []
+        level = [(prefix, node)]
+        while level and len(terms) < limit:
+            next_level = []
+            for text, current in level:
+                if current.terminal:
+                    terms.append(text)
+                    if len(terms) >= limit:
+                        break
+                for ch, child in current.children.items():
+                    next_level.append((text + ch, child))
+            level = next_level
+        return terms
+
+    def fuzzy(self, word: str, max_distance: int) -> list:
+        """(term, distance) pairs within Levenshtein ``max_distance`` of word"""
+        results = []
+        first_row = list(range(len(word) + 1))
+        stack = [(child, ch, ch, first_row) for ch, child in self.root.children.items()]
+        while stack:
+            node, ch, text, previous_row = stack.pop()
+            row = [previous_row[0] + 1]
+            for column in range(1, len(word) + 1):
+                row.append(min(
+                    row[column - 1] + 1,
+                    previous_row[column] + 1,
+                    previous_row[column - 1] + (word[column - 1] != ch),
+                ))
+            if node.terminal and row[-1] <= max_distance:
+                results.append((text, row[-1]))
+            if min(row) <= max_distance:
+                for next_ch, child in node.children.items():
+                    stack.append((child, next_ch, text + next_ch, row))
+        return results
+
+
+class _CompanyTerms:
+    """One company's postings and trie"""
+    __slots__ = ("postings", "trie")
+
+    def __init__(self):
+        self.postings = {}  # term -> {item_id: weight}
+        self.trie = PrefixTrie()
+
+
+class ItemSearchIndex:
+    """In-memory inverted index plus prefix trie over the item catalog.
+
+    Indexes ``name``, ``sku``, ``description`` and the category name, with
+    separate terms per company so a search only expands its own tenant's
+    terms; items without a company are not searchable. Built
+    from Firestore on first use, then kept current from FirebaseService write
+    events; a full rebuild runs in the background every ``refresh_interval``
+    seconds to pick up writes made by other workers.
+    """
+
+    def __init__(self, firebase_service, refresh_interval: float = 300, max_expansions: int = 50):
+        self.firebase_service = firebase_service
+        self.refresh_interval = refresh_interval
+        self.max_expansions = max_expansions
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._items = {}           # item_id -> item document
+        self._item_terms = {}      # item_id -> {term: weight}
+        self._companies = {}       # company_id -> _CompanyTerms
+        self._categories = {}      # category_id -> name
+        self._category_items = {}  # category_id -> {item_id}
+        self._built_at = None
+        self._building = False
+        self._pending = []
+        firebase_service.add_write_listener("items", self._on_item_write)
+        firebase_service.add_write_listener("item_categories", self._on_category_write)
+
+    # Index maintenance (callers hold self._lock)
+
+    def _terms_for(self, item: dict) -> dict:
+        terms = {}
+
+        def add(term, weight):
+            if weight > terms.get(term, 0.0):
+                terms[term] = weight
+
+        for field in ("name", "description"):
+            for token in tokenize(item.get(field)):
+                add(token, FIELD_WEIGHTS[field])
+        sku_tokens = tokenize(item.get("sku"))
+        for token in sku_tokens:
+            add(token, FIELD_WEIGHTS["sku"])
+        if len(sku_tokens) > 1:
+            add("".join(sku_tokens), FIELD_WEIGHTS["sku"])
+        for token in tokenize(self._categories.get(item.get("categoryId"))):
+            add(token, FIELD_WEIGHTS["category"])
+        return terms
+
+    def _remove_item(self, item_id: str) -> None:
+        item = self._items.pop(item_id, None)
+        terms = self._item_terms.pop(item_id, {})
+        if item is None:
+            return
+        self._category_items.get(item.get("categoryId"), set()).discard(item_id)
+        company = self._companies.get(item.get("companyId"))
+        if company is None:
+            return
+        for term in terms:
+            postings = company.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(item_id, None)
+            if not postings:
+                del company.postings[term]
+                company.trie.remove(term)
+        if not company.postings:
+            del self._companies[item["companyId"]]
+
+    def _index_item(self, item_id: str, item: dict) -> None:
+        self._remove_item(item_id)
+        item = {**item, "id": item_id}
+        self._items[item_id] = item
+        self._category_items.setdefault(item.get("categoryId"), set()).add(item_id)
+        if not item.get("companyId"):
+            return
+        company = self._companies.setdefault(item["companyId"], _CompanyTerms())
+        terms = self._terms_for(item)
+        self._item_terms[item_id] = terms
+        for term, weight in terms.items():
+            postings = company.postings.get(term)
+            if postings is None:
+                postings = company.postings[term] = {}
+                company.trie.add(term)
+            postings[item_id] = weight
+
+    def _apply(self, collection: str, event: str, document_id: str, data: Optional[dict]) -> None:
+        if collection == "item_categories":
+            if event == "delete":
+                self._categories.pop(document_id, None)
+            elif data is not None and "name" in data:
+                self._categories[document_id] = data["name"]
+            else:
+                return
+            for item_id in list(self._category_items.get(document_id, ())):
+                self._index_item(item_id, self._items[item_id])
+            return
+        if event == "delete":
+            self._remove_item(document_id)
+        elif event in ("update", "merge"):
+            self._index_item(document_id, {**self._items.get(document_id, {}), **(data or {})})
+        else:
+            self._index_item(document_id, data or {})
+
+    def _on_write(self, collection: str, event: str, document_id: str, data: Optional[dict]) -> None:
+        with self._lock:
+            if self._building:
+                self._pending.append((collection, event, document_id, data))
+            elif self._built_at is not None:
+                self._apply(collection, event, document_id, data)
+
+    def _on_item_write(self, event, document_id, data):
+        self._on_write("items", event, document_id, data)
+
+    def _on_category_write(self, event, document_id, data):
+        self._on_write("item_categories", event, document_id, data)
+
+    # Building
+
+    def rebuild(self) -> None:
+        """Reload the whole catalog from Firestore"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._pending = []
+        try:
+            categories = self.firebase_service.get_all_documents("item_categories", all_companies=True)
+            items = self.firebase_service.get_all_documents("items", all_companies=True)
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+        with self._lock:
+            self._items, self._item_terms, self._companies = {}, {}, {}
+            self._category_items = {}
+            self._categories = {c["id"]: c.get("name", "") for c in categories}
+            for item in items:
+                self._index_item(item["id"], item)
+            for event in self._pending:
+                self._apply(*event)
+            self._pending = []
+            self._building = False
+            self._built_at = time.monotonic()
+
+    def ensure_built(self) -> None:
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        elif time.monotonic() - self._built_at > self.refresh_interval and not self._building:
+            threading.Thread(target=self._background_rebuild, daemon=True).start()
+
+    def _background_rebuild(self) -> None:
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"Item search index refresh failed: {e}")
+
+    # Querying
+
+    def _expand(self, company: _CompanyTerms, token: str) -> list:
+        """A company's indexed terms matching a query token, with their match quality"""
+        matches = {}
+        if token in company.postings:
+            matches[token] = EXACT_MATCH
+        for term in company.trie.prefixed(token, self.max_expansions):
+            matches.setdefault(term, PREFIX_MATCH)
+        distance = max_edit_distance(token)
+        if distance:
+            for term, d in company.trie.fuzzy(token, distance):
+                if term not in matches:
+                    matches[term] = FUZZY_MATCH[d]
+        return list(matches.items())
+
+    def search(self, query: str, company_id: str, item_type: Optional[str] = None,
+               limit: int = 20, include_inactive: bool = False) -> list:
+        """Rank a company's items matching every query token (by prefix or with typos)"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.ensure_built()
+        with self._lock:
+            company = self._companies.get(company_id)
+            if company is None:
+                return []
+            scores = None
+            for token in tokens:
+                token_scores = {}
+                for term, quality in self._expand(company, token):
+                    for item_id, weight in company.postings.get(term, {}).items():
+                        score = quality * weight
+                        if score > token_scores.get(item_id, 0.0):
+                            token_scores[item_id] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {k: v + token_scores[k] for k, v in scores.items() if k in token_scores}
+                if not scores:
+                    return []
+
+            results = []
+            for item_id, score in scores.items():
+                item = self._items[item_id]
+                if item_type and item.get("type") != item_type:
+                    continue
+                if not include_inactive and item.get("isActive") is False:
+                    continue
+                results.append((score, item))
+        results.sort(key=lambda r: (-r[0], str(r[1].get("name", ""))))
+        return [{**item, "score": round(score, 3)} for score, item in results[:limit]]
+
+    def stats(self) -> dict:
+        return {"items": len(self._items), "companies": len(self._companies),
+                "terms": sum(len(company.postings) for company in self._companies.values())}
+
+
+def item_search_index_from_env(firebase_service) -> ItemSearchIndex:
+    return ItemSearchIndex(
+        firebase_service,
+        refresh_interval=float(os.getenv("ITEM_SEARCH_REFRESH_SECONDS", 300)),
+    )
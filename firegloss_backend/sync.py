@@ -0,0 +1,100 @@
+import base64
+import contextvars
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from firebase_service import SYNCED_COLLECTIONS, TENANT_SCOPED_COLLECTIONS, TOMBSTONE_TTL_DAYS
+
+
+def encode_token(since: datetime) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"since": since.isoformat()}).encode()).decode()
+
+
+def decode_token(token: str) -> datetime:
+    try:
+        since = datetime.fromisoformat(json.loads(base64.urlsafe_b64decode(token.encode()))["since"])
+    except (KeyError, TypeError) as e:
+        raise ValueError("Malformed sync token") from e
+    if since.tzinfo is None:
+        raise ValueError("Sync token has no timezone")
+    return since
+
+
+def _as_utc(value) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class DeltaSync:
+    """Changes and deletes since a sync token, for offline clients.
+
+    A token is the server time the previous sync started, minus ``clock_skew``
+    so writes committed while that sync ran are not missed; clients must upsert
+    idempotently since a document can be sent twice. Tokens older than the
+    tombstone TTL (or no token) get a full snapshot instead of a delta.
+    """
+
+    def __init__(self, firebase_service, clock_skew: float = 5.0, tombstone_ttl_days: float = TOMBSTONE_TTL_DAYS):
+        self.firebase_service = firebase_service
+        self.clock_skew = clock_skew
+        self.tombstone_ttl = timedelta(days=tombstone_ttl_days)
+
+    def _changes(self, collection_name: str, since: Optional[datetime], company_id: Optional[str]) -> list:
+        if company_id and collection_name == "companies":
+            # A tenant only syncs its own company document
+            document = self.firebase_service.get_document("companies", company_id, allow_stale=False)
+            if document is None or (since is not None and (_as_utc(document.get("updatedAt")) or since) <= since):
+                return []
+            return [{**document, "id": company_id}]
+        scoped = company_id if collection_name in TENANT_SCOPED_COLLECTIONS else None
+        return self.firebase_service.get_documents_updated_since(collection_name, since, company_id=scoped)
+
+    def sync(self, token: Optional[str], collections: list, company_id: Optional[str] = None) -> dict:
+        unknown = set(collections) - set(SYNCED_COLLECTIONS)
+        if unknown:
+            raise ValueError(f"Unsupported collections: {', '.join(sorted(unknown))}")
+        started = datetime.now(timezone.utc)
+        since = decode_token(token) if token else None
+        full = since is None or since < started - self.tombstone_ttl
+        if full:
+            since = None
+
+        executor = self.firebase_service.query_executor
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, self._changes, name, since, company_id)
+            for name in collections
+        }
+        # Only the tenant's own deletes; a tombstone without a company belongs to no tenant
+        tombstones = (
+            executor.submit(contextvars.copy_context().run,
+                            self.firebase_service.get_tombstones_since, collections, since, company_id)
+            if since is not None else None
+        )
+        changes = {name: {d["id"]: d for d in future.result()} for name, future in futures.items()}
+
+        deleted = {name: [] for name in collections}
+        for tombstone in (tombstones.result() if tombstones else []):
+            name, document_id = tombstone["collection"], tombstone["documentId"]
+            current = changes[name].get(document_id)
+            # A document re-created after its delete is reported as changed only
+            if current is not None and (_as_utc(current.get("updatedAt")) or since) > tombstone["deletedAt"]:
+                continue
+            changes[name].pop(document_id, None)
+            deleted[name].append(document_id)
+
+        return {
+            "token": encode_token(started - timedelta(seconds=self.clock_skew)),
+            "full": full,
+            "changes": {name: list(documents.values()) for name, documents in changes.items()},
+            "deleted": deleted,
+        }
+
+
+def delta_sync_from_env(firebase_service) -> DeltaSync:
+    return DeltaSync(
+        firebase_service,
+        clock_skew=float(os.getenv("SYNC_CLOCK_SKEW_SECONDS", 5)),
+    )
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, Priority, classify
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def waiting(controller, priority):
+    """Start an acquire that has to queue, and let it reach the queue"""
+    task = asyncio.create_task(controller.acquire(priority))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_a_full_queue_rejects_the_arrival():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, retry_after=2)
+        await controller.acquire(Priority.CRITICAL)
+        queued = await waiting(controller, Priority.NORMAL)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(Priority.NORMAL)
+        assert rejected.value.retry_after == 2
+        assert controller.rejected[Priority.NORMAL] == 1
+
+        controller.release(Priority.CRITICAL)
+        await queued
+        assert controller.running[Priority.NORMAL] == 1
+
+    run(scenario())
+
+
+def test_a_full_queue_sheds_lower_priority_waiters_for_higher_priority_work():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=1)
+        await controller.acquire(Priority.NORMAL)
+        low = await waiting(controller, Priority.LOW)
+        critical = await waiting(controller, Priority.CRITICAL)
+
+        with pytest.raises(AdmissionRejected):
+            await low
+        controller.release(Priority.NORMAL)
+        await critical
+        assert controller.running[Priority.CRITICAL] == 1
+        assert controller.queued == 0
+
+    run(scenario())
+
+
+def test_queued_requests_time_out_and_free_their_place():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.01)
+        await controller.acquire(Priority.CRITICAL)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(Priority.NORMAL)
+        assert controller.queued == 0
+
+    run(scenario())
+
+
+def test_the_request_budget_shortens_the_queue_wait():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire(Priority.CRITICAL)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(Priority.NORMAL, timeout=0.01)
+        assert controller.queued == 0
+
+    run(scenario())
+
+
+def test_freed_slots_go_to_the_highest_priority_waiter():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=1, max_queue=4)
+        await controller.acquire(Priority.NORMAL)
+        low = await waiting(controller, Priority.LOW)
+        critical = await waiting(controller, Priority.CRITICAL)
+
+        controller.release(Priority.NORMAL)
+        await critical
+        assert not low.done()
+        controller.release(Priority.CRITICAL)
+        await low
+
+    run(scenario())
+
+
+def test_low_priority_work_leaves_headroom():
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, max_queue=4, low_priority_share=0.5)
+        await controller.acquire(Priority.LOW)
+        low = await waiting(controller, Priority.LOW)
+        await controller.acquire(Priority.CRITICAL)
+        assert not low.done()
+        controller.release(Priority.CRITICAL)
+        controller.release(Priority.LOW)
+        await low
+
+    run(scenario())
+
+
+def test_routes_are_classified():
+    assert classify("POST", "/transactions") == Priority.CRITICAL
+    assert classify("PUT", "/transactions/t1/lines/l1") == Priority.CRITICAL
+    assert classify("GET", "/transactions") == Priority.LOW
+    assert classify("PUT", "/items/i1") == Priority.NORMAL
+    assert classify("GET", "/") is None
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+from analytics import SalesAnalytics
+
+
+class SnapshotSource:
+    """Stands in for FirebaseService with fixed documents"""
+
+    def __init__(self, transactions, lines, items=(), employees=()):
+        self.documents = {"transactions": transactions, "transaction_lines": lines,
+                          "items": list(items), "item_categories": [], "employees": list(employees)}
+        self.listeners = {}
+
+    def add_write_listener(self, collection_name, listener):
+        self.listeners[collection_name] = listener
+
+    def get_documents_updated_since(self, collection_name, since, fields=None):
+        return list(self.documents[collection_name])
+
+    def get_all_documents(self, collection_name, company_id=None, all_companies=False):
+        return list(self.documents[collection_name])
+
+
+def sale(transaction_id, hour, total, employee="e1", company="c1", status="complete", tip=0.0):
+    when = datetime(2026, 3, 2, hour, tzinfo=timezone.utc)
+    return {"id": transaction_id, "companyId": company, "transactionDate": when, "employeeId": employee,
+            "status": status, "paymentMethod": "card", "total": total, "tip": tip, "updatedAt": when}
+
+
+def line(line_id, transaction_id, item, total, technician="e1"):
+    return {"id": line_id, "transactionId": transaction_id, "itemId": item, "technicianId": technician,
+            "itemType": "service", "quantity": 1, "lineTotal": total}
+
+
+def analytics():
+    source = SnapshotSource(
+        transactions=[sale("t1", 9, 30.0, tip=5.0), sale("t2", 9, 50.0, employee="e2"), sale("t3", 14, 20.0),
+                      sale("t4", 14, 99.0, status="voided"), sale("t5", 9, 70.0, company="c2")],
+        lines=[line("l1", "t1", "mani", 30.0), line("l2", "t2", "pedi", 50.0, technician="e2"),
+               line("l3", "t3", "mani", 25.0), line("l5", "t5", "pedi", 70.0)],
+        items=[{"id": "mani", "name": "Manicure"}, {"id": "pedi", "name": "Pedicure"}],
+        employees=[{"id": "e1", "firstName": "Ann", "lastName": "Lee"}],
+    )
+    return SalesAnalytics(source), source
+
+
+def test_transaction_groupings_filter_by_company_and_status():
+    report, _ = analytics()
+    hours = report.sales_report("c1", "hour", statuses=["complete"], utc_offset_minutes=-60)
+    assert [(g["key"], g["transactions"], g["revenue"]) for g in hours["groups"]] == [
+        ("08:00", 2, 80.0), ("13:00", 1, 20.0)]
+    assert hours["totals"] == {"transactions": 3, "revenue": 100.0, "tips": 5.0}
+
+    employees = report.sales_report("c1", "employee", statuses=["complete"])
+    assert [(g["key"], g.get("label"), g["averageTicket"]) for g in employees["groups"]] == [
+        ("e1", "Ann Lee", 25.0), ("e2", None, 50.0)]
+
+
+def test_line_groupings_join_their_transactions():
+    report, _ = analytics()
+    items = report.sales_report("c1", "item", statuses=["complete"])
+    assert [(g["label"], g["lines"], g["revenue"]) for g in items["groups"]] == [
+        ("Manicure", 2, 55.0), ("Pedicure", 1, 50.0)]
+
+
+def test_local_deletes_drop_out_of_reports():
+    report, source = analytics()
+    report.sales_report("c1", "status")
+    source.listeners["transactions"]("delete", "t1", None)
+    source.listeners["transaction_lines"]("delete", "l3", None)
+    assert report.sales_report("c1", "status")["totals"]["transactions"] == 3
+    assert report.sales_report("c1", "item")["totals"] == {"lines": 1, "revenue": 50.0}
@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from archive import ArchiveJob, TransactionArchive
+from customers import VISITS_COLLECTION
+from firebase_service import firebase_service
+
+client = TestClient(main.app)
+
+
+def old_sale(day, status):
+    when = datetime(2020, 5, day, 12, tzinfo=timezone.utc)
+    transaction_id = firebase_service.create_document("transactions", {
+        "companyId": "archive-co", "transactionNumber": f"TXN-202005{day:02d}-0001", "transactionDate": when,
+        "employeeId": "e1", "status": status, "paymentMethod": "card", "subtotal": 20.0, "tax": 0.0,
+        "discount": 0.0, "tip": 0.0, "total": 20.0, "createdAt": when, "updatedAt": when,
+    })
+    firebase_service.create_document("transaction_lines", {
+        "transactionId": transaction_id, "itemId": "mani", "itemName": "Manicure", "quantity": 1,
+        "unitPrice": 20.0, "lineTotal": 20.0, "createdAt": when, "updatedAt": when,
+    })
+    return transaction_id
+
+
+def test_closed_transactions_round_trip_through_the_archive(tmp_path, monkeypatch):
+    archived = [old_sale(1, "complete"), old_sale(2, "voided")]
+    still_open = old_sale(3, "inProgress")
+    visits = firebase_service.db.collection(VISITS_COLLECTION)
+    for transaction_id in (*archived, still_open):
+        visits.document(transaction_id).set({"customerId": "cust", "companyId": "archive-co",
+                                             "transactionId": transaction_id, "counted": True, "total": 20.0})
+    archive = TransactionArchive(str(tmp_path))
+
+    totals = ArchiveJob(firebase_service, archive, retention_days=365).run()
+    assert (totals["transactions"], totals["lines"], totals["partitions"]) == (2, 2, 2)
+    assert all(firebase_service.get_document("transactions", t) is None for t in archived)
+    assert firebase_service.get_lines_for_transactions(archived) == []
+    assert [visits.document(t).get().exists for t in (*archived, still_open)] == [False, False, True]
+
+    start, end = datetime(2020, 5, 1, tzinfo=timezone.utc), datetime(2020, 6, 1, tzinfo=timezone.utc)
+    records = archive.read("archive-co", start, end, include_lines=True)
+    assert sorted(r["id"] for r in records) == sorted(archived)
+    assert all(r["archived"] and r["transactionDate"].tzinfo and len(r["lines"]) == 1 for r in records)
+    assert not archive.covers("other-co", start, end)
+
+    monkeypatch.setattr(main, "transaction_archive", archive)
+    response = client.get("/transactions", params={"companyId": "archive-co", "from": "2020-05-01",
+                                                   "to": "2020-05-31"}, headers={"X-Company-Id": "archive-co"})
+    data = response.json()["data"]
+    assert data["archived"] == 2
+    assert [t["id"] for t in data["transactions"]] == [still_open, *reversed(archived)]
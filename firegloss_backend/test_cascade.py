@@ -0,0 +1,58 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from cascade import CascadeDeleter
+from firebase_service import firebase_service
+
+client = TestClient(main.app)
+
+
+def wait_for(deleter, job_id):
+    for _ in range(500):
+        job = deleter.status(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish: {job}")
+
+
+def remaining(collection_name, field, value):
+    return firebase_service.get_document_ids(collection_name, field, "==", value, 1000)
+
+
+def test_deleting_a_transaction_removes_its_lines_and_payments():
+    headers = {"X-Company-Id": "cascade-co"}
+    ticket = client.post("/transactions", json={"companyId": "cascade-co", "employeeId": "e1",
+                                                "transactionDate": "2026-03-02T10:00:00"},
+                         headers=headers).json()["data"]["transaction"]["id"]
+    client.put(f"/transactions/{ticket}/lines", headers=headers, json=[
+        {"itemId": "i1", "itemName": "Manicure", "itemType": "service", "quantity": 1, "unitPrice": 10,
+         "lineTotal": 10}])
+    client.post("/payments", json={"transactionId": ticket, "method": "cash", "amount": 5}, headers=headers)
+
+    job_id = client.delete(f"/transactions/{ticket}", headers=headers).json()["data"]["jobId"]
+    job = client.get(f"/jobs/{job_id}", headers=headers).json()["data"]["job"]
+    assert job["kind"] == "transaction"
+    assert wait_for(main.cascade_deleter, job_id)["deleted"] == {"transaction_lines": 1, "payments": 1}
+    assert remaining("transaction_lines", "transactionId", ticket) == []
+    assert remaining("payments", "transactionId", ticket) == []
+
+
+def test_deleting_a_company_removes_what_it_owned_page_by_page():
+    deleter = CascadeDeleter(firebase_service, page_size=2)
+    for company_id in ("gone-co", "kept-co"):
+        for _ in range(3):
+            transaction_id = firebase_service.create_document("transactions", {"companyId": company_id})
+            # Older lines carry only their transactionId
+            firebase_service.create_document("transaction_lines", {"transactionId": transaction_id})
+            firebase_service.create_document("employees", {"companyId": company_id})
+            firebase_service.create_document("items", {"companyId": company_id})
+
+    job = wait_for(deleter, deleter.delete_company("gone-co"))
+    assert job["status"] == "done"
+    assert job["deleted"] == {"transactions": 3, "transaction_lines": 3, "employees": 3, "items": 3}
+    for collection_name in ("transactions", "employees", "items"):
+        assert remaining(collection_name, "companyId", "gone-co") == []
+        assert len(remaining(collection_name, "companyId", "kept-co")) == 3
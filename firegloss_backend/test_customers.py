@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from customers import CustomerDirectory
+from firebase_service import firebase_service
+
+client = TestClient(main.app)
+HEADERS = {"X-Company-Id": "cust-co"}
+
+
+def sale(**fields):
+    return {"companyId": "cust-co", "transactionDate": "2026-01-05T10:00:00Z", "employeeId": "e1", **fields}
+
+
+def test_sales_with_the_same_contact_share_a_customer():
+    created = [client.post("/transactions", json=sale(customerName="Ana", customerPhone=phone),
+                           headers=HEADERS).json()["data"]["transaction"]
+               for phone in ("(555) 010-0001", "555.010.0001")]
+    assert created[0]["customerId"] and created[0]["customerId"] == created[1]["customerId"]
+
+    found = client.get("/customers/lookup", params={"companyId": "cust-co", "phone": "5550100001"},
+                       headers=HEADERS)
+    assert found.json()["data"]["customer"]["id"] == created[0]["customerId"]
+    assert found.json()["data"]["customer"]["visitCount"] == 2
+
+    client.delete(f"/transactions/{created[0]['id']}", headers=HEADERS)
+    history = client.get(f"/customers/{created[0]['customerId']}/history", headers=HEADERS).json()["data"]
+    assert history["customer"]["visitCount"] == 1
+    assert [visit["transactionId"] for visit in history["visits"]] == [created[1]["id"]]
+
+
+def test_totals_follow_edits_voids_and_moves():
+    directory = CustomerDirectory(firebase_service)
+    when = datetime(2026, 1, 6, tzinfo=timezone.utc)
+    transaction_id = firebase_service.create_document("transactions", {"companyId": "cust-co"})
+    ticket = {"companyId": "cust-co", "transactionDate": when, "customerEmail": "Bo@Example.com",
+              "status": "complete", "total": 40.0}
+
+    bo = directory.record_visit(transaction_id, ticket)
+    directory.record_visit(transaction_id, {**ticket, "total": 55.0})
+    assert (directory.get(bo)["visitCount"], directory.get(bo)["lifetimeTotal"]) == (1, 55.0)
+
+    directory.record_visit(transaction_id, {**ticket, "total": 55.0, "status": "voided"})
+    assert (directory.get(bo)["visitCount"], directory.get(bo)["lifetimeTotal"]) == (0, 0.0)
+
+    cy = directory.record_visit(transaction_id, {**ticket, "customerEmail": "cy@example.com"})
+    assert cy != bo
+    assert (directory.get(cy)["visitCount"], directory.get(cy)["lifetimeTotal"]) == (1, 40.0)
+    assert firebase_service.get_document("transactions", transaction_id)["customerId"] == cy
+
+
+def test_history_pages_newest_first():
+    directory = CustomerDirectory(firebase_service)
+    customer_id = None
+    for day in (1, 2, 3):
+        transaction_id = firebase_service.create_document("transactions", {"companyId": "cust-co"})
+        customer_id = directory.record_visit(transaction_id, {
+            "companyId": "cust-co", "transactionDate": datetime(2026, 2, day, tzinfo=timezone.utc),
+            "customerPhone": "555-020-0002", "status": "complete", "total": 10.0})
+
+    first = directory.history(customer_id, limit=2)
+    second = directory.history(customer_id, limit=2, cursor=first["nextCursor"])
+    days = [visit["transactionDate"].day for visit in first["visits"] + second["visits"]]
+    assert days == [3, 2, 1]
+    assert second["nextCursor"] is None
+
+
+def test_linking_a_customer_touches_the_transaction():
+    directory = CustomerDirectory(firebase_service)
+    stale = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    transaction_id = firebase_service.create_document("transactions", {"companyId": "cust-co", "updatedAt": stale})
+
+    customer_id = directory.record_visit(transaction_id, sale(customerPhone="555-010-0099", transactionDate=stale))
+    stored = firebase_service.get_document("transactions", transaction_id, allow_stale=False)
+    assert stored["customerId"] == customer_id
+    assert stored["updatedAt"] > stale
@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+HEADERS = {"X-Company-Id": "idem-co"}
+
+
+def ticket(employee_id="e1"):
+    return {"companyId": "idem-co", "transactionNumber": "T-1", "transactionDate": "2026-01-05T10:00:00Z",
+            "employeeId": employee_id}
+
+
+def test_a_retried_create_replays_the_first_response():
+    headers = {**HEADERS, "Idempotency-Key": "create-1"}
+    first = client.post("/transactions", json=ticket(), headers=headers)
+    retry = client.post("/transactions", json=ticket(), headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert "Idempotent-Replayed" not in first.headers
+
+
+def test_reusing_a_key_for_a_different_body_is_rejected():
+    headers = {**HEADERS, "Idempotency-Key": "create-2"}
+    assert client.post("/transactions", json=ticket(), headers=headers).status_code == 200
+    assert client.post("/transactions", json=ticket("e2"), headers=headers).status_code == 422
+
+
+def test_requests_without_a_key_are_not_deduplicated():
+    first = client.post("/transactions", json=ticket(), headers=HEADERS)
+    second = client.post("/transactions", json=ticket(), headers=HEADERS)
+    assert first.json()["data"] != second.json()["data"]
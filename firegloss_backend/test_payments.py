@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from firebase_service import firebase_service
+from payments import PaymentLedger, PaymentRejected
+
+client = TestClient(main.app)
+HEADERS = {"X-Company-Id": "pay-co"}
+
+
+def ticket(total=50.0, status="inProgress"):
+    return firebase_service.create_document("transactions", {"companyId": "pay-co", "total": total,
+                                                             "status": status})
+
+
+def test_split_tenders_settle_and_removal_reopens():
+    ledger = PaymentLedger(firebase_service)
+    transaction_id = ticket()
+    _, header = ledger.record({"transactionId": transaction_id, "method": "cash", "amount": 20.0})
+    assert (header["balance"], header["status"]) == (30.0, "inProgress")
+
+    card, header = ledger.record({"transactionId": transaction_id, "method": "card", "amount": 30.0})
+    assert (header["paidAmount"], header["balance"], header["status"]) == (50.0, 0.0, "complete")
+    assert header["paidByMethod"] == {"cash": 20.0, "card": 30.0}
+
+    header = ledger.remove(card)
+    assert (header["balance"], header["status"], header["paymentMethod"]) == (30.0, "inProgress", "cash")
+
+
+def test_a_retried_payment_is_applied_once():
+    ledger = PaymentLedger(firebase_service)
+    transaction_id = ticket()
+    payment = {"id": "pay-retry", "transactionId": transaction_id, "method": "card", "amount": 10.0}
+    ledger.record(payment)
+    _, header = ledger.record(payment)
+    assert header["paidAmount"] == 10.0
+    with pytest.raises(PaymentRejected):
+        ledger.record({**payment, "amount": 12.0})
+
+
+def test_payments_endpoints():
+    transaction_id = ticket()
+    closed = ticket(status="voided")
+    created = client.post("/payments", json={"transactionId": transaction_id, "method": "card", "amount": 50},
+                          headers=HEADERS)
+    assert created.json()["data"]["transaction"]["status"] == "complete"
+    assert client.post("/payments", json={"transactionId": closed, "method": "card", "amount": 5},
+                       headers=HEADERS).status_code == 409
+    assert client.post("/payments", json={"transactionId": "missing", "method": "card", "amount": 5},
+                       headers=HEADERS).status_code == 404
+
+    listed = client.get(f"/transactions/{transaction_id}/payments", headers=HEADERS).json()["data"]
+    assert [p["amount"] for p in listed["payments"]] == [50.0]
+    assert listed["balance"] == 0.0
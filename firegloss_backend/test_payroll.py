@@ -0,0 +1,84 @@
+from datetime import date
+
+from payroll import PayrollCalculator, compute_payroll
+
+
+class PeriodSource:
+    """Stands in for FirebaseService with fixed query results"""
+
+    def __init__(self, transactions=(), lines=(), employees=()):
+        self.transactions, self.lines, self.employees = list(transactions), list(lines), list(employees)
+
+    def get_transactions_between(self, company_id, start, end, fields=None):
+        return list(self.transactions)
+
+    def get_transaction_lines_between(self, company_id, start, end, fields=None):
+        return [line for line in self.lines if "companyId" in line]
+
+    def get_lines_for_transactions(self, transaction_ids, fields=None):
+        return [line for line in self.lines if line["transactionId"] in transaction_ids]
+
+    def get_all_documents(self, collection_name, company_id=None):
+        return list(self.employees)
+
+
+def test_empty_period():
+    assert compute_payroll([], [], {}) == []
+    report = PayrollCalculator(PeriodSource()).period("c1", date(2026, 1, 1), date(2026, 1, 31))
+    assert report["transactions"] == 0
+    assert report["technicians"] == []
+    assert report["totals"]["totalPay"] == 0
+
+
+def test_sales_without_lines_pay_tips_to_the_employee():
+    technicians = compute_payroll([{"id": "t1", "tip": 10, "employeeId": "e1"}], [], {})
+    assert len(technicians) == 1
+    assert technicians[0]["technicianId"] == "e1"
+    assert technicians[0]["tips"] == 10.0
+    assert technicians[0]["serviceSales"] == 0.0
+    assert technicians[0]["totalPay"] == 10.0
+
+
+def test_period_without_lines():
+    source = PeriodSource(
+        transactions=[{"id": "t1", "tip": 5, "employeeId": "e1", "status": "complete"},
+                      {"id": "t2", "tip": 7, "employeeId": "e1", "status": "cancelled"}],
+        employees=[{"id": "e1", "firstName": "Ann", "lastName": "Lee"}],
+    )
+    report = PayrollCalculator(source).period("c1", date(2026, 1, 1), date(2026, 1, 31))
+    assert report["transactions"] == 1
+    assert report["lines"] == 0
+    assert report["technicians"][0]["name"] == "Ann Lee"
+    assert report["totals"]["tips"] == 5.0
+
+
+def test_tips_split_by_line_total_and_commission_on_services():
+    transactions = [{"id": "t1", "tip": 10, "employeeId": "desk"}]
+    lines = [
+        {"transactionId": "t1", "technicianId": "e1", "itemType": "service", "lineTotal": 30, "serviceDuration": 60},
+        {"transactionId": "t1", "technicianId": "e2", "itemType": "product", "lineTotal": 10},
+    ]
+    employees = {"e1": {"commissionRate": 50, "hourlyRate": 12}}
+    pay = {t["technicianId"]: t for t in compute_payroll(transactions, lines, employees)}
+    assert pay["e1"]["tips"] == 7.5
+    assert pay["e2"]["tips"] == 2.5
+    assert pay["e1"]["commission"] == 15.0
+    assert pay["e1"]["hourlyPay"] == 12.0
+    assert pay["e2"]["productSales"] == 10.0
+    assert "desk" not in pay
+
+
+def test_period_pays_completed_sales_including_lines_without_dates():
+    source = PeriodSource(
+        transactions=[{"id": "t1", "tip": 0, "employeeId": "e1", "status": "complete"},
+                      {"id": "t2", "tip": 0, "employeeId": "e1", "status": "complete"},
+                      {"id": "t3", "tip": 0, "employeeId": "e1", "status": "cancelled"}],
+        lines=[{"transactionId": "t1", "companyId": "c1", "technicianId": "e1", "itemType": "service",
+                "lineTotal": 40},
+               {"transactionId": "t2", "technicianId": "e1", "itemType": "service", "lineTotal": 60}],
+        employees=[{"id": "e1", "companyId": "c1", "firstName": "Ann", "lastName": "Lee", "commissionRate": 10}],
+    )
+    report = PayrollCalculator(source).period("c1", date(2026, 1, 1), date(2026, 1, 31))
+    assert (report["transactions"], report["lines"]) == (2, 2)
+    assert report["technicians"][0]["serviceSales"] == 100.0
+    assert report["totals"]["commission"] == 10.0
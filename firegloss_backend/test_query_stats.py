@@ -0,0 +1,70 @@
+import json
+import sys
+
+from fastapi.testclient import TestClient
+
+import index_advisor
+import main
+from firebase_service import firebase_service
+from query_stats import QueryStats, query_shape
+
+
+def shape(collection, filters=(), order_by=(), limited=False, **stats):
+    return {"collection": collection, "filters": [list(f) for f in filters], "orderBy": [list(o) for o in order_by],
+            "limited": limited, "aggregate": False, "count": 1, "errors": 0, "lastError": None, "meanMs": 1.0,
+            "p95Ms": 1.0, "maxMs": 1.0, "meanDocuments": 1.0, "maxDocuments": 1, "totalMs": 1.0, **stats}
+
+
+def test_queries_are_recorded_by_shape_without_values():
+    stats = QueryStats(max_shapes=2)
+    for company_id, seconds in (("a", 0.01), ("b", 0.03)):
+        stats.record(query_shape("items", [("companyId", "==", company_id)]), seconds, 4)
+    stats.record(query_shape("items", [("companyId", "==", "a")], limit=5), 0.5, 5, error=ValueError("boom"))
+    stats.record(query_shape("employees"), 1.0, 1)
+
+    [unbounded, limited] = sorted(stats.snapshot(), key=lambda s: s["limited"])
+    assert (unbounded["filters"], unbounded["count"], unbounded["meanMs"], unbounded["maxMs"]) == (
+        [["companyId", "=="]], 2, 20.0, 30.0)
+    assert (limited["errors"], limited["lastError"]) == (1, "ValueError: boom")
+
+
+def test_service_queries_show_up_in_query_stats():
+    firebase_service.get_document_ids("transaction_lines", "transactionId", "==", "stats-t1", 10)
+    shapes = TestClient(main.app).get("/query-stats").json()["shapes"]
+    assert any(s["collection"] == "transaction_lines" and s["filters"] == [["transactionId", "=="]]
+               and s["limited"] for s in shapes)
+
+
+def test_required_indexes():
+    assert index_advisor.required_index(shape("items", [("companyId", "==")])) is None
+    assert index_advisor.required_index(shape("items", [("companyId", "=="), ("type", "==")])) is None
+    index = index_advisor.required_index(shape(
+        "transactions", [("status", "in"), ("companyId", "=="), ("transactionDate", ">=")],
+        order_by=[("transactionDate", "DESCENDING"), ("transactionNumber", "ASCENDING")]))
+    assert [(f["fieldPath"], f["order"]) for f in index["fields"]] == [
+        ("companyId", "ASCENDING"), ("status", "ASCENDING"), ("transactionDate", "DESCENDING"),
+        ("transactionNumber", "ASCENDING")]
+
+
+def test_merged_workers_and_findings():
+    first = shape("items", count=2, meanMs=10.0, p95Ms=20.0, totalMs=20.0, maxDocuments=5000, meanDocuments=10)
+    second = shape("items", count=2, meanMs=30.0, p95Ms=900.0, totalMs=60.0, errors=1,
+                   lastError="FailedPrecondition: The query requires an index")
+    [merged] = index_advisor.merge([[first], [second]])
+    assert (merged["count"], merged["meanMs"], merged["p95Ms"], merged["totalMs"]) == (4, 20.0, 900.0, 80.0)
+    assert index_advisor.findings(merged, slow_ms=500, max_documents=1000) == [
+        "missing index", "slow (p95 900ms)", "unbounded (up to 5000 documents)"]
+
+
+def test_advisor_report_writes_missing_indexes(tmp_path, monkeypatch, capsys):
+    stats_path, index_path = tmp_path / "worker.json", tmp_path / "firestore.indexes.json"
+    needs_index = shape("payments", [("transactionId", "==")], order_by=[("paymentDate", "ASCENDING")])
+    stats_path.write_text(json.dumps({"shapes": [needs_index, shape("items", [("companyId", "==")])]}))
+    monkeypatch.setattr(sys, "argv", ["index_advisor.py", "--stats", str(stats_path), "--write", str(index_path)])
+
+    index_advisor.main()
+    index_advisor.main()
+    out = capsys.readouterr().out
+    assert "payments query [transactionId ==, order by paymentDate ascending]  <- needs composite index" in out
+    assert "Added 1 indexes" in out and "Added 0 indexes" in out
+    assert len(json.loads(index_path.read_text())["indexes"]) == 1
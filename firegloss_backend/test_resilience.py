@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions as gcp_exceptions
+
+import main
+from firebase_service import firebase_service
+from request_context import begin_request, served_stale
+from resilience import CircuitBreaker, CircuitOpenError, Hedger, RequestDeadlineExceeded, RetryPolicy, SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def no_budget():
+    begin_request(None)
+    yield
+    begin_request(None)
+
+
+class Flaky:
+    """Fails with ``error`` the first ``failures`` calls, then returns the timeout it got"""
+
+    def __init__(self, failures, error=gcp_exceptions.ServiceUnavailable("unavailable")):
+        self.failures, self.error, self.calls = failures, error, 0
+
+    def __call__(self, timeout):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return timeout
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(firebase_service, "circuit_breaker", breaker)
+    return breaker
+
+
+def policy(**kwargs):
+    return RetryPolicy(**{"initial_backoff": 0.001, "max_backoff": 0.002, **kwargs})
+
+
+def test_idempotent_operations_are_retried():
+    operation = Flaky(3)
+    assert policy(op_timeout=2.0).call(operation) == 2.0
+    assert operation.calls == 4
+
+
+def test_retries_stop_after_max_attempts():
+    operation = Flaky(10)
+    with pytest.raises(gcp_exceptions.ServiceUnavailable):
+        policy(max_attempts=3).call(operation)
+    assert operation.calls == 3
+
+
+def test_writes_and_permanent_errors_are_not_retried():
+    write = Flaky(1)
+    with pytest.raises(gcp_exceptions.ServiceUnavailable):
+        policy().call(write, idempotent=False)
+    assert write.calls == 1
+
+    missing = Flaky(1, gcp_exceptions.NotFound("missing"))
+    with pytest.raises(gcp_exceptions.NotFound):
+        policy().call(missing)
+    assert missing.calls == 1
+
+
+def test_attempts_get_what_is_left_of_the_request_budget():
+    begin_request(0.5)
+    assert policy(op_timeout=5.0).call(Flaky(0)) <= 0.5
+
+    begin_request(0.001)
+    time.sleep(0.005)
+    operation = Flaky(0)
+    with pytest.raises(gcp_exceptions.DeadlineExceeded):
+        policy().call(operation)
+    assert operation.calls == 0
+
+
+def test_a_slow_read_is_hedged():
+    hedger = Hedger(max_workers=4, min_delay=0.001, max_ratio=1.0, min_samples=5)
+    for _ in range(5):
+        hedger.call(lambda: None)
+
+    first = threading.Event()
+
+    def read():
+        if not first.is_set():
+            first.set()
+            time.sleep(0.5)
+            return "primary"
+        return "backup"
+
+    assert hedger.call(read) == "backup"
+    assert hedger.stats()["hedges"] == 1
+
+
+def test_breaker_opens_then_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.02)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_firestore_timeouts_trip_the_breaker(breaker):
+    def timing_out(timeout):
+        raise gcp_exceptions.DeadlineExceeded("Deadline Exceeded")
+
+    for _ in range(2):
+        with pytest.raises(gcp_exceptions.DeadlineExceeded):
+            firebase_service._call(timing_out, idempotent=False)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        firebase_service._call(lambda timeout: None)
+
+
+def test_spent_request_budget_does_not_trip_the_breaker(breaker):
+    begin_request(0.001)
+    time.sleep(0.01)
+    for _ in range(5):
+        with pytest.raises(RequestDeadlineExceeded):
+            firebase_service._call(lambda timeout: None)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_rpc_timeout_cut_short_by_the_request_budget_is_not_a_failure(breaker):
+    def slow(timeout):
+        time.sleep(timeout)
+        raise gcp_exceptions.DeadlineExceeded("Deadline Exceeded")
+
+    for _ in range(3):
+        begin_request(0.01)
+        with pytest.raises(gcp_exceptions.DeadlineExceeded):
+            firebase_service._call(slow, idempotent=False)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_tiny_request_timeouts_leave_other_requests_working(breaker):
+    client = TestClient(main.app)
+    for timeout in ("0.0000001", "0", "-5"):
+        client.get("/items", headers={"X-Request-Timeout": timeout})
+    assert breaker.state == CircuitBreaker.CLOSED
+    response = client.post("/companies", json={"uid": "u", "name": "Co", "address": "a", "phone": "1",
+                                               "email": "a@b.c"})
+    assert response.status_code == 200
+
+
+def test_reads_fall_back_to_the_last_known_good_value(breaker, monkeypatch):
+    firebase_service.db.collection("items").document("stale-item").set({"name": "Gel"})
+    assert firebase_service.get_document("items", "stale-item") == {"name": "Gel"}
+
+    monkeypatch.setattr(firebase_service, "retry_policy", policy(max_attempts=1))
+    monkeypatch.setattr(firebase_service.db, "error_rate", 1.0)
+    begin_request(None)
+    assert firebase_service.get_document("items", "stale-item") == {"name": "Gel"}
+    assert served_stale()
+    with pytest.raises(gcp_exceptions.ServiceUnavailable):
+        firebase_service.get_document("items", "never-read")
+
+
+def test_concurrent_identical_reads_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        release.wait(1)
+        return {"name": "Gel"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", read)))
+    leader.start()
+    while not flight._calls:
+        time.sleep(0.001)
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", read)))
+    follower.start()
+    while flight.coalesced == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True]
+
+
+def test_a_forgotten_flight_is_not_joined():
+    flight = SingleFlight()
+
+    def read():
+        flight.forget(lambda key: key[0] == "items")
+        return flight.do(("items", "a"), lambda: "after the write")
+
+    assert flight.do(("items", "a"), read) == (("after the write", False), False)
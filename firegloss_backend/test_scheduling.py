@@ -0,0 +1,56 @@
+import random
+
+from scheduling import IntervalTree
+
+
+def tree_of(*intervals):
+    tree = IntervalTree()
+    for start, end, key in intervals:
+        tree.insert(start, end, key)
+    return tree
+
+
+def test_touching_intervals_do_not_overlap():
+    tree = tree_of((10, 20, "a"))
+    assert tree.find_overlap(0, 10) is None
+    assert tree.find_overlap(20, 30) is None
+    assert tree.overlapping(0, 10) == []
+    assert tree.overlapping(20, 30) == []
+
+
+def test_overlapping_and_nested_intervals():
+    tree = tree_of((10, 20, "a"), (30, 60, "b"), (35, 40, "c"))
+    assert tree.find_overlap(19, 21) == (10, 20, "a")
+    assert tree.find_overlap(36, 37) in {(30, 60, "b"), (35, 40, "c")}
+    assert tree.overlapping(15, 36) == [(10, 20, "a"), (30, 60, "b"), (35, 40, "c")]
+    assert tree.overlapping(40, 45) == [(30, 60, "b")]
+    assert tree.find_overlap(20, 30) is None
+
+
+def test_same_start_and_remove():
+    tree = tree_of((10, 20, "a"), (10, 30, "b"))
+    assert len(tree) == 2
+    assert tree.overlapping(25, 26) == [(10, 30, "b")]
+    tree.remove(10, "b")
+    assert len(tree) == 1
+    assert tree.find_overlap(25, 26) is None
+    assert tree.overlapping(0, 100) == [(10, 20, "a")]
+
+
+def test_matches_a_linear_scan():
+    rng = random.Random(7)
+    tree, intervals = IntervalTree(), {}
+    for i in range(500):
+        start = rng.randrange(0, 1000)
+        intervals[f"k{i}"] = (start, start + rng.randrange(1, 60))
+        tree.insert(*intervals[f"k{i}"], f"k{i}")
+    for key in rng.sample(sorted(intervals), 200):
+        tree.remove(intervals.pop(key)[0], key)
+
+    for _ in range(300):
+        start = rng.randrange(0, 1100)
+        end = start + rng.randrange(1, 40)
+        expected = {(s, e, key) for key, (s, e) in intervals.items() if s < end and start < e}
+        assert set(tree.overlapping(start, end)) == expected
+        found = tree.find_overlap(start, end)
+        assert (found in expected) if expected else found is None
@@ -0,0 +1,64 @@
+import pytest
+
+from firebase_service import firebase_service
+from search_index import ItemSearchIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    category_id = firebase_service.create_document("item_categories", {"name": "Pedicure", "companyId": "search-co"})
+    for item in (
+        {"name": "Spa Pedicure", "sku": "PED-01", "categoryId": category_id, "type": "service"},
+        {"name": "Gel Polish", "sku": "GEL-02", "description": "Long lasting", "type": "product"},
+        {"name": "Retired Polish", "sku": "OLD-03", "isActive": False, "type": "product"},
+    ):
+        firebase_service.create_document("items", {**item, "companyId": "search-co"})
+    index = ItemSearchIndex(firebase_service)
+    index.rebuild()
+    return index
+
+
+def names(results):
+    return [item["name"] for item in results]
+
+
+def test_prefixes_and_typos_match(index):
+    assert names(index.search("pol", company_id="search-co")) == ["Gel Polish"]
+    assert names(index.search("pedicrue", company_id="search-co")) == ["Spa Pedicure"]
+    assert names(index.search("gel lasting", company_id="search-co")) == ["Gel Polish"]
+
+
+def test_sku_and_category_match_with_field_weights(index):
+    assert names(index.search("ped01", company_id="search-co")) == ["Spa Pedicure"]
+    results = index.search("pedicure", company_id="search-co")
+    assert names(results) == ["Spa Pedicure"]
+
+
+def test_filters(index):
+    assert index.search("polish", company_id="other-co") == []
+    assert names(index.search("polish", company_id="search-co", include_inactive=True)) == [
+        "Gel Polish", "Retired Polish"]
+    assert index.search("polish", company_id="search-co", item_type="service") == []
+
+
+def test_the_index_follows_writes(index):
+    item_id = firebase_service.create_document("items", {"name": "Acrylic Fill", "companyId": "search-co"})
+    assert names(index.search("acryl", company_id="search-co")) == ["Acrylic Fill"]
+    firebase_service.update_document("items", item_id, {"name": "Dip Powder"})
+    assert index.search("acryl", company_id="search-co") == []
+    firebase_service.delete_document("items", item_id)
+    assert index.search("dip", company_id="search-co") == []
+
+
+def test_other_companies_terms_do_not_use_up_the_expansion_cap():
+    index = ItemSearchIndex(firebase_service, max_expansions=2)
+    for suffix in ("a", "b", "c"):
+        firebase_service.create_document("items", {"name": f"Nail{suffix}", "companyId": "crowded-co"})
+    firebase_service.create_document("items", {"name": "Nailz", "companyId": "quiet-co"})
+    firebase_service.create_document("items", {"name": "Nailwrap"})
+    index.rebuild()
+
+    assert names(index.search("nai", company_id="quiet-co")) == ["Nailz"]
+    # An item without a company belongs to no tenant
+    assert index.search("nailwrap", company_id="quiet-co") == []
+    assert index.search("nailwrap", company_id="crowded-co") == []
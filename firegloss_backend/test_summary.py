@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from firebase_service import firebase_service
+
+client = TestClient(main.app)
+
+
+def test_summary_aggregates_one_local_day():
+    for hour, status, method, total, tip in ((15, "complete", "card", 40.0, 6.0),
+                                             (20, "complete", "cash", 25.0, 0.0),
+                                             (21, "voided", "card", 30.0, 0.0),
+                                             (23, "complete", "card", 99.0, 9.0)):
+        firebase_service.create_document("transactions", {
+            "companyId": "summary-co", "transactionDate": datetime(2026, 4, 1, hour, tzinfo=timezone.utc),
+            "status": status, "paymentMethod": method, "total": total, "tip": tip,
+        })
+
+    # 23:00 UTC is already 2 April for a shop at UTC+2
+    response = client.get("/transactions/summary", params={
+        "companyId": "summary-co", "date": "2026-04-01", "utcOffsetMinutes": 120,
+    }, headers={"X-Company-Id": "summary-co"})
+    summary = response.json()["data"]
+
+    assert (summary["count"], summary["revenue"], summary["tips"]) == (3, 65.0, 6.0)
+    assert summary["byStatus"]["voided"]["count"] == 1
+    assert summary["byStatus"]["inProgress"]["count"] == 0
+    assert summary["byPaymentMethod"]["card"] == {"count": 2, "total": 70.0, "tips": 6.0}
@@ -0,0 +1,138 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from archive import ArchiveJob, TransactionArchive
+from firebase_service import firebase_service
+from sync import DeltaSync
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def test_a_delta_returns_changes_and_deletes_since_the_token():
+    delta_sync = DeltaSync(firebase_service, clock_skew=0)
+    kept = firebase_service.create_document("employees", {"companyId": "sync-co", "firstName": "Ann",
+                                                          "updatedAt": now()})
+    removed = firebase_service.create_document("employees", {"companyId": "sync-co", "firstName": "Bo",
+                                                             "updatedAt": now()})
+    firebase_service.create_document("employees", {"companyId": "other-co", "updatedAt": now()})
+
+    snapshot = delta_sync.sync(None, ["employees"], company_id="sync-co")
+    assert snapshot["full"]
+    assert sorted(e["id"] for e in snapshot["changes"]["employees"]) == sorted([kept, removed])
+
+    firebase_service.update_document("employees", kept, {"firstName": "Anna", "updatedAt": now()})
+    firebase_service.delete_document("employees", removed)
+    delta = delta_sync.sync(snapshot["token"], ["employees"], company_id="sync-co")
+    assert not delta["full"]
+    assert [e["firstName"] for e in delta["changes"]["employees"]] == ["Anna"]
+    assert delta["deleted"]["employees"] == [removed]
+
+
+def test_a_company_syncs_its_own_document_only():
+    delta_sync = DeltaSync(firebase_service, clock_skew=0)
+    own = firebase_service.create_document("companies", {"name": "Own", "updatedAt": now()})
+    firebase_service.create_document("companies", {"name": "Other", "updatedAt": now()})
+
+    snapshot = delta_sync.sync(None, ["companies"], company_id=own)
+    assert [(c["id"], c["name"]) for c in snapshot["changes"]["companies"]] == [(own, "Own")]
+    assert delta_sync.sync(snapshot["token"], ["companies"], company_id=own)["changes"]["companies"] == []
+
+    firebase_service.update_document("companies", own, {"name": "Renamed", "updatedAt": now()})
+    delta = delta_sync.sync(snapshot["token"], ["companies"], company_id=own)
+    assert [c["name"] for c in delta["changes"]["companies"]] == ["Renamed"]
+
+def test_archived_transactions_sync_as_deleted(tmp_path):
+    delta_sync = DeltaSync(firebase_service, clock_skew=0)
+    when = datetime(2020, 6, 1, tzinfo=timezone.utc)
+    transaction_id = firebase_service.create_document("transactions", {
+        "companyId": "sync-co", "transactionDate": when, "status": "complete", "total": 10.0, "updatedAt": when,
+    })
+    token = delta_sync.sync(None, ["transactions"], company_id="sync-co")["token"]
+
+    ArchiveJob(firebase_service, TransactionArchive(str(tmp_path))).run()
+    delta = delta_sync.sync(token, ["transactions"], company_id="sync-co")
+    assert delta["deleted"]["transactions"] == [transaction_id]
+
+
+@pytest.mark.parametrize("token, collections", [("not-a-token", ["employees"]), (None, ["idempotency_keys"])])
+def test_malformed_tokens_and_unknown_collections_are_rejected(token, collections):
+    with pytest.raises(ValueError):
+        DeltaSync(firebase_service).sync(token, collections)
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def company(client, name):
+    created = client.post("/companies", json={"uid": "u1", "name": name, "address": "1 Main St",
+                                              "phone": "555", "email": "a@b.co"})
+    return created.json()["data"]["id"]
+
+
+def employee(client, company_id):
+    created = client.post("/employees", json={"uid": "u2", "companyId": company_id, "email": "e@b.co",
+                                              "firstName": "Ann", "lastName": "Lee", "role": "technician",
+                                              "hiredDate": "2026-01-05T00:00:00"})
+    return created.json()["data"]["id"]
+
+
+def sync(client, company_id, token=None):
+    params = {"collections": "employees,companies", "companyId": company_id}
+    if token:
+        params["since"] = token
+    return client.get("/sync", params=params).json()["data"]
+
+
+def test_deletes_sync_only_to_their_company(client):
+    first, second = company(client, "First"), company(client, "Second")
+    employee_id = employee(client, first)
+    tokens = {company_id: sync(client, company_id)["token"] for company_id in (first, second)}
+
+    # No X-Company-Id: the tombstone takes the company from the deleted document
+    client.delete(f"/employees/{employee_id}")
+    main.firebase_service.db.collection("tombstones").document("employees_orphan").set({
+        "collection": "employees", "documentId": "orphan", "companyId": None,
+        "deletedAt": datetime.now(timezone.utc),
+    })
+
+    assert sync(client, first, tokens[first])["deleted"]["employees"] == [employee_id]
+    assert sync(client, second, tokens[second])["deleted"]["employees"] == []
+
+
+def test_a_deleted_company_syncs_to_itself_only(client):
+    first, second = company(client, "First"), company(client, "Second")
+    tokens = {company_id: sync(client, company_id)["token"] for company_id in (first, second)}
+    client.delete(f"/companies/{second}", headers={"X-Company-Id": second})
+
+    assert sync(client, first, tokens[first])["deleted"]["companies"] == []
+    assert sync(client, second, tokens[second])["deleted"]["companies"] == [second]
+
+
+def test_transaction_timestamps_come_from_the_server(client):
+    company_id = company(client, "First")
+    created = client.post("/transactions", json={
+        "companyId": company_id, "employeeId": "e1", "transactionDate": "2026-03-02T10:00:00",
+        "createdAt": "2001-01-01T00:00:00Z", "updatedAt": "2001-01-01T00:00:00Z",
+    }).json()["data"]["transaction"]
+    assert not created["createdAt"].startswith("2001")
+    assert not created["updatedAt"].startswith("2001")
+
+
+def test_tenant_scoped_reads_require_a_company(client):
+    company_id = company(client, "First")
+    employee(client, company_id)
+    assert client.get("/employees").status_code == 400
+    assert client.get("/transactions/abc").status_code == 400
+    assert client.get("/sync", params={"collections": "employees"}).status_code == 400
+    assert client.get("/sync", params={"collections": "companies"}).status_code == 200
+    assert client.get("/companies").status_code == 200
+
+    scoped = client.get("/employees", headers={"X-Company-Id": company_id}).json()["data"]["employees"]
+    assert [e["companyId"] for e in scoped] == [company_id]
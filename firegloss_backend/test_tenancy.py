@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+import main
+from admission import TenantQuotas
+
+client = TestClient(main.app)
+
+
+def item(**fields):
+    return {"name": "Gel Manicure", "description": "Soak-off gel", "type": "service", "categoryId": "c",
+            "price": 35.0, **fields}
+
+
+def test_items_are_created_and_listed_per_company():
+    first = client.post("/items", json=item(), headers={"X-Company-Id": "tenant-a"}).json()["data"]["id"]
+    client.post("/items", json=item(), headers={"X-Company-Id": "tenant-b"})
+
+    listed = client.get("/items", headers={"X-Company-Id": "tenant-a"}).json()["data"]["items"]
+    assert [(i["id"], i["companyId"]) for i in listed] == [(first, "tenant-a")]
+
+
+def test_writes_for_another_company_are_refused():
+    response = client.post("/items", json=item(companyId="tenant-b"), headers={"X-Company-Id": "tenant-a"})
+    assert response.status_code == 403
+    mismatch = client.get("/items", params={"companyId": "tenant-b"}, headers={"X-Company-Id": "tenant-a"})
+    assert mismatch.status_code == 403
+
+
+def test_only_the_company_itself_can_delete_it():
+    company_id = client.post("/companies", json={"uid": "tenancy-delete", "name": "Kept", "address": "1 Main St",
+                                                 "phone": "555-0100", "email": "kept@example.com"}).json()["data"]["id"]
+    for headers in ({}, {"X-Company-Id": "tenant-a"}):
+        assert client.delete(f"/companies/{company_id}", headers=headers).status_code == 403
+    assert main.firebase_service.get_document("companies", company_id, allow_stale=False)
+
+    assert client.delete(f"/companies/{company_id}", headers={"X-Company-Id": company_id}).status_code == 200
+
+def test_a_company_over_its_quota_gets_429(monkeypatch):
+    quotas = TenantQuotas(rate=1, burst=2)
+    assert quotas.acquire("busy") is None
+    assert quotas.acquire("busy") is None
+    assert quotas.acquire("busy") == 1
+    assert quotas.acquire("quiet") is None
+
+    monkeypatch.setattr(main, "tenant_quotas", TenantQuotas(rate=0.01, burst=1))
+    assert client.get("/items", headers={"X-Company-Id": "tenant-q"}).status_code == 200
+    limited = client.get("/items", headers={"X-Company-Id": "tenant-q"})
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "100"
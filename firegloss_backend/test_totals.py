@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def ticket(client):
+    company = client.post("/companies", json={"uid": "u1", "name": "Salon", "address": "1 Main St",
+                                              "phone": "555", "email": "a@b.co", "taxRate": 10})
+    company_id = company.json()["data"]["id"]
+    client.headers["X-Company-Id"] = company_id
+    created = client.post("/transactions", json={"companyId": company_id, "employeeId": "e1",
+                                                 "transactionDate": "2026-03-02T10:00:00",
+                                                 "subtotal": 999, "total": 999})
+    return created.json()["data"]["transaction"]["id"]
+
+
+def line(transaction_id, line_id, amount):
+    return {"id": line_id, "transactionId": transaction_id, "itemId": "i1", "itemName": "Manicure",
+            "itemType": "service", "quantity": 1, "unitPrice": amount, "lineTotal": amount}
+
+
+def header(client, transaction_id):
+    return client.get(f"/transactions/{transaction_id}").json()["data"]["transaction"]
+
+
+def amounts(totals):
+    return totals["subtotal"], totals["tax"], totals["total"]
+
+
+def test_totals_follow_line_writes(client, ticket):
+    assert amounts(header(client, ticket)) == (0, 0, 0)
+    client.put(f"/transactions/{ticket}/lines", json=[line(ticket, f"{ticket}-a", 10),
+                                                      line(ticket, f"{ticket}-b", 20)])
+    assert amounts(header(client, ticket)) == (30, 3, 33)
+
+    client.put(f"/transactions/{ticket}/lines/{ticket}-a", json={"lineTotal": 15})
+    client.delete(f"/transactions/{ticket}/lines/{ticket}-b")
+    assert amounts(header(client, ticket)) == (15, 1.5, 16.5)
+
+
+def test_discount_and_tip_re_derive_the_total(client, ticket):
+    client.put(f"/transactions/{ticket}/lines", json=[line(ticket, f"{ticket}-a", 40)])
+    client.put(f"/transactions/{ticket}", json={"discount": 5, "tip": 8, "total": 1})
+    assert header(client, ticket)["total"] == 47
+
+
+def test_concurrent_lines_on_one_ticket_add_up(client, ticket):
+    def add(index):
+        client.post(f"/transactions/{ticket}/lines", json=line(ticket, f"{ticket}-{index}", 10))
+
+    threads = [threading.Thread(target=add, args=(index,)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert amounts(header(client, ticket)) == (200, 20, 220)
+
+
+def test_concurrent_edits_of_one_line_move_the_header_once_each(client, ticket):
+    client.put(f"/transactions/{ticket}/lines", json=[line(ticket, f"{ticket}-a", 10)])
+
+    def edit(amount):
+        client.put(f"/transactions/{ticket}/lines/{ticket}-a", json={"lineTotal": amount})
+
+    threads = [threading.Thread(target=edit, args=(amount,)) for amount in range(11, 31)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stored = client.get(f"/transactions/{ticket}/lines").json()["data"]["lines"]
+    totals = header(client, ticket)
+    assert totals["subtotal"] == stored[0]["lineTotal"]
+    assert totals["tax"] == stored[0]["tax"]
+
+
+def test_line_changes_resettle_a_paid_ticket(client, ticket):
+    client.put(f"/transactions/{ticket}/lines", json=[line(ticket, f"{ticket}-a", 20)])
+    client.post("/payments", json={"transactionId": ticket, "method": "card", "amount": 22})
+    assert header(client, ticket)["status"] == "complete"
+
+    client.put(f"/transactions/{ticket}/lines/{ticket}-a", json={"lineTotal": 30})
+    reopened = header(client, ticket)
+    assert reopened["balance"] == 11
+    assert reopened["status"] == "inProgress"
+
+    client.delete(f"/transactions/{ticket}/lines/{ticket}-a")
+    client.post(f"/transactions/{ticket}/lines", json=line(ticket, f"{ticket}-b", 20))
+    settled = header(client, ticket)
+    assert settled["balance"] == 0
+    assert settled["status"] == "complete"
+
+
+def test_missing_line_is_not_found(client, ticket):
+    assert client.put(f"/transactions/{ticket}/lines/nope", json={"lineTotal": 5}).status_code == 404
+    assert client.delete(f"/transactions/{ticket}/lines/nope").status_code == 404
+    assert client.delete("/transactions/nope/lines/a").status_code == 404
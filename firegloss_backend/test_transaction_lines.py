@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, headers={"X-Company-Id": "lines-co"})
+
+
+def new_ticket(client):
+    created = client.post("/transactions", json={"companyId": "lines-co", "employeeId": "e1",
+                                                 "transactionDate": "2026-03-02T10:00:00"})
+    return created.json()["data"]["transaction"]["id"]
+
+
+def line(line_id, amount, **fields):
+    return {"id": line_id, "itemId": "i1", "itemName": "Manicure", "itemType": "service", "quantity": 1,
+            "unitPrice": amount, "lineTotal": amount, **fields}
+
+
+def stored_lines(client, transaction_id):
+    lines = client.get(f"/transactions/{transaction_id}/lines").json()["data"]["lines"]
+    return {stored["id"]: stored["lineTotal"] for stored in lines}
+
+
+def test_replace_writes_only_what_changed(client):
+    ticket = new_ticket(client)
+    a, b = f"{ticket}-a", f"{ticket}-b"
+    first = client.put(f"/transactions/{ticket}/lines", json=[line(a, 10), line(b, 20)]).json()["data"]
+    assert sorted(first["created"]) == [a, b]
+
+    again = client.put(f"/transactions/{ticket}/lines", json=[line(a, 10), line(b, 20)]).json()["data"]
+    assert (again["created"], again["updated"], again["deleted"], again["unchanged"]) == ([], [], [], 2)
+
+    edited = client.put(f"/transactions/{ticket}/lines", json=[line(a, 15), line(None, 5)]).json()["data"]
+    assert (edited["updated"], edited["deleted"], edited["unchanged"]) == ([a], [b], 0)
+    assert stored_lines(client, ticket) == {a: 15, edited["created"][0]: 5}
+
+
+def test_lines_of_another_ticket_are_rejected(client):
+    ticket, other = new_ticket(client), new_ticket(client)
+    x = f"{other}-x"
+    client.put(f"/transactions/{other}/lines", json=[line(x, 10)])
+
+    mislabelled = client.put(f"/transactions/{ticket}/lines", json=[line(None, 10, transactionId=other)])
+    assert mislabelled.status_code == 400
+    assert client.put(f"/transactions/{ticket}/lines/{x}", json={"lineTotal": 5}).status_code == 404
+    assert client.delete(f"/transactions/{ticket}/lines/{x}").status_code == 404
+    assert stored_lines(client, other) == {x: 10}
+
+
+def test_single_line_update_and_delete(client):
+    ticket = new_ticket(client)
+    a, b = f"{ticket}-a", f"{ticket}-b"
+    client.put(f"/transactions/{ticket}/lines", json=[line(a, 10), line(b, 20)])
+
+    assert client.put(f"/transactions/{ticket}/lines/{a}", json={"lineTotal": 12}).status_code == 200
+    assert client.delete(f"/transactions/{ticket}/lines/{b}").status_code == 200
+    assert stored_lines(client, ticket) == {a: 12}
+
+
+def test_replace_rejects_another_tickets_line_id(client):
+    owner, intruder = new_ticket(client), new_ticket(client)
+    taken = f"{owner}-a"
+    client.put(f"/transactions/{owner}/lines", json=[line(taken, 50)])
+
+    response = client.put(f"/transactions/{intruder}/lines", json=[line(taken, 5)])
+    assert response.status_code == 409
+    assert stored_lines(client, owner) == {taken: 50}
+    assert stored_lines(client, intruder) == {}
+    assert client.get(f"/transactions/{owner}").json()["data"]["transaction"]["subtotal"] == 50
+
+
+def test_replace_rejects_another_companys_line_id(client):
+    other = TestClient(main.app, headers={"X-Company-Id": "other-co"})
+    created = other.post("/transactions", json={"companyId": "other-co", "employeeId": "e1",
+                                                "transactionDate": "2026-03-02T10:00:00"})
+    owner = created.json()["data"]["transaction"]["id"]
+    taken = f"{owner}-a"
+    other.put(f"/transactions/{owner}/lines", json=[line(taken, 50)])
+
+    response = client.put(f"/transactions/{new_ticket(client)}/lines", json=[line(taken, 5)])
+    assert response.status_code == 409
+    assert stored_lines(other, owner) == {taken: 50}
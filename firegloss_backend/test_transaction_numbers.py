@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta, timezone
+
+from firebase_service import firebase_service
+from transaction_numbers import TransactionNumberAllocator, business_day
+
+
+def test_numbers_are_sequential_per_company_and_day():
+    allocator = TransactionNumberAllocator(firebase_service, block_size=2)
+    day = date(2026, 2, 2)
+    assert [allocator.allocate("seq-a", day) for _ in range(3)] == [
+        "TXN-20260202-0001", "TXN-20260202-0002", "TXN-20260202-0003"]
+    assert allocator.allocate("seq-b", day) == "TXN-20260202-0001"
+    assert allocator.allocate("seq-a", date(2026, 2, 3)) == "TXN-20260203-0001"
+
+
+def test_workers_lease_disjoint_blocks():
+    first = TransactionNumberAllocator(firebase_service, block_size=2, min_lease_interval=0)
+    second = TransactionNumberAllocator(firebase_service, block_size=2, min_lease_interval=0)
+    day = date(2026, 2, 4)
+    numbers = [allocator.allocate("blocks", day) for allocator in (first, second, first, second, first)]
+    assert numbers == ["TXN-20260204-0001", "TXN-20260204-0003", "TXN-20260204-0002",
+                       "TXN-20260204-0004", "TXN-20260204-0005"]
+
+
+def test_busy_workers_lease_bigger_blocks():
+    allocator = TransactionNumberAllocator(firebase_service, block_size=2, max_block_size=8,
+                                           min_lease_interval=60)
+    day = date(2026, 2, 5)
+    for _ in range(2 + 4 + 1):
+        allocator.allocate("busy", day)
+    assert allocator._leases["busy_20260205"]["size"] == 8
+
+
+def test_business_day_uses_the_shop_offset():
+    late_evening_utc = datetime(2026, 3, 3, 2, 30, tzinfo=timezone.utc)
+    assert business_day(late_evening_utc, -300) == date(2026, 3, 2)
+    assert business_day(datetime(2026, 3, 3, 2, 30), -300) == date(2026, 3, 2)
+    assert business_day(datetime(2026, 3, 2, 23, 30), 120) == date(2026, 3, 3)
+
+
+def test_business_day_without_offset_is_the_date_sent():
+    local = datetime(2026, 3, 2, 21, 30, tzinfo=timezone(timedelta(hours=-5)))
+    assert business_day(local) == date(2026, 3, 2)
+    assert business_day(datetime(2026, 3, 2, 21, 30)) == date(2026, 3, 2)
+
+
+def test_numbers_restart_each_day_and_old_locks_are_dropped():
+    allocator = TransactionNumberAllocator(firebase_service, block_size=2)
+    monday, tuesday = date(2026, 3, 2), date(2026, 3, 3)
+    assert [allocator.allocate("c1", monday) for _ in range(3)] == [
+        "TXN-20260302-0001", "TXN-20260302-0002", "TXN-20260302-0003"]
+    assert allocator.allocate("c2", monday) == "TXN-20260302-0001"
+
+    assert allocator.allocate("c1", tuesday) == "TXN-20260303-0001"
+    # Only c1's own Monday lease and lock are dropped
+    assert set(allocator._locks) == {"c1_20260303", "c2_20260302"}
+    assert set(allocator._leases) == {"c1_20260303", "c2_20260302"}
+    assert allocator.allocate("c2", monday) == "TXN-20260302-0002"
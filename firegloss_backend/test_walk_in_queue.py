@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from firebase_service import firebase_service
+
+
+@pytest.fixture
+def client(request):
+    company_id = f"queue-{request.node.name}"
+    return TestClient(main.app, headers={"X-Company-Id": company_id})
+
+
+def company(client):
+    return client.headers["X-Company-Id"]
+
+
+def technician(client):
+    return firebase_service.create_document("employees", {"companyId": company(client), "isActive": True})
+
+
+def walk_in(client, **fields):
+    created = client.post("/transactions", json={"companyId": company(client), "employeeId": "desk",
+                                                 "transactionDate": "2026-03-02T10:00:00", **fields})
+    return created.json()["data"]["transaction"]["id"]
+
+
+def next_for(client, technician_id):
+    response = client.post("/queue/next", json={"technicianId": technician_id})
+    assert response.status_code == 200
+    return (response.json()["data"]["transaction"] or {}).get("id")
+
+
+def test_tickets_are_served_by_priority_then_arrival(client):
+    anna, bo = technician(client), technician(client)
+    first = walk_in(client)
+    urgent = walk_in(client, priority=1)
+    for_bo = walk_in(client, requestedTechnicianId=bo)
+
+    waiting = client.get("/queue").json()["data"]["tickets"]
+    assert [(t["id"], t["position"]) for t in waiting] == [(urgent, 1), (first, 2), (for_bo, 3)]
+
+    assert [next_for(client, anna) for _ in range(3)] == [urgent, first, None]
+    assert next_for(client, bo) == for_bo
+    assigned = client.get(f"/transactions/{for_bo}").json()["data"]["transaction"]
+    assert (assigned["status"], assigned["technicianId"]) == ("assigned", bo)
+    assert client.get("/queue").json()["data"]["tickets"] == []
+
+
+def test_a_ticket_taken_elsewhere_is_skipped(client):
+    anna = technician(client)
+    taken, waiting = walk_in(client), walk_in(client)
+    client.get("/queue")
+    # Another worker's claim doesn't reach this worker's write listeners
+    firebase_service.db.collection("transactions").document(taken).update({"status": "assigned"})
+    assert next_for(client, anna) == waiting
+
+
+def test_only_the_company_s_technicians_take_tickets(client):
+    walk_in(client)
+    stranger = firebase_service.create_document("employees", {"companyId": "another-company"})
+    assert client.post("/queue/next", json={"technicianId": stranger}).status_code == 404
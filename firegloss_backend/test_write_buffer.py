@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud.firestore_v1.transforms import Increment
+
+from write_buffer import WriteBuffer
+
+
+class Recorder:
+    """Stands in for the Firestore commit and keeps what reached it"""
+
+    def __init__(self):
+        self.groups = []
+        self.committed = threading.Event()
+
+    def __call__(self, group):
+        self.groups.append([(change_set.key, change_set.writes) for change_set in group])
+        self.committed.set()
+
+    def keys(self):
+        return [key for group in self.groups for key, _ in group]
+
+
+def unavailable(group):
+    raise gcp_exceptions.ServiceUnavailable("Firestore is down")
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the flusher"
+        time.sleep(0.01)
+
+
+def record(seq, key, writes):
+    return json.dumps({"seq": seq, "key": key, "writes": writes}) + "\n"
+
+
+def test_unsettled_change_sets_of_a_crashed_worker_are_replayed(tmp_path):
+    with open(tmp_path / "wal-1.log", "w") as f:
+        f.write(record(1, "a", [["set", "transaction_lines", "l1", {"lineTotal": 10}]]))
+        f.write(record(2, "b", [["update", "transactions", "t1", {"tip": 5}]]))
+        f.write(json.dumps({"done": 1}) + "\n")
+        f.write(record(3, "c", [["delete", "transaction_lines", "l2", "c1"]]))
+        # Torn by the crash mid-append; it was never acknowledged
+        f.write('{"seq": 4, "key": "d", "wri')
+
+    commit = Recorder()
+    buffer = WriteBuffer(str(tmp_path), commit)
+    wait_for(lambda: len(commit.keys()) == 2)
+
+    assert commit.keys() == ["b", "c"]
+    replayed = dict(change_set for group in commit.groups for change_set in group)
+    assert replayed["c"] == [["delete", "transaction_lines", "l2", "c1"]]
+    assert not (tmp_path / "wal-1.log").exists()
+    wait_for(lambda: buffer.pending_writes("transactions") == [])
+
+
+def test_writes_acknowledged_before_a_crash_reach_firestore_after_restart(tmp_path):
+    when = datetime(2026, 3, 2, 10, 0, tzinfo=timezone.utc)
+    crashed = WriteBuffer(str(tmp_path), unavailable, max_backoff=0.05)
+    assert crashed.append([
+        ("set", "transaction_lines", "l1", {"lineTotal": 10.0, "createdAt": when}),
+        ("update", "transactions", "t1", {"subtotal": Increment(10.0)}),
+    ])
+    # The process dies: its file lock goes with it, the queued change set stays in its log
+    crashed.commit = lambda group: threading.Event().wait()
+    crashed._log.close()
+
+    commit = Recorder()
+    WriteBuffer(str(tmp_path), commit)
+    assert commit.committed.wait(5)
+
+    (key, writes), = commit.groups[0]
+    (_, _, _, line), (_, _, _, header) = writes
+    assert line == {"lineTotal": 10.0, "createdAt": when}
+    assert isinstance(header["subtotal"], Increment) and header["subtotal"].value == 10.0
+    assert [name for name in os.listdir(tmp_path) if name.startswith("wal-")] == ["wal-0.log"]
+
+
+def test_a_replay_already_committed_before_the_crash_is_not_rejected(tmp_path):
+    with open(tmp_path / "wal-1.log", "w") as f:
+        f.write(record(1, "a", [["update", "transactions", "t1", {"tip": {"$increment": 5}}]]))
+
+    def marker_exists(group):
+        raise gcp_exceptions.AlreadyExists("write_log_commits/a")
+
+    buffer = WriteBuffer(str(tmp_path), marker_exists)
+    wait_for(lambda: buffer.pending_writes("transactions") == [])
+    assert not (tmp_path / "rejected.log").exists()
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from request_context import current_company
+
+
+# Tickets in these states can't take new payments
+CLOSED_STATUSES = {"cancelled", "voided"}
+SETTLED_STATUS = "complete"
+# Status a settled ticket returns to when a payment is removed and a balance is due again
+REOPENED_STATUS = "inProgress"
+
+# Header amounts; Increment on doubles can leave sub-cent noise, so responses round them
+MONEY_FIELDS = ("subtotal", "tax", "discount", "tip", "total", "paidAmount", "balance")
+
+
+class LineConflict(Exception):
+    """A new line's ID is already taken by a stored line of another ticket"""
+
+
+def _cents(value) -> float:
+    return round(float(value or 0.0), 2)
+
+
+def round_money(header: dict) -> dict:
+    """The header with its amounts rounded to the cent"""
+    return {**header, **{field: _cents(header[field]) for field in MONEY_FIELDS
+                         if isinstance(header.get(field), (int, float))}}
+
+
+def line_tax(line_total: float, tax_rate: float) -> float:
+    """Tax on one line; taxRate is a percentage and each line is rounded to the cent"""
+    return _cents(_cents(line_total) * tax_rate / 100)
+
+
+def ticket_total(header: dict) -> float:
+    return _cents(_cents(header.get("subtotal")) - _cents(header.get("discount"))
+                  + _cents(header.get("tax")) + _cents(header.get("tip")))
+
+
+def settle(header: dict, paid_by_method: dict, now: datetime) -> dict:
+    """Header fields derived from the payments on a ticket"""
+    paid = _cents(sum(paid_by_method.values()))
+    balance = _cents(_cents(header.get("total")) - paid)
+    changes = {
+        "paidAmount": paid,
+        "balance": balance,
+        "paidByMethod": paid_by_method,
+        "updatedAt": now,
+    }
+    if paid_by_method:
+        # The single-method field reports the tender that covered most of the ticket
+        changes["paymentMethod"] = max(paid_by_method, key=paid_by_method.get)
+    status = header.get("status")
+    if balance <= 0 and paid > 0 and status not in CLOSED_STATUSES and status != SETTLED_STATUS:
+        changes["status"] = SETTLED_STATUS
+        changes["settledAt"] = now
+    elif balance > 0 and status == SETTLED_STATUS and header.get("settledAt"):
+        # Only undo a settlement the ledger made, not a ticket completed by hand
+        changes["status"] = REOPENED_STATUS
+        changes["settledAt"] = None
+    return changes
+
+
+class TaxRates:
+    """Per-company tax rates (``taxRate`` on the company, a percentage) with a short-lived cache"""
+
+    def __init__(self, firebase_service, default_rate: float = 0.0, ttl: float = 60.0):
+        self.firebase_service = firebase_service
+        self.default_rate = default_rate
+        self.ttl = ttl
+        self._rates = {}
+        self._lock = threading.Lock()
+        firebase_service.add_write_listener("companies", self._on_company_write)
+
+    def _on_company_write(self, event, document_id, data):
+        with self._lock:
+            self._rates.pop(document_id, None)
+
+    def rate(self, company_id: Optional[str]) -> float:
+        if not company_id:
+            return self.default_rate
+        with self._lock:
+            cached = self._rates.get(company_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        company = self.firebase_service.get_document("companies", company_id) or {}
+        rate = company.get("taxRate")
+        rate = self.default_rate if rate is None else float(rate)
+        with self._lock:
+            self._rates[company_id] = (rate, time.monotonic())
+        return rate
+
+
+class TicketTotals:
+    """Keeps a transaction's subtotal, tax, total and balance in step with its lines.
+
+    Every line carries its own ``tax`` (and the ``taxRate`` it was priced at),
+    so a line write knows exactly how much it moves the header. Every line
+    write goes through ``edit_lines``, which reads the header and the lines it
+    changes in a Firestore transaction: the header decides how a new line
+    settles, and an edit's delta must apply to the line it was computed
+    from. ``total`` is subtotal - discount + tax + tip; ``balance``
+    (total less payments) moves with it, and a ticket with payments is
+    re-settled.
+    """
+
+    def __init__(self, firebase_service, tax_rates: TaxRates):
+        self.firebase_service = firebase_service
+        self.tax_rates = tax_rates
+
+    def price(self, transaction: dict, line: dict, previous: Optional[dict] = None) -> dict:
+        """The line with taxRate and tax filled in; an edited line keeps the rate it was priced at"""
+        tax_rate = (previous or {}).get("taxRate")
+        if tax_rate is None:
+            tax_rate = self.tax_rates.rate(transaction.get("companyId"))
+        return {**line, "taxRate": tax_rate, "tax": line_tax(line.get("lineTotal"), tax_rate)}
+
+    def edit_lines(self, transaction_id: str, edit, line_ids: Optional[list] = None) -> tuple:
+        """Apply an edit of a ticket's lines and its effect on the header in one Firestore transaction.
+
+        ``edit(header, lines)`` gets the ticket and its current lines (only
+        ``line_ids`` when given, missing ones omitted) and returns (sets,
+        updates, deletes) for ``transaction_lines``; a set of an ID stored
+        under another ticket raises LineConflict. Concurrent edits of the
+        same lines are serialized, so each delta is applied to the line it
+        was computed from. Returns (sets, updates, deletes, header).
+        """
+        firebase_service = self.firebase_service
+        db = firebase_service.db
+        lines_collection = db.collection("transaction_lines")
+
+        def apply(transaction):
+            ref = db.collection("transactions").document(transaction_id)
+            snapshot = ref.get(transaction=transaction)
+            header = snapshot.to_dict() if snapshot.exists else None
+            company_id = current_company()
+            if header is None or (company_id and header.get("companyId") not in (None, company_id)):
+                raise LookupError("Transaction not found")
+            if line_ids is None:
+                snapshots = transaction.get(lines_collection.where("transactionId", "==", transaction_id))
+            else:
+                snapshots = [lines_collection.document(line_id).get(transaction=transaction) for line_id in line_ids]
+            lines = {s.id: {**s.to_dict(), "id": s.id} for s in snapshots if s.exists}
+
+            sets, updates, deletes = edit(header, lines)
+            # Client-chosen IDs are document IDs; never let a ticket take over another one's line
+            for line_id in sets:
+                if line_id not in lines and lines_collection.document(line_id).get(transaction=transaction).exists:
+                    raise LineConflict(f"Line {line_id} belongs to another transaction")
+            removed = [lines[line_id] for line_id in [*updates, *deletes]]
+            added = [*sets.values(), *({**lines[line_id], **data} for line_id, data in updates.items())]
+            changes = self._settled_header(header, removed, added)
+            for line_id, data in sets.items():
+                transaction.set(lines_collection.document(line_id), data)
+            for line_id, data in updates.items():
+                transaction.update(lines_collection.document(line_id), data)
+            for line_id in deletes:
+                transaction.delete(lines_collection.document(line_id))
+                firebase_service.add_tombstone(transaction, "transaction_lines", line_id,
+                                               lines[line_id].get("companyId") or header.get("companyId"))
+            if changes:
+                transaction.update(ref, changes)
+            return sets, updates, deletes, {**header, **changes}, changes
+
+        sets, updates, deletes, header, changes = firebase_service.run_transaction(
+            apply, writes_to=("transaction_lines", "transactions"))
+        for line_id, data in sets.items():
+            firebase_service.notify_write("transaction_lines", "set", line_id, data)
+        for line_id, data in updates.items():
+            firebase_service.notify_write("transaction_lines", "update", line_id, data)
+        for line_id in deletes:
+            firebase_service.notify_write("transaction_lines", "delete", line_id)
+        if changes:
+            firebase_service.notify_write("transactions", "update", transaction_id, changes)
+        return sets, updates, deletes, header
+
+    def _settled_header(self, header: dict, removed: list, added: list) -> dict:
+        """New header totals (plain values, read in the same transaction), re-settled if it has payments"""
+        subtotal, tax = self._deltas(header, removed, added)
+        if not subtotal and not tax:
+            return {}
+        now = datetime.now(timezone.utc)
+        changes = {
+            "subtotal": _cents(_cents(header.get("subtotal")) + subtotal),
+            "tax": _cents(_cents(header.get("tax")) + tax),
+            "updatedAt": now,
+        }
+        changes["total"] = ticket_total({**header, **changes})
+        if header.get("paidByMethod"):
+            changes.update(settle({**header, **changes}, header["paidByMethod"], now))
+        elif "balance" in header:
+            changes["balance"] = _cents(changes["total"] - _cents(header.get("paidAmount")))
+        return changes
+
+    def _deltas(self, transaction: dict, removed: list, added: list) -> tuple:
+        """How much replacing ``removed`` lines by ``added`` ones moves (subtotal, tax)"""
+        subtotal = _cents(sum(_cents(line.get("lineTotal")) for line in added)
+                          - sum(_cents(line.get("lineTotal")) for line in removed))
+        tax = _cents(sum(_cents(line.get("tax")) for line in added)
+                     - sum(self._stored_tax(transaction, line) for line in removed))
+        return subtotal, tax
+
+    def _stored_tax(self, transaction: dict, line: dict) -> float:
+        # Lines written before the server priced them have no tax of their own
+        if line.get("tax") is not None:
+            return _cents(line["tax"])
+        return line_tax(line.get("lineTotal"), self.tax_rates.rate(transaction.get("companyId")))
+
+
+def ticket_totals_from_env(firebase_service) -> TicketTotals:
+    tax_rates = TaxRates(
+        firebase_service,
+        default_rate=float(os.getenv("DEFAULT_TAX_RATE", 0)),
+        ttl=float(os.getenv("TAX_RATE_CACHE_SECONDS", 60)),
+    )
+    return TicketTotals(firebase_service, tax_rates)
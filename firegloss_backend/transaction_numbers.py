@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+COUNTER_COLLECTION = "transaction_counters"
+
+
+def business_day(transaction_date: datetime, utc_offset_minutes: Optional[int] = None) -> date:
+    """The shop's local day a sale belongs to.
+
+    With ``utc_offset_minutes`` the date is read at that offset from UTC (naive
+    times are UTC); without it the date is taken as sent, which is the local
+    day for local or offset-qualified times.
+    """
+    if utc_offset_minutes is None:
+        return transaction_date.date()
+    if transaction_date.tzinfo is None:
+        transaction_date = transaction_date.replace(tzinfo=timezone.utc)
+    return (transaction_date.astimezone(timezone.utc) + timedelta(minutes=utc_offset_minutes)).date()
+
+
+class TransactionNumberAllocator:
+    """Allocates per-company, per-day sequential transaction numbers.
+
+    Instead of incrementing one counter document per sale (Firestore sustains
+    roughly one write per second per document), each worker leases a block of
+    numbers from ``transaction_counters/{companyId}_{YYYYMMDD}`` in a single
+    transaction and hands them out locally. The block size doubles while leases
+    come faster than ``min_lease_interval`` so busy shops hit the counter
+    rarely. Numbers are unique and increase within a worker; across workers
+    they interleave by block, and a restart leaves a gap for the unused
+    remainder of its blocks.
+    """
+
+    def __init__(self, firebase_service, block_size: int = 10, max_block_size: int = 500,
+                 min_lease_interval: float = 5.0):
+        self.firebase_service = firebase_service
+        self.initial_block_size = block_size
+        self.max_block_size = max_block_size
+        self.min_lease_interval = min_lease_interval
+        self._leases = {}
+        self._locks = {}
+        # Guards _leases and _locks; each key's lock serializes its own leasing
+        self._locks_guard = threading.Lock()
+
+    @staticmethod
+    def format_number(business_date: date, sequence: int) -> str:
+        return f"TXN-{business_date.strftime('%Y%m%d')}-{sequence:04d}"
+
+    def _lock_for(self, key: str) -> list:
+        """[lock, users] for a key; users counts callers holding or waiting for the lock"""
+        with self._locks_guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+            return entry
+
+    def _release(self, entry: list) -> None:
+        with self._locks_guard:
+            entry[1] -= 1
+
+    def allocate(self, company_id: str, business_date: date) -> str:
+        """Return the next transaction number for a company and business day"""
+        key = f"{company_id}_{business_date.strftime('%Y%m%d')}"
+        entry = self._lock_for(key)
+        try:
+            with entry[0]:
+                with self._locks_guard:
+                    lease = self._leases.get(key)
+                if lease is None or lease["next"] >= lease["end"]:
+                    lease = self._lease_block(key, company_id, business_date, lease)
+                    with self._locks_guard:
+                        self._leases[key] = lease
+                    self._drop_old_leases(company_id, business_date)
+                sequence = lease["next"]
+                lease["next"] += 1
+        finally:
+            self._release(entry)
+        return self.format_number(business_date, sequence)
+
+    def _lease_block(self, key: str, company_id: str, business_date: date, previous) -> dict:
+        block_size = self.initial_block_size
+        if previous is not None:
+            block_size = previous["size"]
+            if time.monotonic() - previous["leased_at"] < self.min_lease_interval:
+                block_size = min(self.max_block_size, block_size * 2)
+
+        def lease(transaction):
+            counter_ref = self.firebase_service.db.collection(COUNTER_COLLECTION).document(key)
+            snapshot = counter_ref.get(transaction=transaction)
+            start = snapshot.get("next") if snapshot.exists else 1
+            transaction.set(counter_ref, {
+                "companyId": company_id,
+                "businessDate": business_date.isoformat(),
+                "next": start + block_size,
+                "updatedAt": datetime.now(timezone.utc),
+            })
+            return start
+
+        # Re-running a lease whose commit reply was lost only skips a block, so retry freely
+        start = self.firebase_service.run_transaction(lease, idempotent=True)
+        return {"next": start, "end": start + block_size, "size": block_size,
+                "leased_at": time.monotonic()}
+
+    def _drop_old_leases(self, company_id: str, business_date: date) -> None:
+        """Forget the company's leases and idle locks for days before business_date"""
+        # Keys are {companyId}_{YYYYMMDD}, so the suffix compares as a date; a lock still in use is kept
+        today = business_date.strftime('%Y%m%d')
+        with self._locks_guard:
+            for key in [k for k in self._leases if k[:-9] == company_id and k[-8:] < today]:
+                del self._leases[key]
+            for key in [k for k, entry in self._locks.items()
+                        if k[:-9] == company_id and k[-8:] < today and not entry[1]]:
+                del self._locks[key]
+
+
+def allocator_from_env(firebase_service) -> TransactionNumberAllocator:
+    return TransactionNumberAllocator(
+        firebase_service,
+        block_size=int(os.getenv("TRANSACTION_NUMBER_BLOCK_SIZE", 10)),
+        max_block_size=int(os.getenv("TRANSACTION_NUMBER_MAX_BLOCK_SIZE", 500)),
+        min_lease_interval=float(os.getenv("TRANSACTION_NUMBER_MIN_LEASE_INTERVAL_SECONDS", 5)),
+    )
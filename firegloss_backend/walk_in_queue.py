@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from request_context import current_company
+
+WAITING_STATUS = "newTransaction"
+ASSIGNED_STATUS = "assigned"
+TICKET_FIELDS = ["companyId", "status", "priority", "requestedTechnicianId", "createdAt", "transactionDate",
+                 "transactionNumber", "customerName", "customerId"]
+
+
+class TicketTaken(Exception):
+    """The ticket left the queue (or changed hands) before it could be assigned"""
+
+
+def _arrival(ticket: dict) -> float:
+    for field in ("createdAt", "transactionDate"):
+        value = ticket.get(field)
+        if isinstance(value, datetime):
+            return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    return time.time()
+
+
+class _CompanyQueue:
+    def __init__(self):
+        self.tickets = {}     # transaction_id -> ticket
+        self.versions = {}    # transaction_id -> version of its live heap entry
+        self.anyone = []      # heap of tickets any technician may take
+        self.requested = {}   # technician_id -> heap of tickets waiting for them
+        self.entries = 0      # heap entries, live and stale
+
+    def _heap(self, ticket: dict) -> list:
+        technician_id = ticket.get("requestedTechnicianId")
+        return self.requested.setdefault(technician_id, []) if technician_id else self.anyone
+
+    def push(self, transaction_id: str, ticket: dict, version: int) -> None:
+        self.tickets[transaction_id] = ticket
+        self.versions[transaction_id] = version
+        heapq.heappush(self._heap(ticket), (-(ticket.get("priority") or 0), _arrival(ticket), transaction_id, version))
+        self.entries += 1
+        if self.entries > 2 * len(self.tickets) + 64:
+            self._compact()
+
+    def discard(self, transaction_id: str) -> Optional[dict]:
+        # The heap entry goes stale and is dropped when it reaches the top
+        self.versions.pop(transaction_id, None)
+        return self.tickets.pop(transaction_id, None)
+
+    def _live(self, entry: tuple) -> bool:
+        return self.versions.get(entry[2]) == entry[3]
+
+    def top(self, heap: list) -> Optional[tuple]:
+        while heap and not self._live(heap[0]):
+            heapq.heappop(heap)
+            self.entries -= 1
+        return heap[0] if heap else None
+
+    def next_for(self, technician_id: str) -> Optional[str]:
+        """The ticket this technician should take next: the best of the open and their requested tickets"""
+        candidates = [entry for entry in (self.top(self.anyone), self.top(self.requested.get(technician_id, [])))
+                      if entry is not None]
+        return min(candidates)[2] if candidates else None
+
+    def _compact(self) -> None:
+        for heap in [self.anyone, *self.requested.values()]:
+            heap[:] = [entry for entry in heap if self._live(entry)]
+            heapq.heapify(heap)
+        self.requested = {technician_id: heap for technician_id, heap in self.requested.items() if heap}
+        self.entries = len(self.tickets)
+
+    def waiting(self) -> list:
+        ordered = sorted(self.tickets.items(),
+                         key=lambda item: (-(item[1].get("priority") or 0), _arrival(item[1]), item[0]))
+        return [{**ticket, "id": transaction_id, "position": position}
+                for position, (transaction_id, ticket) in enumerate(ordered, 1)]
+
+
+class _Subscriber:
+    """Events for one stream, handed from writer threads to the event loop"""
+
+    def __init__(self, max_events: int):
+        self.events = deque()
+        self.max_events = max_events
+        self.overflowed = False
+        self.loop = None
+        self.wake = None
+
+    def bind(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+
+    def push(self, event: dict) -> None:
+        if len(self.events) >= self.max_events:
+            # A slow reader gets a fresh snapshot instead of an unbounded backlog
+            self.events.clear()
+            self.overflowed = True
+        self.events.append(event)
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.wake.set)
+            except RuntimeError:
+                pass  # the stream's loop has closed
+
+
+class WalkInQueue:
+    """Per-company queue of walk-in tickets waiting for a technician.
+
+    Tickets in ``newTransaction`` status wait in a heap ordered by ``priority``
+    (highest first), then arrival; tickets with a ``requestedTechnicianId``
+    wait in that technician's own heap. Taking the next customer compares the
+    tops of the open heap and the technician's heap, so it is O(log n) with
+    no Firestore query. The claim itself is a Firestore transaction that
+    only moves the ticket to ``assigned`` if it is still waiting.
+
+    A company is loaded on first use and kept current from FirebaseService
+    write events, which are also pushed to stream subscribers; it is reloaded
+    every ``refresh_interval`` seconds to pick up writes made by other workers.
+    """
+
+    def __init__(self, firebase_service, refresh_interval: float = 60, max_events: int = 256,
+                 keepalive: float = 15):
+        self.firebase_service = firebase_service
+        self.refresh_interval = refresh_interval
+        self.max_events = max_events
+        self.keepalive = keepalive
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._versions = itertools.count()
+        self._queues = {}         # company_id -> _CompanyQueue
+        self._loaded = {}         # company_id -> monotonic load time
+        self._ticket_company = {}  # transaction_id -> company_id, for waiting tickets
+        self._subscribers = {}    # company_id -> {_Subscriber}
+        self._claim_locks = {}    # company_id -> Lock, so desks on one worker don't race for a ticket
+        self._building = None
+        self._pending = []
+        firebase_service.add_write_listener("transactions", self._on_transaction_write)
+
+    # Queue maintenance (callers hold self._lock)
+
+    def _publish(self, company_id: str, event: dict) -> None:
+        queue = self._queues.get(company_id)
+        event = {**event, "waiting": len(queue.tickets) if queue else 0}
+        for subscriber in self._subscribers.get(company_id, ()):
+            subscriber.push(event)
+
+    def _enqueue(self, company_id: str, transaction_id: str, ticket: dict) -> None:
+        ticket = {field: ticket.get(field) for field in TICKET_FIELDS}
+        ticket["companyId"] = company_id
+        queue = self._queues[company_id]
+        updated = transaction_id in queue.tickets
+        queue.push(transaction_id, ticket, next(self._versions))
+        self._ticket_company[transaction_id] = company_id
+        self._publish(company_id, {"event": "updated" if updated else "queued",
+                                   "ticket": {**ticket, "id": transaction_id}})
+
+    def _dequeue(self, transaction_id: str, changes: Optional[dict] = None) -> None:
+        company_id = self._ticket_company.pop(transaction_id, None)
+        if company_id is None:
+            return
+        self._queues[company_id].discard(transaction_id)
+        changes = changes or {}
+        self._publish(company_id, {"event": "removed", "ticket": {
+            "id": transaction_id, "status": changes.get("status"), "technicianId": changes.get("technicianId")}})
+
+    def _forget_company(self, company_id: str) -> None:
+        queue = self._queues.pop(company_id, None)
+        for transaction_id in (queue.tickets if queue else ()):
+            self._ticket_company.pop(transaction_id, None)
+        self._loaded.pop(company_id, None)
+
+    def _apply(self, event: str, transaction_id: str, data: Optional[dict], company_hint: Optional[str]) -> None:
+        data = data or {}
+        company_id = self._ticket_company.get(transaction_id)
+        if event == "delete":
+            self._dequeue(transaction_id, {"status": "deleted"})
+        elif company_id is not None:
+            queue = self._queues[company_id]
+            ticket = {**queue.tickets[transaction_id], **data} if event in ("update", "merge") else dict(data)
+            if ticket.get("status") != WAITING_STATUS:
+                self._dequeue(transaction_id, data)
+            elif data.keys() & {"priority", "requestedTechnicianId", "createdAt", "customerName"}:
+                self._enqueue(company_id, transaction_id, ticket)
+        elif data.get("status") == WAITING_STATUS:
+            company_id = data.get("companyId") or company_hint
+            if company_id not in self._loaded:
+                return
+            if event in ("update", "merge"):
+                # A ticket sent back to waiting; only its changed fields are known here
+                self._forget_company(company_id)
+                if self._subscribers.get(company_id):
+                    threading.Thread(target=self._background_load, args=(company_id,), daemon=True).start()
+            else:
+                self._enqueue(company_id, transaction_id, data)
+
+    def _on_transaction_write(self, event, document_id, data):
+        # Resolved now: the request that made the write owns this thread
+        company_hint = current_company()
+        with self._lock:
+            if self._building is not None:
+                self._pending.append((event, document_id, data, company_hint))
+            self._apply(event, document_id, data, company_hint)
+
+    # Loading
+
+    def load(self, company_id: str) -> None:
+        """(Re)load a company's waiting tickets from Firestore"""
+        with self._build_lock:
+            with self._lock:
+                self._building = company_id
+                self._pending = []
+            try:
+                tickets = self.firebase_service.query_documents("transactions", [
+                    ("companyId", "==", company_id),
+                    ("status", "==", WAITING_STATUS),
+                ], fields=TICKET_FIELDS)
+            except Exception:
+                with self._lock:
+                    self._building = None
+                    self._pending = []
+                raise
+            with self._lock:
+                self._forget_company(company_id)
+                queue = self._queues[company_id] = _CompanyQueue()
+                for ticket in tickets:
+                    transaction_id = ticket.pop("id")
+                    queue.push(transaction_id, {**ticket, "companyId": company_id}, next(self._versions))
+                    self._ticket_company[transaction_id] = company_id
+                self._loaded[company_id] = time.monotonic()
+                # Writes made while the query ran may be missing from its result; writes
+                # to other companies were applied as they came
+                for event, transaction_id, data, company_hint in self._pending:
+                    if (self._ticket_company.get(transaction_id) == company_id
+                            or (data or {}).get("companyId", company_hint) == company_id):
+                        self._apply(event, transaction_id, data, company_hint)
+                self._building = None
+                self._pending = []
+                self._publish(company_id, {"event": "snapshot", "tickets": queue.waiting()})
+
+    def ensure_loaded(self, company_id: str) -> None:
+        loaded_at = self._loaded.get(company_id)
+        if loaded_at is None:
+            self.load(company_id)
+        elif time.monotonic() - loaded_at > self.refresh_interval:
+            # Only one refresh is started per interval
+            self._loaded[company_id] = time.monotonic()
+            threading.Thread(target=self._background_load, args=(company_id,), daemon=True).start()
+
+    def _background_load(self, company_id: str) -> None:
+        try:
+            self.load(company_id)
+        except Exception as e:
+            print(f"Walk-in queue refresh for company {company_id} failed: {e}")
+
+    # Querying and assignment
+
+    def waiting(self, company_id: str) -> list:
+        """Waiting tickets in the order they will be served (requested technicians aside)"""
+        self.ensure_loaded(company_id)
+        with self._lock:
+            queue = self._queues.get(company_id)
+            return queue.waiting() if queue else []
+
+    def assign_next(self, company_id: str, technician_id: str) -> Optional[dict]:
+        """Claim the next ticket for a technician; returns the assigned ticket, or None if nobody is waiting"""
+        self.ensure_loaded(company_id)
+        with self._lock:
+            claim_lock = self._claim_locks.setdefault(company_id, threading.Lock())
+        with claim_lock:
+            while True:
+                with self._lock:
+                    queue = self._queues.get(company_id)
+                    transaction_id = queue.next_for(technician_id) if queue else None
+                if transaction_id is None:
+                    return None
+                try:
+                    header, changes = self.firebase_service.run_transaction(
+                        self._claim, transaction_id, company_id, technician_id, writes_to=("transactions",))
+                except TicketTaken:
+                    # Claimed by another worker, closed, or sent to someone else; the queue was behind
+                    with self._lock:
+                        self._dequeue(transaction_id, {"status": "taken"})
+                    continue
+                self.firebase_service.notify_write("transactions", "update", transaction_id, changes)
+                return {**header, **changes, "id": transaction_id}
+
+    def _claim(self, transaction, transaction_id: str, company_id: str, technician_id: str) -> tuple:
+        ref = self.firebase_service.db.collection("transactions").document(transaction_id)
+        snapshot = ref.get(transaction=transaction)
+        header = snapshot.to_dict() if snapshot.exists else None
+        if header is None or header.get("companyId") != company_id or header.get("status") != WAITING_STATUS:
+            raise TicketTaken(f"Transaction {transaction_id} is no longer waiting")
+        if header.get("requestedTechnicianId") not in (None, technician_id):
+            raise TicketTaken(f"Transaction {transaction_id} is no longer waiting")
+        now = datetime.now(timezone.utc)
+        changes = {"status": ASSIGNED_STATUS, "technicianId": technician_id, "assignedAt": now, "updatedAt": now}
+        transaction.update(ref, changes)
+        return header, changes
+
+    # Streaming
+
+    def subscribe(self, company_id: str) -> _Subscriber:
+        """Register a stream; its first event is a snapshot of the queue"""
+        self.ensure_loaded(company_id)
+        subscriber = _Subscriber(self.max_events)
+        with self._lock:
+            queue = self._queues.get(company_id)
+            subscriber.push({"event": "snapshot", "tickets": queue.waiting() if queue else [],
+                             "waiting": len(queue.tickets) if queue else 0})
+            self._subscribers.setdefault(company_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, company_id: str, subscriber: _Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(company_id, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(company_id, None)
+
+    async def stream(self, company_id: str, subscriber: _Subscriber):
+        """Server-sent events for a subscriber until the client goes away"""
+        subscriber.bind()
+        try:
+            while True:
+                subscriber.wake.clear()
+                with self._lock:
+                    events = list(subscriber.events)
+                    subscriber.events.clear()
+                    if subscriber.overflowed:
+                        subscriber.overflowed = False
+                        queue = self._queues.get(company_id)
+                        events = [{"event": "snapshot", "tickets": queue.waiting() if queue else [],
+                                   "waiting": len(queue.tickets) if queue else 0}]
+                for event in events:
+                    yield f"event: {event['event']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+                if not events:
+                    try:
+                        await asyncio.wait_for(subscriber.wake.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(company_id, subscriber)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"companies": len(self._loaded), "waiting": len(self._ticket_company),
+                    "subscribers": sum(len(s) for s in self._subscribers.values())}
+
+
+def walk_in_queue_from_env(firebase_service) -> WalkInQueue:
+    return WalkInQueue(
+        firebase_service,
+        refresh_interval=float(os.getenv("WALK_IN_QUEUE_REFRESH_SECONDS", 60)),
+        max_events=int(os.getenv("WALK_IN_QUEUE_MAX_EVENTS", 256)),
+        keepalive=float(os.getenv("WALK_IN_QUEUE_KEEPALIVE_SECONDS", 15)),
+    )
@@ -0,0 +1,359 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud.firestore_v1.transforms import Increment
+
+from resilience import RETRYABLE_ERRORS
+
+# Firestore's per-batch write limit
+MAX_BATCH_WRITES = 500
+
+
+def _encode(value):
+    """JSON form of a Firestore write value; TypeError for anything the log can't hold"""
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, Increment):
+        return {"$increment": value.value}
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError(f"Cannot log {type(value).__name__} values")
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        if len(value) == 1 and "$increment" in value:
+            return Increment(value["$increment"])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def apply_update(document: dict, data: dict) -> dict:
+    """The document with an update applied the way Firestore would (dotted paths, Increment)"""
+    document = dict(document)
+    for field_path, value in data.items():
+        *parents, field = field_path.split(".")
+        target = document
+        for part in parents:
+            child = target.get(part)
+            target[part] = dict(child) if isinstance(child, dict) else {}
+            target = target[part]
+        if isinstance(value, Increment):
+            current = target.get(field)
+            value = (current if isinstance(current, (int, float)) else 0) + value.value
+        target[field] = value
+    return document
+
+
+class ChangeSet:
+    """Writes acknowledged together that must reach Firestore together.
+
+    Each write is (kind, collection, document ID, data) with kind "set",
+    "update" or "delete"; a delete's data is the company for its tombstone.
+    ``key`` is unique and survives replays, so a change set holding
+    Increments can be made exactly-once with a marker document.
+    """
+
+    def __init__(self, key: str, writes: list):
+        self.key = key
+        self.writes = writes
+        self.seq = None  # position in this worker's log
+        self.collections = {collection_name for _, collection_name, _, _ in writes}
+        self.increments = any(kind == "update" and any(isinstance(v, Increment) for v in data.values())
+                              for kind, _, _, data in writes)
+
+    @property
+    def cost(self) -> int:
+        # Upper bound on batch slots: every write may add a tombstone, plus the marker
+        return 2 * len(self.writes) + 1
+
+
+class WriteBuffer:
+    """Group commit of document writes through a local write-ahead log.
+
+    ``append`` logs a change set to the worker's log file, fsyncs it and
+    returns; a flusher thread then commits the pending change sets to
+    Firestore in grouped batches, every ``flush_interval`` seconds or as soon
+    as ``flush_ops`` writes are waiting. While Firestore is unavailable the
+    change sets stay queued (up to ``max_pending``) and are retried with
+    backoff. Reads made by the same worker see queued writes through
+    ``pending_writes``. Only writes to ``collections`` are buffered.
+
+    Each worker claims its own ``wal-<n>.log`` in ``directory`` (a file lock
+    marks it taken). On start-up, change sets left in unclaimed logs by
+    workers that stopped are replayed. A change set holding Increments is
+    committed with a marker document, so a replay of an already committed
+    one fails with AlreadyExists instead of counting twice; plain sets,
+    updates and deletes are simply re-applied. A change set Firestore
+    rejects outright (NotFound, PermissionDenied) was already acknowledged,
+    so it is printed and appended to ``rejected.log`` for an operator.
+    """
+
+    def __init__(self, directory: str, commit: Callable[[list], None], collections=("transactions", "transaction_lines"),
+                 on_flushed: Optional[Callable[[set], None]] = None, flush_interval: float = 0.005,
+                 flush_ops: int = 100, max_pending: int = 10000, max_backoff: float = 5.0,
+                 drain_timeout: float = 5.0):
+        self.directory = directory
+        self.commit = commit
+        self.collections = set(collections)
+        self.on_flushed = on_flushed
+        self.flush_interval = flush_interval
+        self.flush_ops = flush_ops
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.drain_timeout = drain_timeout
+        self._pending = []
+        self._pending_writes = 0
+        self._seq = 0
+        self._urgent = False
+        self._condition = threading.Condition()
+        self._log_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._log = self._claim_log()
+        self._recover()
+        threading.Thread(target=self._flush_loop, daemon=True, name="write-buffer-flush").start()
+
+    # Log files
+
+    def _try_lock(self, path: str):
+        """Open and exclusively lock a log file; None if another worker holds it"""
+        f = open(path, "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        # A worker that adopted and removed the file between our open and lock leaves us an unlinked inode
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+        return None
+
+    def _claim_log(self):
+        slot = 0
+        while True:
+            log = self._try_lock(os.path.join(self.directory, f"wal-{slot}.log"))
+            if log is not None:
+                return log
+            slot += 1
+
+    def _read_log(self, f) -> list:
+        """Change sets in a log that were not yet settled"""
+        f.seek(0)
+        change_sets, settled = {}, 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append was never acknowledged
+                break
+            if "done" in record:
+                settled = max(settled, record["done"])
+            elif "seq" in record:
+                change_sets[record["seq"]] = ChangeSet(record["key"], _decode(record["writes"]))
+        return [change_set for seq, change_set in sorted(change_sets.items()) if seq > settled]
+
+    def _recover(self) -> None:
+        """Re-queue unsettled change sets from this slot's log and from logs of stopped workers"""
+        recovered = self._read_log(self._log)
+        adopted = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if not (name.startswith("wal-") and name.endswith(".log")) or path == self._log.name:
+                continue
+            f = self._try_lock(path)
+            if f is not None:
+                recovered += self._read_log(f)
+                adopted.append((path, f))
+        self._reset_log()
+        for change_set in recovered:
+            self._write_record(change_set, _encode(change_set.writes))
+        self._pending = recovered
+        self._pending_writes = sum(len(change_set.writes) for change_set in recovered)
+        # Only drop the other logs once their change sets are safely in ours
+        for path, f in adopted:
+            os.remove(path)
+            f.close()
+        if recovered:
+            print(f"Write buffer replaying {len(recovered)} change sets from {self.directory}")
+
+    def _reset_log(self) -> None:
+        self._log.seek(0)
+        self._log.truncate()
+        self._sync()
+
+    def _sync(self) -> None:
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _write_record(self, change_set: ChangeSet, encoded_writes: list) -> None:
+        self._seq += 1
+        change_set.seq = self._seq
+        self._log.write(json.dumps({"seq": self._seq, "key": change_set.key, "writes": encoded_writes}) + "\n")
+        self._sync()
+
+    # Writers
+
+    def append(self, writes: list) -> bool:
+        """Durably queue writes that must commit together; False if they have to go directly to Firestore"""
+        if any(collection_name not in self.collections for _, collection_name, _, _ in writes):
+            return False
+        if ChangeSet(None, writes).cost > MAX_BATCH_WRITES:
+            # Too big to be sure it fits one batch with its tombstones and marker
+            return False
+        try:
+            encoded_writes = _encode(writes)
+        except TypeError:
+            return False
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                return False
+        change_set = ChangeSet(uuid.uuid4().hex, writes)
+        # Log order is queue order; readers and the flusher only wait on the queue, not on fsync
+        with self._log_lock:
+            self._write_record(change_set, encoded_writes)
+            with self._condition:
+                self._pending.append(change_set)
+                self._pending_writes += len(writes)
+                if self._pending_writes >= self.flush_ops:
+                    self._urgent = True
+                self._condition.notify_all()
+        return True
+
+    def pending_writes(self, collection_name: str) -> list:
+        """(kind, document ID, data) of queued writes to a collection, oldest first"""
+        with self._condition:
+            return [(kind, document_id, data)
+                    for change_set in self._pending if collection_name in change_set.collections
+                    for kind, name, document_id, data in change_set.writes if name == collection_name]
+
+    def drain(self, collections=None) -> None:
+        """Wait until nothing queued touches ``collections`` (all when None), so a direct write can't overtake it"""
+        def clear():
+            return not any(collections is None or change_set.collections & set(collections)
+                           for change_set in self._pending)
+
+        with self._condition:
+            if clear():
+                return
+            self._urgent = True
+            self._condition.notify_all()
+            if not self._condition.wait_for(clear, timeout=self.drain_timeout):
+                raise gcp_exceptions.ServiceUnavailable("Buffered writes have not reached Firestore yet")
+
+    # Flusher
+
+    def _next_group(self) -> list:
+        """The oldest pending change sets that fit in one batch"""
+        group, cost = [], 0
+        for change_set in self._pending:
+            if group and cost + change_set.cost > MAX_BATCH_WRITES:
+                break
+            group.append(change_set)
+            cost += change_set.cost
+        return group
+
+    def _flush_loop(self) -> None:
+        backoff = self.flush_interval
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                if not self._urgent:
+                    # Let concurrent writers join the group
+                    self._condition.wait_for(lambda: self._urgent, timeout=self.flush_interval)
+                self._urgent = False
+                group = self._next_group()
+            try:
+                committed = self._commit_group(group)
+            except Exception as e:
+                print(f"Write buffer flush failed, {len(self._pending)} change sets queued: {e}")
+                committed = 0
+            if committed:
+                self._settle(group[:committed])
+                backoff = self.flush_interval
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _commit_group(self, group: list) -> int:
+        """Commit a group, returning how many change sets (from the front) are settled"""
+        try:
+            self.commit(group)
+            return len(group)
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            if len(group) == 1:
+                return self._commit_alone(group[0], e)
+        # One change set spoiled the batch (or one was already committed); find it
+        for i, change_set in enumerate(group):
+            try:
+                self.commit([change_set])
+            except RETRYABLE_ERRORS:
+                if i:
+                    return i
+                raise
+            except Exception as e:
+                self._commit_alone(change_set, e)
+        return len(group)
+
+    def _commit_alone(self, change_set: ChangeSet, error: Exception) -> int:
+        if isinstance(error, gcp_exceptions.AlreadyExists):
+            # Its marker exists: committed before a crash or a lost reply
+            return 1
+        print(f"Firestore rejected buffered change set {change_set.key}: {error}")
+        with open(os.path.join(self.directory, "rejected.log"), "a") as f:
+            f.write(json.dumps({"key": change_set.key, "error": str(error),
+                                "writes": _encode(change_set.writes)}) + "\n")
+        return 1
+
+    def _settle(self, change_sets: list) -> None:
+        with self._condition:
+            del self._pending[:len(change_sets)]
+            self._pending_writes -= sum(len(change_set.writes) for change_set in change_sets)
+            self._condition.notify_all()
+        with self._log_lock:
+            with self._condition:
+                idle = not self._pending
+            if idle:
+                self._reset_log()
+            else:
+                self._log.write(json.dumps({"done": change_sets[-1].seq}) + "\n")
+                self._sync()
+        if self.on_flushed:
+            self.on_flushed(set().union(*(change_set.collections for change_set in change_sets)))
+
+
+def write_buffer_from_env(commit, on_flushed=None) -> Optional[WriteBuffer]:
+    if os.getenv("WRITE_BUFFER_ENABLED", "False").lower() != "true":
+        return None
+    default_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "write_buffer")
+    return WriteBuffer(
+        os.getenv("WRITE_BUFFER_DIR") or default_directory,
+        commit,
+        collections=[c.strip() for c in os.getenv("WRITE_BUFFER_COLLECTIONS", "transactions,transaction_lines").split(",")
+                     if c.strip()],
+        on_flushed=on_flushed,
+        flush_interval=float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL_MS", 5)) / 1000,
+        flush_ops=int(os.getenv("WRITE_BUFFER_FLUSH_OPS", 100)),
+        max_pending=int(os.getenv("WRITE_BUFFER_MAX_PENDING", 10000)),
+        drain_timeout=float(os.getenv("WRITE_BUFFER_DRAIN_TIMEOUT_SECONDS", 5)),
+    )
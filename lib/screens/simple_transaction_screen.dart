@@ -130,12 +130,7 @@ class _SimpleTransactionScreenState extends State<SimpleTransactionScreen> {
         _isCreatingTransaction = true;
       });
 
-      final companies = await ManagementService.getCompanies();
-      if (companies.isEmpty) {
-        throw Exception('No companies found');
-      }
-
-      final companyId = companies.first.id;
+      final companyId = await ManagementService.getShopCompanyId();
       final employeeId = _selectedTechnician?.id ?? 'temp_employee';
 
       final transactionNumber = ManagementService.generateTransactionNumber();
@@ -222,7 +217,7 @@ class _SimpleTransactionScreenState extends State<SimpleTransactionScreen> {
         try {
           final loadedPayments =
               await ManagementService.getPaymentsForTransaction(
-                  _currentTransaction!.id);
+                  _currentTransaction!.id, _currentTransaction!.companyId);
           if (loadedPayments.isNotEmpty) {
             payments = loadedPayments;
             paidAmount =
@@ -19,6 +19,37 @@ class ManagementService {
   // Track deleted transactions to prevent them from appearing in merged results
   static final Set<String> _deletedTransactionIds = {};
 
+  // The signed-in shop's company. The backend only serves employees, catalog
+  // and transactions for a named company (X-Company-Id), so lists are loaded
+  // for this company alone.
+  static String? _shopCompanyId;
+
+  // The shop is the first company set up, as on the setup screen
+  static Future<String> getShopCompanyId() async {
+    if (_shopCompanyId != null) return _shopCompanyId!;
+    final companies = await getCompanies();
+    if (companies.isEmpty) {
+      throw Exception('No company set up for this shop');
+    }
+    return _shopCompanyId = companies.first.id;
+  }
+
+  static Future<List<dynamic>> _getForShopCompany(
+      String path, String key) async {
+    final response = await http.get(
+      Uri.parse('$baseUrl$path'),
+      headers: {'X-Company-Id': await getShopCompanyId()},
+    );
+    if (response.statusCode != 200) {
+      throw Exception('Failed to load $path: Status ${response.statusCode}');
+    }
+    final data = json.decode(response.body);
+    if (!data['success']) {
+      throw Exception('Failed to load $path');
+    }
+    return data['data'][key];
+  }
+
   // Company Services
   static Future<List<Company>> getCompanies() async {
     try {
@@ -72,8 +103,11 @@ class ManagementService {
 
   static Future<bool> deleteCompany(String companyId) async {
     try {
-      final response =
-          await http.delete(Uri.parse('$baseUrl/companies/$companyId'));
+      final response = await http.delete(
+        Uri.parse('$baseUrl/companies/$companyId'),
+        headers: {'X-Company-Id': companyId},
+      );
+      if (companyId == _shopCompanyId) _shopCompanyId = null;
       final data = json.decode(response.body);
       return data['success'] ?? false;
     } catch (e) {
@@ -84,17 +118,8 @@ class ManagementService {
   // Employee Services
   static Future<List<Employee>> getEmployees() async {
     try {
-      final response = await http.get(Uri.parse('$baseUrl/employees'));
-      if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        if (data['success']) {
-          final List<dynamic> employees = data['data']['employees'];
-          return employees
-              .map((employee) => Employee.fromJson(employee))
-              .toList();
-        }
-      }
-      throw Exception('Failed to load employees');
+      final employees = await _getForShopCompany('/employees', 'employees');
+      return employees.map((employee) => Employee.fromJson(employee)).toList();
     } catch (e) {
       return [];
     }
@@ -165,17 +190,10 @@ class ManagementService {
   // Category Services
   static Future<List<ItemCategory>> getCategories() async {
     try {
-      final response = await http.get(Uri.parse('$baseUrl/categories'));
-      if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        if (data['success']) {
-          final List<dynamic> categories = data['data']['categories'];
-          return categories
-              .map((category) => ItemCategory.fromJson(category))
-              .toList();
-        }
-      }
-      throw Exception('Failed to load categories');
+      final categories = await _getForShopCompany('/categories', 'categories');
+      return categories
+          .map((category) => ItemCategory.fromJson(category))
+          .toList();
     } catch (e) {
       return [];
     }
@@ -223,15 +241,8 @@ class ManagementService {
   // Item Services
   static Future<List<Item>> getItems() async {
     try {
-      final response = await http.get(Uri.parse('$baseUrl/items'));
-      if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        if (data['success']) {
-          final List<dynamic> items = data['data']['items'];
-          return items.map((item) => Item.fromJson(item)).toList();
-        }
-      }
-      throw Exception('Failed to load items');
+      final items = await _getForShopCompany('/items', 'items');
+      return items.map((item) => Item.fromJson(item)).toList();
     } catch (e) {
       return [];
     }
@@ -278,26 +289,11 @@ class ManagementService {
   // Transaction Services
   static Future<List<TransactionHeader>> getTransactions() async {
     try {
-      final response = await http.get(Uri.parse('$baseUrl/transactions'));
-      if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        if (data['success']) {
-          final List<dynamic> transactions = data['data']['transactions'];
-          final transactionList = transactions
-              .map((transaction) => TransactionHeader.fromJson(transaction))
-              .toList();
-          return transactionList;
-        }
-      }
-
-      // Handle 404 specifically (endpoint not implemented)
-      if (response.statusCode == 404) {
-        final mergedTransactions = _getMergedTransactions();
-        return mergedTransactions;
-      }
-
-      throw Exception(
-          'Failed to load transactions: Status ${response.statusCode}');
+      final transactions =
+          await _getForShopCompany('/transactions', 'transactions');
+      return transactions
+          .map((transaction) => TransactionHeader.fromJson(transaction))
+          .toList();
     } catch (e) {
       final mergedTransactions = _getMergedTransactions();
       return mergedTransactions;
@@ -578,14 +574,18 @@ class ManagementService {
   static Future<bool> setTransactionLines(
       String transactionId, List<TransactionLine> lines) async {
     try {
-      // For now, store all lines in cache to replace existing ones
+      // The backend diffs against the stored lines and writes only the changes
+      final response = await http.put(
+        Uri.parse('$baseUrl/transactions/$transactionId/lines'),
+        headers: {'Content-Type': 'application/json'},
+        body: json.encode(lines.map((line) => line.toJson()).toList()),
+      );
+      final data = json.decode(response.body);
+      return data['success'] ?? false;
+    } catch (e) {
+      // Store all lines in cache for UI testing
       _transactionLinesCache[transactionId] = List<TransactionLine>.from(lines);
-
-      // In a real implementation, this would sync with the backend
-      // by sending the complete list of lines to replace the existing ones
       return true;
-    } catch (e) {
-      return false;
     }
   }
 
@@ -845,15 +845,17 @@ class ManagementService {
   }
 
   static Future<List<Payment>> getPaymentsForTransaction(
-      String transactionId) async {
+      String transactionId, String companyId) async {
     try {
       final response = await http.get(
         Uri.parse('$baseUrl/transactions/$transactionId/payments'),
+        headers: {'X-Company-Id': companyId},
       );
 
       if (response.statusCode == 200) {
-        final data = json.decode(response.body) as List;
-        return data.map((json) => Payment.fromJson(json)).toList();
+        final data = json.decode(response.body);
+        final List<dynamic> payments = data['data']['payments'];
+        return payments.map((json) => Payment.fromJson(json)).toList();
       }
 
       // Handle 404 specifically (endpoint not implemented)